@@ -1,11 +1,14 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session
+from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, session
 import plotly.graph_objs as go
 import plotly.utils
 import json
+import math
 import os
-from log_parser import parse_logs, get_event_counts, get_page_views, get_time_series_data, get_user_agents, get_scroll_depth_distribution, get_marble_clicks, get_route_travels
-import glob
-from datetime import datetime
+from event_sink import record_client_event
+from analytics_store import connect_analytics_db, rollup_freshness, has_data, rollup_worker, get_event_counts, get_page_views, get_time_series_data, get_user_agents, get_scroll_depth_distribution, get_marble_clicks, get_route_travels
+from log_cursor import read_logs_before
+from sampling_profiler import start_profile, is_profile_running, load_profile, list_profiles, top_functions, compare_profiles, flamegraph_trace, collapsed_text
+from memory_report import memory_report, take_baseline, diff_from_baseline, stop_tracing
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'fallback_secret_key')  # Set a secret key for sessions
@@ -32,27 +35,37 @@ def admin_dashboard():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
 
-    print("Parsing logs...")
-    df = parse_logs()
-    
-    if df.empty:
-        return "No data found in log files. Please check the log file format and contents."
+    # The rollup worker folds new events every ANALYTICS_REFRESH_INTERVAL seconds; the dashboard only reads the
+    # rollups, so a page load never waits on the write lock or a backlog of events
+    rollup_worker.ensure_started()
+
+    conn = connect_analytics_db()
+    try:
+        freshness = rollup_freshness(conn)
+        if not has_data(conn):
+            if freshness['pending_events']:
+                return f"{freshness['pending_events']} events are waiting for the next rollup. Reload in a few seconds."
+            return "No analytics data found yet. Events appear here once the tracking pixel has recorded some traffic."
+
+        event_counts = get_event_counts(conn)
+        page_views = get_page_views(conn)
+        time_series_data = get_time_series_data(conn)
+        user_agents = get_user_agents(conn)
+        scroll_depth = get_scroll_depth_distribution(conn)
+        marble_clicks = get_marble_clicks(conn)
+        route_travels = get_route_travels(conn)
+    finally:
+        conn.close()
 
-    print("Generating graphs...")
-    
     # Event Counts
-    event_counts = get_event_counts(df)
     event_pie = go.Pie(labels=list(event_counts.keys()), values=list(event_counts.values()))
     event_pie_json = json.dumps(event_pie, cls=plotly.utils.PlotlyJSONEncoder)
     
-    
     # Page Views
-    page_views = get_page_views(df)
     page_bar = go.Bar(x=list(page_views.keys()), y=list(page_views.values()))
     page_bar_json = json.dumps(page_bar, cls=plotly.utils.PlotlyJSONEncoder)
     
     # Time Series Data
-    time_series_data = get_time_series_data(df)
     if time_series_data:
         time_series = go.Scatter(
             x=[d.get('timestamp') for d in time_series_data],
@@ -65,12 +78,10 @@ def admin_dashboard():
         time_series_json = json.dumps({})
     
     # User Agents
-    user_agents = get_user_agents(df)
     user_agents_bar = go.Bar(x=list(user_agents.keys()), y=list(user_agents.values()))
     user_agents_bar_json = json.dumps(user_agents_bar, cls=plotly.utils.PlotlyJSONEncoder)
     
     # Scroll Depth Distribution
-    scroll_depth = get_scroll_depth_distribution(df)
     if scroll_depth:
         scroll_depth_box = go.Box(y=list(scroll_depth.values()))
         scroll_depth_box_json = json.dumps(scroll_depth_box, cls=plotly.utils.PlotlyJSONEncoder)
@@ -78,11 +89,9 @@ def admin_dashboard():
         scroll_depth_box_json = json.dumps({})
     
     # Marble Clicks
-    marble_clicks = get_marble_clicks(df)
     marble_clicks_json = json.dumps(marble_clicks, cls=plotly.utils.PlotlyJSONEncoder)
 
     # Route Travels
-    route_travels = get_route_travels(df)
     route_travels_json = json.dumps(route_travels, cls=plotly.utils.PlotlyJSONEncoder)
 
     print("Rendering template...")
@@ -94,7 +103,9 @@ def admin_dashboard():
                            scroll_depth_box=scroll_depth_box_json,
                            scroll_depth_stats=json.dumps(scroll_depth),
                            marble_clicks=marble_clicks_json,
-                           route_travels=route_travels_json)
+                           route_travels=route_travels_json,
+                           rollups_refreshed_at=freshness['refreshed_at'],
+                           rollups_pending=freshness['pending_events'])
 
 @app.route('/raw_logs')
 def raw_logs():
@@ -103,40 +114,113 @@ def raw_logs():
         app.logger.debug("User not logged in")
         return jsonify({'error': 'Unauthorized'}), 401
 
-    app.logger.debug("User is logged in, processing log files")
-    log_files = glob.glob('marble_gallery.log*')
-    app.logger.debug(f"Found {len(log_files)} log files")
-    logs = []
-
-    for log_file in sorted(log_files, reverse=True):
-        app.logger.debug(f"Processing log file: {log_file}")
-        with open(log_file, 'r') as f:
-            for line in f:
-                parts = line.split(',', 1)
-                if len(parts) == 2:
-                    timestamp_str, log_data = parts
-                    try:
-                        timestamp = datetime.strptime(timestamp_str.strip(), '%Y-%m-%d %H:%M:%S')
-                        log_dict = {'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'), 'data': log_data.strip()}
-                        logs.append(log_dict)
-                    except ValueError:
-                        app.logger.error(f"Error parsing timestamp: {timestamp_str}")
-                        continue
-
-    app.logger.debug(f"Returning {len(logs)} log entries")
-    return jsonify(logs[:1000])  # Return the latest 1000 log entries
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 5000)
+    try:
+        # Newest events first; ?before= pages back, ?after= picks up what arrived since the last refresh
+        result = read_logs_before(
+            cursor=request.args.get('before'),
+            limit=limit,
+            event=request.args.get('event'),
+            marble_id=request.args.get('marble_id'),
+            after=request.args.get('after'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    app.logger.debug(f"Returning {len(result['logs'])} log entries")
+    return jsonify(result)
 
 @app.route('/log_event', methods=['POST'])
 def log_event():
-    data = request.json
-    event_type = data.get('event_type')
-    event_data = data.get('data')
-
-    # Log the event
-    app.logger.info(f"Event: {event_type}, Data: {event_data}")
+    # Queued for the background writer, like the main app's /log_event
+    try:
+        record_client_event(request.get_json(silent=True), request.remote_addr,
+                            request.headers.get('User-Agent'), request.referrer)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     return jsonify({'status': 'success'})
 
+@app.route('/profile')
+def profile():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    if 'seconds' in request.args:
+        seconds = request.args.get('seconds', type=float)
+        if seconds is None or not math.isfinite(seconds) or seconds <= 0:
+            return jsonify({'error': 'seconds must be a positive number'}), 400
+        # Samples every thread of the worker that serves this request, in the background
+        profile_id, started = start_profile(seconds)
+        app.logger.info(f"Profile {profile_id} {'started' if started else 'already running'} for {seconds}s")
+        return redirect(url_for('profile_detail', profile_id=profile_id))
+
+    return render_template('profile.html', profiles=list_profiles())
+
+@app.route('/profile/<profile_id>')
+def profile_detail(profile_id):
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    stored = load_profile(profile_id)
+    if stored is None:
+        if is_profile_running(profile_id):
+            return render_template('profile.html', running=True, profile_id=profile_id, profiles=list_profiles())
+        return jsonify({'error': 'Profile not found'}), 404
+
+    return render_template('profile.html',
+                           profile=stored,
+                           top=top_functions(stored),
+                           flamegraph=json.dumps(flamegraph_trace(stored)),
+                           profiles=list_profiles())
+
+@app.route('/profile/<profile_id>/collapsed')
+def profile_collapsed(profile_id):
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    stored = load_profile(profile_id)
+    if stored is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(collapsed_text(stored), mimetype='text/plain')
+
+@app.route('/profile/compare')
+def profile_compare():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    before = load_profile(request.args.get('a'))
+    after = load_profile(request.args.get('b'))
+    if before is None or after is None:
+        return jsonify({'error': 'Choose two stored profiles to compare'}), 400
+    return render_template('profile.html',
+                           comparison=compare_profiles(before, after),
+                           before_id=before['id'],
+                           after_id=after['id'],
+                           profiles=list_profiles())
+
+@app.route('/memory')
+def memory():
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    # Everything here describes the worker that happens to serve the request; the pid says which
+    limit = min(max(request.args.get('limit', 25, type=int), 1), 200)
+    mode = request.args.get('mode')
+    if mode == 'baseline':
+        take_baseline()
+        return jsonify({'status': 'baseline taken', 'pid': os.getpid()})
+    if mode == 'diff':
+        diff = diff_from_baseline(limit)
+        if diff is None:
+            return jsonify({'error': 'No baseline in this worker; request ?mode=baseline first', 'pid': os.getpid()}), 400
+        return jsonify({'pid': os.getpid(), 'diff': diff})
+    if mode == 'stop':
+        stop_tracing()
+        return jsonify({'status': 'tracing stopped', 'pid': os.getpid()})
+
+    return jsonify(memory_report(limit))
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     # Log the error and stacktrace
@@ -0,0 +1,260 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+import numpy as np
+from event_sink import EVENTS_DB_PATH, connect_events_db
+
+# Counters are kept per hour and per day; the dashboard reads the day grain
+GRAINS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+}
+REFRESH_BATCH_SIZE = 20000
+REFRESH_INTERVAL = int(os.environ.get('ANALYTICS_REFRESH_INTERVAL', 30))
+
+logger = logging.getLogger(__name__)
+
+
+def connect_analytics_db(db_path=EVENTS_DB_PATH):
+    conn = connect_events_db(db_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_counts (
+            grain TEXT NOT NULL,
+            period TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (grain, period, dimension, key)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rollup_dimension ON rollup_counts(grain, dimension, period)")
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, value INTEGER)")
+    return conn
+
+
+def event_dimensions(event, page, marble_name, user_agent, scroll_depth):
+    yield 'event', event
+    if event == 'pageview':
+        yield 'page_view', page
+    elif event == 'marble_click':
+        yield 'marble_click', marble_name
+    elif event == 'route_travel':
+        yield 'route_travel', page
+    yield 'user_agent', user_agent
+    try:
+        depth = float(scroll_depth)
+    except (TypeError, ValueError):
+        return
+    # scroll_depth comes straight from the pixel's query string, so inf, nan and 1e400 all arrive here
+    if np.isfinite(depth):
+        # Whole-percent buckets keep the histogram small and the quartiles accurate enough
+        yield 'scroll_depth', str(int(round(min(max(depth, 0.0), 100.0))))
+
+
+def refresh(conn, batch_size=REFRESH_BATCH_SIZE):
+    total = 0
+    while True:
+        # IMMEDIATE takes the write lock up front so two workers can't fold the same events twice
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM rollup_state WHERE name = 'events_offset'").fetchone()
+            offset = row[0] if row else 0
+            events = conn.execute("""
+                SELECT id, ts, event, page, marble_name, user_agent, scroll_depth
+                FROM events WHERE id > ? ORDER BY id LIMIT ?
+            """, (offset, batch_size)).fetchall()
+            if not events:
+                mark_refreshed(conn)
+                conn.execute("COMMIT")
+                return total
+
+            counts = Counter()
+            for event_id, ts, event, page, marble_name, user_agent, scroll_depth in events:
+                local = time.localtime(ts)
+                periods = [(grain, time.strftime(fmt, local)) for grain, fmt in GRAINS.items()]
+                for dimension, key in event_dimensions(event, page, marble_name, user_agent, scroll_depth):
+                    if key is None or key == '':
+                        continue
+                    for grain, period in periods:
+                        counts[(grain, period, dimension, str(key))] += 1
+
+            conn.executemany("""
+                INSERT INTO rollup_counts (grain, period, dimension, key, count) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (grain, period, dimension, key) DO UPDATE SET count = count + excluded.count
+            """, [(*key, count) for key, count in counts.items()])
+            conn.execute("INSERT OR REPLACE INTO rollup_state (name, value) VALUES ('events_offset', ?)", (events[-1][0],))
+            mark_refreshed(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        total += len(events)
+        if len(events) < batch_size:
+            return total
+
+
+def mark_refreshed(conn):
+    conn.execute("INSERT OR REPLACE INTO rollup_state (name, value) VALUES ('refreshed_at', ?)", (int(time.time()),))
+
+
+def rollup_freshness(conn):
+    # When the rollups were last folded, and how many recorded events they don't include yet
+    state = dict(conn.execute("SELECT name, value FROM rollup_state WHERE name IN ('events_offset', 'refreshed_at')"))
+    latest = conn.execute("SELECT MAX(id) FROM events").fetchone()[0] or 0
+    return {
+        'refreshed_at': state.get('refreshed_at'),
+        'pending_events': max(latest - state.get('events_offset', 0), 0),
+    }
+
+
+def query_counts(conn, dimension, grain='day', since=None):
+    sql = "SELECT key, SUM(count) AS total FROM rollup_counts WHERE grain = ? AND dimension = ?"
+    params = [grain, dimension]
+    if since is not None:
+        sql += " AND period >= ?"
+        params.append(since)
+    sql += " GROUP BY key ORDER BY total DESC"
+    return {key: total for key, total in conn.execute(sql, params)}
+
+
+def has_data(conn):
+    return conn.execute("SELECT 1 FROM rollup_counts LIMIT 1").fetchone() is not None
+
+
+def get_event_counts(conn):
+    return query_counts(conn, 'event')
+
+
+def get_page_views(conn):
+    return query_counts(conn, 'page_view')
+
+
+def get_marble_clicks(conn):
+    marble_clicks = query_counts(conn, 'marble_click')
+    return {'x': list(marble_clicks.keys()), 'y': list(marble_clicks.values()), 'type': 'bar'}
+
+
+def get_route_travels(conn):
+    route_travels = query_counts(conn, 'route_travel')
+    return {'x': list(route_travels.keys()), 'y': list(route_travels.values()), 'type': 'bar'}
+
+
+def get_user_agents(conn, limit=5):
+    return dict(list(query_counts(conn, 'user_agent').items())[:limit])
+
+
+def get_time_series_data(conn, grain='day'):
+    series = defaultdict(dict)
+    rows = conn.execute("""
+        SELECT period, key, count FROM rollup_counts
+        WHERE grain = ? AND dimension = 'event' ORDER BY period
+    """, (grain,))
+    for period, event, count in rows:
+        series[period][event] = count
+    events = sorted({event for counts in series.values() for event in counts})
+    return [{'timestamp': period, **{event: counts.get(event, 0) for event in events}}
+            for period, counts in series.items()]
+
+
+def get_scroll_depth_distribution(conn):
+    histogram = query_counts(conn, 'scroll_depth')
+    if not histogram:
+        return {}
+    values = np.array([float(key) for key in histogram], dtype=np.float64)
+    weights = np.array(list(histogram.values()), dtype=np.float64)
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    count = weights.sum()
+    mean = np.average(values, weights=weights)
+    # Sample standard deviation, matching pandas' describe()
+    std = np.sqrt(np.sum(weights * (values - mean) ** 2) / (count - 1)) if count > 1 else float('nan')
+    cumulative = np.cumsum(weights)
+
+    def quantile(q):
+        return float(values[np.searchsorted(cumulative, q * count)])
+
+    return {
+        'count': float(count),
+        'mean': float(mean),
+        'std': float(std),
+        'min': float(values[0]),
+        '25%': quantile(0.25),
+        '50%': quantile(0.5),
+        '75%': quantile(0.75),
+        'max': float(values[-1]),
+    }
+
+
+def backfill_legacy_logs(conn):
+    # One-off import of the text log history written before events went to SQLite
+    from log_parser import parse_logs, EVENT_FIELD_NAMES
+    row = conn.execute("SELECT value FROM rollup_state WHERE name = 'legacy_logs_imported'").fetchone()
+    if row:
+        print("Legacy logs were already imported")
+        return 0
+    df = parse_logs()
+    if df.empty or 'Event' not in df.columns:
+        print("No legacy log events found")
+        return 0
+    df = df[df['Event'].notna()]
+    columns = [column for column, name in EVENT_FIELD_NAMES.items() if name in df.columns]
+    rows = zip(
+        # The log's timestamps are local wall-clock times, which is how refresh() buckets them again; a naive
+        # datetime's timestamp() reads them as local, where pandas' Timestamp.timestamp() would assume UTC
+        (timestamp.to_pydatetime().timestamp() for timestamp in df['timestamp']),
+        *(df[EVENT_FIELD_NAMES[column]].astype(object).where(df[EVENT_FIELD_NAMES[column]].notna(), None) for column in columns),
+    )
+    with conn:
+        conn.executemany(
+            f"INSERT INTO events (ts, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+            rows)
+        conn.execute("INSERT OR REPLACE INTO rollup_state (name, value) VALUES ('legacy_logs_imported', ?)", (int(time.time()),))
+    print(f"Imported {len(df)} legacy log events")
+    return len(df)
+
+
+class RollupWorker:
+    def __init__(self, db_path=EVENTS_DB_PATH, interval=REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='analytics-rollup', daemon=True).start()
+
+    def _run(self):
+        conn = connect_analytics_db(self.db_path)
+        while True:
+            try:
+                refresh(conn)
+            except Exception:
+                # Keep the thread alive; the failed batch was rolled back and is retried next interval
+                logger.exception("Analytics rollup refresh failed")
+            time.sleep(self.interval)
+
+
+rollup_worker = RollupWorker()
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'refresh'
+    conn = connect_analytics_db()
+    if command == 'backfill-logs':
+        backfill_legacy_logs(conn)
+        print(f"Folded {refresh(conn)} events into rollups")
+    elif command == 'refresh':
+        print(f"Folded {refresh(conn)} events into rollups")
+    else:
+        print("Usage: python analytics_store.py [refresh|backfill-logs]")
+    conn.close()
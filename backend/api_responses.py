@@ -0,0 +1,84 @@
+import gzip
+import os
+import orjson
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Payloads smaller than this fit in a packet or two, where compressing costs more than it saves
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = 6
+# Brotli 4 compresses about as fast as gzip 6 and produces smaller output; 11 is for precompressed files only
+BROTLI_QUALITY = 4
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps_bytes(obj):
+    return orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Same interface as Flask's provider, so jsonify and request.get_json keep working unchanged.
+    # Numpy scalars and arrays serialize natively; anything else orjson can't handle (Decimal,
+    # dataclasses with odd fields, ...) falls back to Flask's default() hook.
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Hand orjson's bytes straight to the response instead of going through str
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def choose_encoding(accept_encodings=None):
+    if accept_encodings is None:
+        accept_encodings = request.accept_encodings
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response, min_bytes=COMPRESS_MIN_BYTES):
+    # File responses (images, the static build) are streamed or already precompressed, so leave them alone
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.content_length or 0) < min_bytes:
+        return response
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    response.set_data(compress_body(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The bytes changed, so any validator set earlier only identifies the same content, not the same bytes
+    if response.headers.get('ETag'):
+        etag, _ = response.get_etag()
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app, min_bytes=COMPRESS_MIN_BYTES):
+    app.json = OrjsonProvider(app)
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, min_bytes)
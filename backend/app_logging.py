@@ -0,0 +1,109 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler, WatchedFileHandler
+from flask import has_request_context, request
+
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # 'text' or 'json'
+# 'external' (logrotate), or 'size' / 'time' for a single process. Every gunicorn worker writes the same file, and
+# with the built-in rotation each worker would roll it over on its own, losing or interleaving lines.
+LOG_ROTATION = os.environ.get('LOG_ROTATION', 'external')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# Keep one in every N INFO-or-lower records for chatty endpoints; warnings and errors are never sampled
+ROUTE_SAMPLE_EVERY = {
+    'serve': 100,
+    'not_found': 10,
+    'get_images': 10,
+}
+
+
+class RequestSamplingFilter(logging.Filter):
+    def __init__(self, sample_every=None):
+        super().__init__()
+        self.sample_every = ROUTE_SAMPLE_EVERY if sample_every is None else sample_every
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        # Runs on the request thread, so this is the last chance to read the request context
+        if not has_request_context():
+            return True
+        route = request.endpoint
+        record.route = route
+        record.method = request.method
+        record.path = request.path
+
+        every = self.sample_every.get(route)
+        if not every or every <= 1 or record.levelno > logging.INFO:
+            return True
+        with self._lock:
+            counter = self._counters.setdefault(route, itertools.count())
+            keep = next(counter) % every == 0
+        record.sampled = every
+        return keep
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'pid': record.process,
+        }
+        for key in ('route', 'method', 'path', 'sampled'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def create_file_handler(log_path):
+    if LOG_ROTATION == 'time':
+        handler = TimedRotatingFileHandler(log_path, when='midnight', backupCount=LOG_BACKUP_COUNT, delay=True)
+    elif LOG_ROTATION == 'size':
+        handler = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True)
+    else:
+        # Appends from all workers; reopens the file after logrotate renames it
+        handler = WatchedFileHandler(log_path, delay=True)
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handler.setLevel(logging.INFO)
+    return handler
+
+
+def stop_listener(listener):
+    # Flushes whatever is still queued; safe to call on a listener that was already stopped
+    try:
+        listener.stop()
+    except AttributeError:
+        pass
+
+
+def configure_logging(app, log_path='marble_gallery.log'):
+    # The request thread only enqueues records; the listener thread does the formatting and file I/O
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestSamplingFilter())
+    listener = QueueListener(log_queue, create_file_handler(log_path), respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)
+
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(logging.INFO)
+    return listener
@@ -0,0 +1,278 @@
+import asyncio
+import functools
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.background import BackgroundTask
+from starlette.exceptions import HTTPException
+from starlette.responses import RedirectResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_accept_header, parse_etags
+
+import image_store
+import metrics
+import server_production as sp
+from api_responses import COMPRESS_MIN_BYTES, choose_encoding, compress_body, dumps_bytes
+from event_sink import record_client_event
+from feature_extraction import MAX_UPLOAD_BYTES, UploadRejected
+from wsgi import app as wsgi_app
+
+# Run with: uvicorn asgi:app --workers 4 --loop uvloop --http httptools
+# SQLite and FAISS calls run in a bounded thread pool; ResNet featurization gets its own smaller pool so a
+# burst of uploads can't starve page loads. torch releases the GIL in the forward pass, so threads are
+# enough and every worker keeps a single copy of the model.
+DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', 8))
+FEATURE_THREADS = int(os.environ.get('ASGI_FEATURE_THREADS', 2))
+CORS_ORIGIN = 'https://marble.boston'
+
+db_pool = ThreadPoolExecutor(DB_THREADS, thread_name_prefix='asgi-db')
+feature_pool = ThreadPoolExecutor(FEATURE_THREADS, thread_name_prefix='asgi-features')
+
+
+async def run_in(pool, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(fn, *args))
+
+
+def query_int(request, name, default):
+    # Same as Flask's request.args.get(name, default, type=int): bad values fall back to the default
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+
+
+def api_headers(request, headers=None):
+    # The headers the Flask app adds in after_request hooks and flask_cors
+    headers = dict(headers or {})
+    headers['Content-Security-Policy'] = sp.CONTENT_SECURITY_POLICY
+    if request.headers.get('origin') == CORS_ORIGIN:
+        headers['Access-Control-Allow-Origin'] = CORS_ORIGIN
+        headers['Vary'] = 'Origin'
+    return headers
+
+
+def api_response(request, body, status=200, media_type='application/json', headers=None):
+    headers = api_headers(request, headers)
+    if status == 200 and media_type == 'application/json':
+        headers['Vary'] = ', '.join(filter(None, [headers.get('Vary'), 'Accept-Encoding']))
+        if len(body) >= COMPRESS_MIN_BYTES:
+            encoding = choose_encoding(parse_accept_header(request.headers.get('accept-encoding')))
+            if encoding:
+                body = compress_body(body, encoding)
+                headers['Content-Encoding'] = encoding
+    return Response(body, status_code=status, media_type=media_type, headers=headers)
+
+
+def json_response(request, data, status=200):
+    return api_response(request, dumps_bytes(data), status)
+
+
+def instrumented(rule):
+    # Label requests with the Flask rule so /metrics shows one series per route whichever server handled it
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            start = time.perf_counter()
+            response = await handler(request)
+            seconds = time.perf_counter() - start
+            metrics.collector.observe(metrics.REQUEST_METRIC, {'route': rule, 'method': request.method,
+                                                               'status': str(response.status_code)}, seconds)
+            response.headers['Server-Timing'] = f"total;dur={seconds * 1000:.1f}"
+            return response
+        return wrapper
+    return decorator
+
+
+@instrumented('/api/images')
+async def get_images(request):
+    page = query_int(request, 'page', 1)
+    per_page = query_int(request, 'per_page', 20)
+    try:
+        columns = sp.resolve_image_columns(request.query_params.get('fields'), request.query_params.get('view', 'full'))
+    except ValueError as e:
+        return json_response(request, {"error": str(e)}, 400)
+    data = await run_in(db_pool, sp.images_page, page, per_page, request.query_params.get('search', ''), columns)
+    return json_response(request, data)
+
+
+@instrumented('/api/image/<int:image_id>')
+async def serve_image(request):
+    image_id = request.path_params['image_id']
+    version = request.path_params.get('version')
+    image_version = await run_in(db_pool, sp.query_image_version, image_id)
+    if image_version is None:
+        return api_response(request, b"Image not found", 404, media_type='text/html')
+
+    image_hash, _ = image_version
+    if version is not None and not image_store.matches_version(image_hash, version):
+        return RedirectResponse(image_store.image_url(image_id, image_hash), status_code=302)
+    cache_control = image_store.IMMUTABLE_CACHE if version is not None else image_store.REVALIDATE_CACHE
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(image_hash):
+        headers = {'Cache-Control': cache_control, 'ETag': f'"{image_hash}"'}
+        return api_response(request, b'', 304, media_type=None, headers=headers)
+
+    stream = await run_in(db_pool, image_store.BlobStream.open, sp.DB_PATH, image_id)
+    if stream is None:
+        return api_response(request, b"Image not found", 404, media_type='text/html')
+    requested = image_store.byte_range(request.headers.get('range'), request.headers.get('if-range'), image_hash, stream.size)
+    status, headers = image_store.image_headers(image_hash, cache_control, stream.size, requested)
+    if status == 416:
+        stream.close()
+        return api_response(request, b'', status, media_type=None, headers=headers)
+    if requested:
+        stream.select(*requested)
+    # Chunks are read in Starlette's thread pool; the background task closes the blob if the client goes away early
+    return StreamingResponse(stream, status_code=status, media_type='image/png', headers=api_headers(request, headers),
+                             background=BackgroundTask(stream.close))
+
+
+@instrumented('/api/featured-marbles')
+async def get_featured_marbles(request):
+    return json_response(request, await run_in(db_pool, sp.query_featured_marbles))
+
+
+@instrumented('/api/marble/<int:marble_id>')
+async def get_marble(request):
+    marble = await run_in(db_pool, sp.query_marble, request.path_params['marble_id'])
+    if marble is None:
+        return json_response(request, {"error": "Marble not found"}, 404)
+    return json_response(request, marble)
+
+
+@instrumented('/api/marble/<int:marble_id>/vendors')
+async def get_marble_vendors(request):
+    return json_response(request, await run_in(db_pool, sp.query_marble_vendors, request.path_params['marble_id']))
+
+
+@instrumented('/api/suggest')
+async def get_suggestions(request):
+    # The first call in a worker builds the prefix index from SQLite, so this runs in the pool like the other reads
+    data = await run_in(db_pool, sp.query_suggestions, request.query_params.get('q', ''),
+                        query_int(request, 'limit', sp.suggest.MAX_SUGGESTIONS))
+    return json_response(request, data)
+
+
+@instrumented('/api/fuzzy')
+async def get_fuzzy_matches(request):
+    try:
+        score_cutoff = float(request.query_params.get('cutoff', sp.fuzzy_match.DEFAULT_SCORE_CUTOFF))
+    except ValueError:
+        score_cutoff = sp.fuzzy_match.DEFAULT_SCORE_CUTOFF
+    data = await run_in(db_pool, sp.query_fuzzy_matches, request.query_params.get('q', ''),
+                        query_int(request, 'limit', sp.fuzzy_match.DEFAULT_LIMIT), score_cutoff)
+    return json_response(request, data)
+
+
+@instrumented('/api/similar-marbles')
+async def get_similar_marbles(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        return json_response(request, {"error": "Invalid JSON"}, 400)
+    marble_id = payload.get('marbleId') if isinstance(payload, dict) else None
+    if marble_id is None:
+        return json_response(request, {"error": "marbleId is required"}, 400)
+    try:
+        marble_id = int(marble_id)
+    except ValueError:
+        return json_response(request, {"error": "Invalid marbleId"}, 400)
+    if sp.index is None:
+        return json_response(request, {"error": "FAISS index is not loaded"}, 500)
+
+    similar_marbles = await run_in(db_pool, sp.find_similar_marbles, marble_id)
+    if similar_marbles is None:
+        return json_response(request, {"error": "Marble not found"}, 404)
+    return json_response(request, similar_marbles)
+
+
+@instrumented('/api/upload-image')
+async def upload_image(request):
+    if sp.index is None:
+        return json_response(request, {"error": "FAISS index not loaded"}, 500)
+
+    try:
+        # The body is received on the event loop, so a slow upload no longer holds a worker
+        form = await request.form()
+        file = form.get('image')
+        if file is None or isinstance(file, str):
+            return json_response(request, {"error": "No image file provided"}, 400)
+        if file.filename == '':
+            return json_response(request, {"error": "No selected file"}, 400)
+        image_data = await file.read(MAX_UPLOAD_BYTES + 1)
+
+        timings = {}
+        combined_features = await run_in(feature_pool, sp.extract_features, image_data, timings)
+        sp.app.logger.info("Upload feature timings: " + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items()))
+
+        if len(combined_features) != sp.index.d:
+            sp.app.logger.error(f"Feature dimension mismatch. Expected {sp.index.d}, got {len(combined_features)}")
+            return json_response(request, {"error": "Feature dimension mismatch"}, 500)
+        return json_response(request, await run_in(db_pool, sp.match_uploaded_features, combined_features))
+    except UploadRejected as e:
+        sp.app.logger.warning(f"Rejected upload: {str(e)}")
+        return json_response(request, {"error": str(e)}, e.status)
+    except Image.DecompressionBombError as e:
+        sp.app.logger.warning(f"Rejected upload: {str(e)}")
+        return json_response(request, {"error": "Image dimensions are too large"}, 413)
+    except HTTPException as e:
+        # Starlette's own rejections of the form (malformed multipart, too many fields)
+        return json_response(request, {"error": e.detail}, e.status_code)
+    except Exception as e:
+        # Same JSON body as the Flask handler instead of Starlette's plain-text 500
+        sp.app.logger.error(f"Error in upload_image: {str(e)}")
+        sp.app.logger.error(f"Traceback: {traceback.format_exc()}")
+        return json_response(request, {"error": f"Server error: {str(e)}"}, 500)
+
+
+@instrumented('/pixel.gif')
+async def tracking_pixel(request):
+    # record_event only puts the event on the sink's queue, so it is safe to call on the event loop
+    sp.record_pixel_event(request.query_params, request.client.host if request.client else None,
+                          request.headers.get('user-agent'), request.headers.get('referer'))
+    return api_response(request, sp.PIXEL_GIF, media_type='image/gif', headers=sp.PIXEL_HEADERS)
+
+
+@instrumented('/log_event')
+async def log_event(request):
+    try:
+        event_data = await request.json()
+    except ValueError:
+        event_data = None
+    try:
+        record_client_event(event_data, request.client.host if request.client else None,
+                            request.headers.get('user-agent'), request.headers.get('referer'))
+    except ValueError as e:
+        return json_response(request, {"error": str(e)}, 400)
+    return json_response(request, sp.LOG_EVENT_RESPONSE)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    db_pool.shutdown(wait=False)
+    feature_pool.shutdown(wait=False)
+
+
+routes = [
+    Route('/api/images', get_images, methods=['GET']),
+    Route('/api/image/{image_id:int}', serve_image, methods=['GET']),
+    Route('/api/image/{image_id:int}/{version}', serve_image, methods=['GET']),
+    Route('/api/featured-marbles', get_featured_marbles, methods=['GET']),
+    Route('/api/marble/{marble_id:int}', get_marble, methods=['GET']),
+    Route('/api/marble/{marble_id:int}/vendors', get_marble_vendors, methods=['GET']),
+    Route('/api/suggest', get_suggestions, methods=['GET']),
+    Route('/api/fuzzy', get_fuzzy_matches, methods=['GET']),
+    Route('/api/similar-marbles', get_similar_marbles, methods=['POST']),
+    Route('/api/upload-image', upload_image, methods=['POST']),
+    Route('/pixel.gif', tracking_pixel, methods=['GET']),
+    Route('/log_event', log_event, methods=['POST']),
+    # Everything else (the React build, /3d, /metrics, the expert page, /admin) is served by the WSGI apps
+    Mount('/', app=WSGIMiddleware(wsgi_app)),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
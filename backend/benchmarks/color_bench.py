@@ -0,0 +1,155 @@
+import argparse
+import io
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(current_dir, '..'))
+
+from migrate import DEFAULT_DB_PATH
+from utilities.imageColor import get_brightest_color, get_dominant_color
+
+# The thread count imageColor.main used before the process pool
+LEGACY_THREADS = 128
+
+
+def is_color_valid(color):
+    # The legacy engines skip pure white and pure black, as imageColor did before the numpy engine
+    r, g, b = color
+    return not ((r == g == b == 255) or (r == g == b == 0))
+
+
+def legacy_dominant_color(image_blob):
+    # imageColor.get_dominant_color before the numpy engine: every distinct color of the full-size image,
+    # sorted in Python
+    image = Image.open(io.BytesIO(image_blob)).convert('RGB')
+    width, height = image.size
+    pixels = image.getcolors(width * height)
+    sorted_pixels = sorted([p for p in pixels if is_color_valid(p[1])], key=lambda t: t[0], reverse=True)
+    if not sorted_pixels:
+        return None
+    return '#{:02x}{:02x}{:02x}'.format(*sorted_pixels[0][1])
+
+
+def legacy_brightest_color(image_blob):
+    image = Image.open(io.BytesIO(image_blob)).convert('RGB')
+    width, height = image.size
+    brightest_color = None
+    max_brightness = -1
+    for count, color in image.getcolors(width * height):
+        if is_color_valid(color):
+            brightness = 0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]
+            if brightness > max_brightness:
+                max_brightness = brightness
+                brightest_color = color
+    if brightest_color is None:
+        return None
+    return '#{:02x}{:02x}{:02x}'.format(*brightest_color)
+
+
+def dominant(image_blob):
+    return get_dominant_color(image_blob, 'benchmark')
+
+
+def brightest(image_blob):
+    return get_brightest_color(image_blob, 'benchmark')
+
+
+ENGINES = {
+    'dominant': (legacy_dominant_color, dominant),
+    'brightest': (legacy_brightest_color, brightest),
+}
+
+
+def load_images(db_path, limit):
+    conn = sqlite3.connect(db_path)
+    blobs = [row[0] for row in conn.execute("SELECT image FROM image_blobs ORDER BY id LIMIT ?", (limit,))]
+    conn.close()
+    # Rows that aren't images would only time the error path
+    valid = []
+    for blob in blobs:
+        try:
+            Image.open(io.BytesIO(blob)).verify()
+            valid.append(blob)
+        except Exception:
+            pass
+    return valid
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def color_distance(a, b):
+    # Euclidean RGB distance between two hex colors; 441 is black against white
+    if a is None or b is None:
+        return None
+    a, b = (np.array([int(c[i:i + 2], 16) for i in (1, 3, 5)]) for c in (a, b))
+    return float(np.linalg.norm(a - b))
+
+
+def run_benchmarks(images, algorithms=tuple(ENGINES), workers=None):
+    results = {}
+    for algorithm in algorithms:
+        legacy, engine = ENGINES[algorithm]
+        legacy_colors, seconds = timed(lambda: [legacy(blob) for blob in images])
+        results[f'{algorithm}/legacy/serial'] = seconds
+        with ThreadPoolExecutor(max_workers=LEGACY_THREADS) as executor:
+            _, results[f'{algorithm}/legacy/threads{LEGACY_THREADS}'] = timed(lambda: list(executor.map(legacy, images)))
+        colors, results[f'{algorithm}/numpy/serial'] = timed(lambda: [engine(blob) for blob in images])
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Start the workers before timing, as main() pays that once for the whole catalog
+            list(executor.map(engine, images[:1]))
+            _, results[f'{algorithm}/numpy/processes'] = timed(lambda: list(executor.map(engine, images, chunksize=16)))
+
+        distances = [d for d in map(color_distance, legacy_colors, colors) if d is not None]
+        results[f'{algorithm}/agreement'] = {
+            'exact': sum(a == b for a, b in zip(legacy_colors, colors)) / len(images),
+            'mean_rgb_distance': float(np.mean(distances)) if distances else None,
+            'max_rgb_distance': float(np.max(distances)) if distances else None,
+        }
+    return results
+
+
+def print_results(results, image_count):
+    print(f"{'case':<34}{'seconds':>10}{'images/s':>12}")
+    for case, value in results.items():
+        if isinstance(value, dict):
+            notes = ', '.join(f'{key}={stat:.3f}' for key, stat in value.items() if stat is not None)
+            print(f"{case:<34}  {notes}")
+        else:
+            print(f"{case:<34}{value:>10.3f}{image_count / value:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the numpy stone color engine with the getcolors version it replaced')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='Catalog whose images are measured')
+    parser.add_argument('--limit', type=int, default=500, help='Number of images to load')
+    parser.add_argument('--algorithms', default=','.join(ENGINES))
+    parser.add_argument('--workers', type=int, help='Process pool size (default: one per core)')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    # imageColor logs every image it can't read; the comparison only needs the totals
+    logging.getLogger('utilities.imageColor').setLevel(logging.CRITICAL)
+    images = load_images(args.db, args.limit)
+    if not images:
+        raise SystemExit(f"No readable images in {args.db}")
+    print(f"{len(images)} images from {args.db}, {os.cpu_count()} cores")
+    results = run_benchmarks(images, tuple(args.algorithms.split(',')), args.workers)
+    print_results(results, len(images))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'db': args.db, 'images': len(images),
+                       'cores': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
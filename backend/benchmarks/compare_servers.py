@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+import http.client
+
+from http_bench import ROUTES, run_benchmark, select_routes
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(current_dir, '..')
+
+SERVERS = {
+    # The current deployment: sync gunicorn workers running wsgi:app
+    'wsgi': lambda port, workers: ['gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+    'asgi': lambda port, workers: ['uvicorn', 'asgi:app', '--workers', str(workers), '--host', '127.0.0.1',
+                                   '--port', str(port), '--loop', 'auto', '--http', 'auto', '--no-access-log'],
+}
+
+
+def wait_until_ready(port, timeout=300):
+    # Workers load ResNet and the FAISS index before they answer, which can take a while
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/images?per_page=1')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(1)
+    raise RuntimeError(f"Server on port {port} did not start within {timeout}s")
+
+
+def slow_client(port, deadline):
+    # Announces a 1 KB body and trickles it one byte a second, like a phone uploading on a bad connection
+    try:
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b"POST /log_event HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: 1024\r\n\r\n")
+        while time.monotonic() < deadline:
+            sock.sendall(b' ')
+            time.sleep(1)
+        sock.close()
+    except OSError:
+        pass
+
+
+def benchmark_server(name, port, args, routes):
+    env = dict(os.environ)
+    if args.db:
+        env['MARBLE_DB_PATH'] = os.path.abspath(args.db)
+    if args.index:
+        env['MARBLE_INDEX_PATH'] = os.path.abspath(args.index)
+    process = subprocess.Popen(SERVERS[name](port, args.workers), cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port)
+        deadline = time.monotonic() + args.warmup + args.duration + 5
+        for _ in range(args.slow_clients):
+            threading.Thread(target=slow_client, args=(port, deadline), daemon=True).start()
+        return run_benchmark(f'http://127.0.0.1:{port}', args.concurrency, args.duration, routes, args.warmup)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def print_comparison(results):
+    names = list(results)
+    header = f"{'route':<16}" + ''.join(f"{name + ' rps':>12}{name + ' p95':>12}{name + ' p99':>12}" for name in names)
+    print(header)
+    routes = list(results[names[0]]['routes']) + ['TOTAL']
+    for route in routes:
+        line = f"{route:<16}"
+        for name in names:
+            stats = results[name]['total'] if route == 'TOTAL' else results[name]['routes'][route]
+            if stats['requests']:
+                line += f"{stats['rps']:>12.1f}{stats['p95_ms']:>12.1f}{stats['p99_ms']:>12.1f}"
+            else:
+                line += f"{'-':>12}{'-':>12}{'-':>12}"
+        print(line)
+    for name in names:
+        print(f"{name}: {results[name]['total']['errors']} errors")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the same load against the WSGI and ASGI deployments')
+    parser.add_argument('--db', help='Catalog to serve (e.g. benchmarks/data/marble_images-10000.db)')
+    parser.add_argument('--index', help='FAISS index matching --db')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--slow-clients', type=int, default=0,
+                        help='Connections that trickle a request body during the run')
+    parser.add_argument('--routes', help='Comma separated subset of: ' + ', '.join(route.name for route in ROUTES))
+    parser.add_argument('--servers', default='wsgi,asgi')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--output', help='Write both result sets as JSON')
+    args = parser.parse_args()
+
+    routes = select_routes(args.routes)
+
+    results = {}
+    for offset, name in enumerate(args.servers.split(',')):
+        print(f"Benchmarking {name}...")
+        results[name] = benchmark_server(name, args.port + offset, args, routes)
+    print_comparison(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,195 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import numpy as np
+import torch
+from PIL import Image
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(current_dir, '..'))
+
+from feature_extraction import (FEATURE_IMAGE_SIZE, HISTOGRAM_BINS, decode_upload, preprocess_image, color_histogram,
+                                resnet_features, combine_features, extract_features, load_resnet_model)
+
+DEFAULT_BASELINE = os.path.join(current_dir, 'embedding_baseline.json')
+IMAGE_SIZES = [(256, 256), (1024, 768), (4032, 3024)]
+BATCH_SIZES = [1, 4, 16]
+
+
+def synthetic_photo(width, height, seed=0):
+    # Smooth colour gradient plus sensor-like noise, so JPEG sizes and decode times look like real photos
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    base = np.stack([200 * x + 30 * y, 180 - 60 * y + 0 * x, 150 + 50 * x * y], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def histogram_bincount(image):
+    # 256 / 32 = 8, so the bin is just the top five bits; one bincount covers all three channels
+    img_array = np.asarray(image)
+    bins = (img_array >> 3).astype(np.intp) + np.arange(3) * HISTOGRAM_BINS
+    color_features = np.bincount(bins.ravel(), minlength=3 * HISTOGRAM_BINS)
+    return color_features / np.sum(color_features)
+
+
+def histogram_pil(image):
+    # Image.histogram() counts all 256 levels per band in C; fold each run of 8 into one bin
+    color_features = np.array(image.histogram()).reshape(3, HISTOGRAM_BINS, -1).sum(axis=2).ravel()
+    return color_features / np.sum(color_features)
+
+
+HISTOGRAMS = {
+    'numpy': color_histogram,
+    'bincount': histogram_bincount,
+    'pil': histogram_pil,
+}
+
+
+def scripted_model(model):
+    return torch.jit.freeze(torch.jit.script(model))
+
+
+def quantized_model():
+    # torchvision's int8 ResNet50 runs on CPU only; dropping fc leaves the same 2048-d pooled output
+    from torchvision.models.quantization import resnet50, ResNet50_QuantizedWeights
+    model = resnet50(weights=ResNet50_QuantizedWeights.IMAGENET1K_FBGEMM_V2, quantize=True)
+    model.fc = torch.nn.Identity()
+    model.eval()
+    return model
+
+
+def measure(fn, repeats, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {
+        'median_ms': float(np.median(samples)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'min_ms': float(samples.min()),
+        'repeats': repeats,
+    }
+
+
+def cosine(a, b):
+    a = a.reshape(len(a), -1)
+    b = b.reshape(len(b), -1)
+    return float(np.mean(np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))))
+
+
+def run_benchmarks(repeats=20, variants=('eager', 'scripted', 'quantized'), batch_sizes=BATCH_SIZES):
+    device = torch.device('cpu')
+    results = {}
+    photos = {f'{w}x{h}': synthetic_photo(w, h) for w, h in IMAGE_SIZES}
+
+    for size, data in photos.items():
+        results[f'decode/{size}'] = measure(lambda: decode_upload(data, max_bytes=None, max_pixels=None), repeats)
+        decoded = decode_upload(data, max_bytes=None, max_pixels=None)
+        results[f'resize/{size}'] = measure(lambda: decoded.resize((FEATURE_IMAGE_SIZE, FEATURE_IMAGE_SIZE)), repeats)
+
+    image = decode_upload(photos['1024x768']).resize((FEATURE_IMAGE_SIZE, FEATURE_IMAGE_SIZE))
+    results['preprocess'] = measure(lambda: preprocess_image(image), repeats)
+    preprocessed = preprocess_image(image)
+
+    reference_histogram = color_histogram(preprocessed)
+    for name, histogram in HISTOGRAMS.items():
+        results[f'histogram/{name}'] = measure(lambda: histogram(preprocessed), repeats * 10)
+        results[f'histogram/{name}']['matches_numpy'] = bool(np.allclose(histogram(preprocessed), reference_histogram))
+
+    eager = load_resnet_model(device)
+    models = {'eager': eager}
+    if 'scripted' in variants:
+        models['scripted'] = scripted_model(eager)
+    if 'quantized' in variants:
+        models['quantized'] = quantized_model()
+
+    reference = {}
+    for name, model in models.items():
+        for batch_size in batch_sizes:
+            batch = [preprocessed] * batch_size
+            case = f'resnet/{name}/batch{batch_size}'
+            results[case] = measure(lambda: resnet_features(model, batch, device), max(repeats // batch_size, 3))
+            results[case]['per_image_ms'] = results[case]['median_ms'] / batch_size
+        features = resnet_features(model, [preprocessed], device)
+        if name == 'eager':
+            reference['resnet'] = features
+        else:
+            # How far the faster variant drifts from the features the index was built with
+            results[f'resnet/{name}/batch1']['cosine_vs_eager'] = cosine(features, reference['resnet'])
+
+    resnet = reference['resnet'][0]
+    results['combine'] = measure(lambda: combine_features(reference_histogram, resnet), repeats * 10)
+    for size, data in photos.items():
+        results[f'extract_features/{size}'] = measure(lambda: extract_features(data, eager, device, enforce_limits=False), repeats)
+    return results
+
+
+def print_results(results):
+    print(f"{'case':<32}{'median ms':>12}{'p90 ms':>10}{'per image':>11}  notes")
+    for case, stats in results.items():
+        per_image = f"{stats['per_image_ms']:.2f}" if 'per_image_ms' in stats else ''
+        notes = ', '.join(f'{key}={value:.4f}' if isinstance(value, float) else f'{key}={value}'
+                          for key, value in stats.items() if key in ('matches_numpy', 'cosine_vs_eager'))
+        print(f"{case:<32}{stats['median_ms']:>12.3f}{stats['p90_ms']:>10.3f}{per_image:>11}  {notes}")
+
+
+def check_regressions(results, baseline, tolerance, min_delta_ms):
+    # Very fast cases jitter by a few microseconds, so a case must also be min_delta_ms slower to count
+    regressions = []
+    for case, stats in baseline['results'].items():
+        current = results.get(case)
+        if current is None:
+            continue
+        limit = stats['median_ms'] * (1 + tolerance)
+        if current['median_ms'] > limit and current['median_ms'] - stats['median_ms'] > min_delta_ms:
+            regressions.append((case, stats['median_ms'], current['median_ms']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each stage of the upload embedding pipeline')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--variants', default='eager,scripted,quantized')
+    parser.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)))
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='Store these results as the baseline')
+    parser.add_argument('--check', nargs='?', const=DEFAULT_BASELINE, help='Exit 1 if a case is slower than the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed fractional slowdown for --check')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeats, tuple(args.variants.split(',')), [int(b) for b in args.batch_sizes.split(',')])
+    print_results(results)
+
+    document = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'torch': torch.__version__,
+        'threads': torch.get_num_threads(),
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(document, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, args.tolerance, args.min_delta_ms)
+        for case, before, after in regressions:
+            print(f"REGRESSION {case}: {before:.3f}ms -> {after:.3f}ms")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No stage is more than {args.tolerance:.0%} slower than {args.check}")
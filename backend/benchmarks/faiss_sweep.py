@@ -0,0 +1,150 @@
+import argparse
+import json
+import math
+import os
+import time
+import faiss
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX = os.path.join(current_dir, '..', 'marble_image_index.faiss')
+
+
+def load_vectors(index_path):
+    index = faiss.read_index(index_path)
+    vectors = np.empty((index.ntotal, index.d), dtype=np.float32)
+    index.reconstruct_n(0, index.ntotal, vectors)
+    return vectors, index.metric_type
+
+
+def sample_queries(vectors, count, seed=0):
+    # Production queries are catalog vectors (similar-marbles) and new uploads; a little noise stands in for the latter
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    queries = vectors[picks].copy()
+    queries[len(queries) // 2:] += rng.normal(0, 0.01, queries[len(queries) // 2:].shape).astype(np.float32)
+    return queries
+
+
+def ground_truth(vectors, queries, k, metric):
+    exact = faiss.IndexFlat(vectors.shape[1], metric)
+    exact.add(vectors)
+    return exact.search(queries, k)[1]
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def candidate_configs(n, d):
+    # (factory string, search parameter name, values to sweep); nlist stays near sqrt(n) so every list can be trained
+    configs = [('Flat', None, [None])]
+    for nlist in sorted({max(int(math.sqrt(n) * f), 4) for f in (0.5, 1, 2, 4)}):
+        if n < nlist * 39:
+            continue
+        nprobes = [p for p in (1, 2, 4, 8, 16, 32, 64, 128) if p <= nlist]
+        configs.append((f'IVF{nlist},Flat', 'nprobe', nprobes))
+        configs.append((f'IVF{nlist},SQ8', 'nprobe', nprobes))
+        for m in (64, 128, 256):
+            # PQ needs 256 training points per centroid and m must divide the dimension
+            if d % m == 0 and n >= 256 * 39:
+                configs.append((f'IVF{nlist},PQ{m}', 'nprobe', nprobes))
+    for m in (16, 32):
+        configs.append((f'HNSW{m},Flat', 'efSearch', [16, 32, 64, 128, 256]))
+    configs.append(('SQ8', None, [None]))
+    configs.append(('SQfp16', None, [None]))
+    return configs
+
+
+def build_index(factory, vectors, metric):
+    index = faiss.index_factory(vectors.shape[1], factory, metric)
+    start = time.perf_counter()
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index, time.perf_counter() - start
+
+
+def timed_search(index, queries, k):
+    # One query at a time, the way the API calls index.search
+    start = time.perf_counter()
+    results = [index.search(query.reshape(1, -1), k)[1][0] for query in queries]
+    elapsed = time.perf_counter() - start
+    return np.array(results), len(queries) / elapsed, elapsed / len(queries) * 1000
+
+
+def run_sweep(vectors, metric, k=10, query_count=500, configs=None, threads=None):
+    if threads:
+        faiss.omp_set_num_threads(threads)
+    queries = sample_queries(vectors, query_count)
+    truth = ground_truth(vectors, queries, k, metric)
+    params = faiss.ParameterSpace()
+    rows = []
+    for factory, param, values in configs or candidate_configs(*vectors.shape):
+        index, build_seconds = build_index(factory, vectors, metric)
+        memory = faiss.serialize_index(index).nbytes
+        for value in values:
+            if param:
+                params.set_index_parameter(index, param, value)
+            found, qps, latency_ms = timed_search(index, queries, k)
+            rows.append({
+                'index': factory,
+                'param': f'{param}={value}' if param else '',
+                'recall': recall_at_k(found, truth),
+                'qps': qps,
+                'latency_ms': latency_ms,
+                'build_s': build_seconds,
+                'memory_mb': memory / 1024 / 1024,
+            })
+    return rows
+
+
+def recommend(rows, target_recall):
+    # Fastest configuration that meets the target; the smaller index wins when speeds are within 5%
+    eligible = [row for row in rows if row['recall'] >= target_recall]
+    if not eligible:
+        return None
+    best_qps = max(row['qps'] for row in eligible)
+    close = [row for row in eligible if row['qps'] >= best_qps * 0.95]
+    return min(close, key=lambda row: row['memory_mb'])
+
+
+def print_table(rows, k):
+    print(f"{'index':<20}{'search param':<16}{f'recall@{k}':>10}{'QPS':>10}{'ms/query':>10}{'build s':>10}{'memory MB':>11}")
+    for row in rows:
+        print(f"{row['index']:<20}{row['param']:<16}{row['recall']:>10.4f}{row['qps']:>10.0f}"
+              f"{row['latency_ms']:>10.3f}{row['build_s']:>10.2f}{row['memory_mb']:>11.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare recall and speed of FAISS index types against exact search')
+    parser.add_argument('--index', default=DEFAULT_INDEX, help='FAISS index holding the catalog vectors')
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--target-recall', type=float, default=0.95)
+    parser.add_argument('--threads', type=int, help='OpenMP threads; gunicorn workers usually want 1')
+    parser.add_argument('--only', action='append', help='Factory string to test instead of the default sweep (repeatable)')
+    parser.add_argument('--output', help='Write all rows as JSON')
+    args = parser.parse_args()
+
+    vectors, metric = load_vectors(args.index)
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {args.queries} queries, k={args.k}")
+    configs = None
+    if args.only:
+        all_configs = {factory: (factory, param, values) for factory, param, values in candidate_configs(*vectors.shape)}
+        configs = [all_configs.get(factory, (factory, None, [None])) for factory in args.only]
+
+    rows = run_sweep(vectors, metric, args.k, args.queries, configs, args.threads)
+    print_table(rows, args.k)
+
+    best = recommend(rows, args.target_recall)
+    if best is None:
+        print(f"\nNo configuration reaches recall@{args.k} >= {args.target_recall}; keep exact search.")
+    else:
+        print(f"\nRecommended for recall@{args.k} >= {args.target_recall}: {best['index']} {best['param']} "
+              f"({best['recall']:.4f} recall, {best['qps']:.0f} QPS, {best['memory_mb']:.1f} MB)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'k': args.k, 'target_recall': args.target_recall, 'recommended': best, 'rows': rows}, f, indent=2)
@@ -0,0 +1,271 @@
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import uuid
+from urllib.parse import quote, urlsplit
+import numpy as np
+from PIL import Image
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS_DIR = os.path.join(current_dir, 'results')
+SEARCH_TERMS = ['Bianco', 'Carrara', 'Calacatta', 'Nero', 'Statuario', 'Verde', 'Rosso', 'Grey', 'White', 'Italy']
+
+
+class Route:
+    def __init__(self, name, weight, build):
+        self.name = name
+        self.weight = weight
+        # build(rng, catalog_size) -> (method, path, body, headers)
+        self.build = build
+
+
+def upload_body(rng):
+    img = Image.new('RGB', (1024, 768), tuple(rng.randint(0, 255) for _ in range(3)))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=85)
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="bench.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + buffer.getvalue() + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def typeahead_prefix(rng):
+    # What /api/suggest sees while someone types: the first few letters of a name
+    term = rng.choice(SEARCH_TERMS)
+    return term[:rng.randint(1, len(term))]
+
+
+def misspelling(rng):
+    # A search term with one letter dropped, the kind of typo /api/fuzzy is there to forgive
+    term = rng.choice(SEARCH_TERMS)
+    position = rng.randrange(len(term))
+    return term[:position] + term[position + 1:]
+
+
+def json_body(data):
+    return json.dumps(data).encode(), {'Content-Type': 'application/json'}
+
+
+# Weights roughly follow production traffic: listing pages and thumbnails dominate
+ROUTES = [
+    Route('images_page', 20, lambda rng, n: ('GET', f'/api/images?page={rng.randint(1, max(n // 20, 1))}&per_page=20', None, {})),
+    Route('images_card', 10, lambda rng, n: ('GET', f'/api/images?page={rng.randint(1, max(n // 20, 1))}&per_page=20&view=card', None, {})),
+    Route('images_search', 10, lambda rng, n: ('GET', f'/api/images?search={quote(rng.choice(SEARCH_TERMS))}&per_page=20', None, {})),
+    Route('image', 40, lambda rng, n: ('GET', f'/api/image/{rng.randint(1, n)}', None, {})),
+    Route('marble', 5, lambda rng, n: ('GET', f'/api/marble/{rng.randint(1, n)}', None, {})),
+    Route('suggest', 15, lambda rng, n: ('GET', f'/api/suggest?q={quote(typeahead_prefix(rng))}', None, {})),
+    Route('fuzzy', 3, lambda rng, n: ('GET', f'/api/fuzzy?q={quote(misspelling(rng))}', None, {})),
+    Route('featured', 5, lambda rng, n: ('GET', '/api/featured-marbles', None, {})),
+    Route('vendors', 5, lambda rng, n: ('GET', f'/api/marble/{rng.randint(1, n)}/vendors', None, {})),
+    Route('similar', 5, lambda rng, n: ('POST', '/api/similar-marbles', *json_body({'marbleId': rng.randint(1, n)}))),
+    Route('upload', 1, lambda rng, n: ('POST', '/api/upload-image', *upload_body(rng))),
+    Route('expert', 2, lambda rng, n: ('GET', '/api/expert', None, {})),
+    Route('pixel', 10, lambda rng, n: ('GET', f'/pixel.gif?event=pageview&page=/&marble_id={rng.randint(1, n)}', None, {})),
+    Route('log_event', 2, lambda rng, n: ('POST', '/log_event', *json_body({'event_type': 'bench', 'data': {'route': '/'}}))),
+]
+
+
+def select_routes(names=None):
+    if not names:
+        return ROUTES
+    selected = names.split(',')
+    unknown = set(selected) - {route.name for route in ROUTES}
+    if unknown:
+        raise SystemExit(f"Unknown routes: {', '.join(sorted(unknown))}")
+    return [route for route in ROUTES if route.name in selected]
+
+
+class Worker(threading.Thread):
+    def __init__(self, base_url, routes, catalog_size, deadline, seed):
+        super().__init__(daemon=True)
+        self.url = urlsplit(base_url)
+        self.routes = routes
+        self.weights = [route.weight for route in routes]
+        self.catalog_size = catalog_size
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.latencies = {route.name: [] for route in routes}
+        self.errors = {route.name: 0 for route in routes}
+        self.conn = None
+
+    def connect(self):
+        connection_class = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+        self.conn = connection_class(self.url.hostname, self.url.port, timeout=30)
+
+    def request(self, method, path, body, headers):
+        # Keep-alive where the server allows it; reconnect after the server closes the socket
+        for attempt in range(2):
+            if self.conn is None:
+                self.connect()
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.conn.close()
+                    self.conn = None
+                return response.status
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            route = self.rng.choices(self.routes, self.weights)[0]
+            method, path, body, headers = route.build(self.rng, self.catalog_size)
+            start = time.perf_counter()
+            try:
+                status = self.request(method, path, body, headers)
+            except (OSError, http.client.HTTPException):
+                status = None
+            elapsed = time.perf_counter() - start
+            if status is None or status >= 500:
+                self.errors[route.name] += 1
+            else:
+                self.latencies[route.name].append(elapsed)
+
+
+def summarize(latencies, errors, duration):
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'rps': 0.0}
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(ms.max()),
+    }
+
+
+def catalog_size_from_server(base_url):
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    conn.request('GET', '/api/images?per_page=1')
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    conn.close()
+    return data['totalMarbles']
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=current_dir, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(base_url, concurrency, duration, routes=ROUTES, warmup=2.0, seed=0):
+    catalog_size = catalog_size_from_server(base_url)
+    if warmup:
+        warmers = [Worker(base_url, routes, catalog_size, time.monotonic() + warmup, seed + i) for i in range(concurrency)]
+        for worker in warmers:
+            worker.start()
+        for worker in warmers:
+            worker.join()
+
+    deadline = time.monotonic() + duration
+    workers = [Worker(base_url, routes, catalog_size, deadline, seed + 1000 + i) for i in range(concurrency)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'base_url': base_url,
+            'catalog_size': catalog_size,
+            'concurrency': concurrency,
+            'duration': elapsed,
+        },
+        'routes': {},
+    }
+    all_latencies, all_errors = [], 0
+    for route in routes:
+        latencies = [value for worker in workers for value in worker.latencies[route.name]]
+        errors = sum(worker.errors[route.name] for worker in workers)
+        results['routes'][route.name] = summarize(latencies, errors, elapsed)
+        all_latencies.extend(latencies)
+        all_errors += errors
+    results['total'] = summarize(all_latencies, all_errors, elapsed)
+    return results
+
+
+def print_results(results):
+    print(f"{'route':<16}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in list(results['routes'].items()) + [('TOTAL', results['total'])]:
+        if not stats['requests']:
+            print(f"{name:<16}{0:>10}{stats['errors']:>8}")
+            continue
+        print(f"{name:<16}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+def compare_results(baseline, current, max_regression):
+    # A route regresses when p95 grows or throughput drops by more than max_regression
+    regressions = []
+    print(f"{'route':<16}{'p95 before':>12}{'p95 after':>12}{'change':>9}{'rps before':>12}{'rps after':>12}{'change':>9}")
+    for name in list(current['routes']) + ['TOTAL']:
+        before = baseline['total'] if name == 'TOTAL' else baseline['routes'].get(name)
+        after = current['total'] if name == 'TOTAL' else current['routes'][name]
+        if not before or not before.get('requests') or not after.get('requests'):
+            continue
+        p95_change = after['p95_ms'] / before['p95_ms'] - 1
+        rps_change = after['rps'] / before['rps'] - 1
+        print(f"{name:<16}{before['p95_ms']:>12.1f}{after['p95_ms']:>12.1f}{p95_change:>+9.0%}"
+              f"{before['rps']:>12.1f}{after['rps']:>12.1f}{rps_change:>+9.0%}")
+        if p95_change > max_regression or rps_change < -max_regression:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive every API route under concurrent load and record latency percentiles')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--routes', help='Comma separated subset of: ' + ', '.join(route.name for route in ROUTES))
+    parser.add_argument('--output', help='Where to write the JSON results (default: results/<commit>-<time>.json)')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='Fractional p95/throughput change that counts as a regression with --compare')
+    args = parser.parse_args()
+
+    routes = select_routes(args.routes)
+
+    results = run_benchmark(args.base_url, args.concurrency, args.duration, routes, args.warmup)
+    print_results(results)
+
+    output = args.output
+    if output is None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{results['meta']['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.max_regression)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            raise SystemExit(1)
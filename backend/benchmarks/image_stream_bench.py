@@ -0,0 +1,167 @@
+import argparse
+import http.client
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(current_dir, '..'))
+
+import image_store
+from compare_servers import BACKEND_DIR, wait_until_ready
+from synthetic_catalog import build_catalog
+
+DEFAULT_OUTPUT_DIR = os.path.join(current_dir, 'data', 'large-images')
+DEFAULT_SIZES_MB = [1, 10, 50]
+READ_SIZE = 64 * 1024
+SERVERS = {
+    # One worker so every download lands in the process being measured
+    'wsgi': lambda port, threads: ['gunicorn', '--workers', '1', '--worker-class', 'gthread', '--threads', str(threads),
+                                   '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+    'asgi': lambda port, threads: ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port), '--no-access-log'],
+}
+
+
+def build_large_image_catalog(output_dir, sizes_mb):
+    # A small synthetic catalog whose first images are replaced by slabs of the given sizes. The bytes are
+    # written through blob I/O too, so building a 50 MB slab doesn't need 50 MB here.
+    db_path, index_path = build_catalog(max(len(sizes_mb), 20), output_dir)
+    conn = sqlite3.connect(db_path)
+    for image_id, size_mb in enumerate(sizes_mb, start=1):
+        size = size_mb * 1024 * 1024
+        conn.execute("UPDATE image_blobs SET image = zeroblob(?) WHERE id = ?", (size, image_id))
+        conn.commit()
+        with conn.blobopen('image_blobs', 'image', image_id) as blob:
+            for offset in range(0, size, READ_SIZE):
+                blob.write(os.urandom(min(READ_SIZE, size - offset)))
+        conn.commit()
+    image_store.backfill(conn)
+    conn.commit()
+    conn.close()
+    return db_path, index_path
+
+
+def rss_kib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def worker_pid(pid):
+    # gunicorn's master forks the worker; uvicorn without --workers serves from the process itself
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = f.read().split()
+    except OSError:
+        children = []
+    return int(children[0]) if children else pid
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.02):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, rss_kib(self.pid))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        return self.peak
+
+
+def download(port, image_id, client_delay):
+    # Reads like a client on a slow link, so every download is in flight at the same time
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    conn.request('GET', f'/api/image/{image_id}')
+    response = conn.getresponse()
+    received = 0
+    while True:
+        chunk = response.read(READ_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+        if client_delay:
+            time.sleep(client_delay)
+    conn.close()
+    return received
+
+
+def measure(port, pid, image_id, concurrency, client_delay):
+    download(port, image_id, 0)
+    idle = rss_kib(pid)
+    sampler = RssSampler(pid)
+    sampler.start()
+    received = []
+    start = time.perf_counter()
+    threads = [threading.Thread(target=lambda: received.append(download(port, image_id, client_delay)))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    peak = sampler.stop()
+    return {
+        'idle_rss_mb': idle / 1024,
+        'peak_rss_mb': peak / 1024,
+        'growth_mb': (peak - idle) / 1024,
+        'throughput_mb_s': sum(received) / elapsed / 1e6,
+    }
+
+
+def run(port, pid, sizes_mb, concurrency, client_delay):
+    results = []
+    for image_id, size_mb in enumerate(sizes_mb, start=1):
+        result = measure(port, pid, image_id, concurrency, client_delay)
+        result.update({'image_mb': size_mb, 'concurrency': concurrency})
+        results.append(result)
+        print(f"{size_mb:>9} MB{concurrency:>13}{result['idle_rss_mb']:>12.1f}{result['peak_rss_mb']:>12.1f}"
+              f"{result['growth_mb']:>12.1f}{result['throughput_mb_s']:>12.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Server memory while many clients download large images at once')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES_MB)), help='Slab image sizes in MB')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--client-delay', type=float, default=0.002, help='Seconds each client sleeps per 64 KB read')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='wsgi')
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--pid', type=int, help='Measure an already running server (e.g. an older checkout) instead')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+    sizes_mb = [int(size) for size in args.sizes.split(',')]
+
+    process = None
+    if args.pid is None:
+        db_path, index_path = build_large_image_catalog(args.output_dir, sizes_mb)
+        env = dict(os.environ, MARBLE_DB_PATH=db_path, MARBLE_INDEX_PATH=index_path)
+        process = subprocess.Popen(SERVERS[args.server](args.port, args.concurrency), cwd=BACKEND_DIR, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(args.port)
+        pid = worker_pid(process.pid) if process else args.pid
+        print(f"{'image':>12}{'concurrency':>13}{'idle MB':>12}{'peak MB':>12}{'growth MB':>12}{'MB/s':>12}")
+        results = run(args.port, pid, sizes_mb, args.concurrency, args.client_delay)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
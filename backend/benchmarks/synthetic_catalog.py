@@ -0,0 +1,198 @@
+import argparse
+import io
+import os
+import random
+import sqlite3
+import sys
+import time
+import faiss
+import numpy as np
+from PIL import Image, ImageDraw
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(current_dir, '..'))
+
+import migrate
+
+NAMES_PATH = os.path.join(current_dir, '..', 'marble_names.txt')
+DEFAULT_OUTPUT_DIR = os.path.join(current_dir, 'data')
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+DIMENSION = 2048
+# Images are drawn from a small pool so a 100k catalog doesn't take gigabytes
+IMAGE_POOL_SIZE = 64
+IMAGE_SIZE = 256
+BATCH_SIZE = 5_000
+
+# Same schema as the production catalog, see README.md
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS "images" (
+        "id"    INTEGER,
+        "image" BLOB,
+        "marbleName"    TEXT,
+        "marbleOrigin"  TEXT,
+        "fileName"      TEXT,
+        "stainResistance"       TEXT,
+        "costRange"     DECIMAL(10, 2),
+        "stoneColor"    TEXT,
+        "featured"      INTEGER DEFAULT 0,
+        "description"   TEXT,
+        "thermalExpansion"      REAL,
+        "cleaningTips"  TEXT, Rarity INTEGER CHECK(Rarity >= 1 AND Rarity <= 10), associatedVendor TEXT,
+        PRIMARY KEY("id")
+);
+CREATE TABLE vendors (id INTEGER PRIMARY KEY AUTOINCREMENT, location TEXT NOT NULL,  INTEGER, contact TEXT, vendorLogo BLOB, name TEXT, url TEXT);
+CREATE TABLE marble_vendor_association (
+    marble_id INTEGER,
+    vendor_id INTEGER,
+    FOREIGN KEY (marble_id) REFERENCES [marble_images-2](id),
+    FOREIGN KEY (vendor_id) REFERENCES vendors(id),
+    PRIMARY KEY (marble_id, vendor_id)
+);
+CREATE VIRTUAL TABLE images_fts USING fts5(
+    id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion,
+    content='images', content_rowid='id'
+);
+CREATE TRIGGER images_ai AFTER INSERT ON images BEGIN
+  INSERT INTO images_fts(id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion)
+  VALUES (new.id, new.marbleName, new.marbleOrigin, new.fileName, new.stainResistance, new.costRange, new.stoneColor, new.description, new.thermalExpansion);
+END;
+CREATE TRIGGER images_ad AFTER DELETE ON images BEGIN
+  INSERT INTO images_fts(images_fts, id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion)
+  VALUES('delete', old.id, old.marbleName, old.marbleOrigin, old.fileName, old.stainResistance, old.costRange, old.stoneColor, old.description, old.thermalExpansion);
+END;
+CREATE TRIGGER images_au AFTER UPDATE ON images BEGIN
+  INSERT INTO images_fts(images_fts, id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion)
+  VALUES('delete', old.id, old.marbleName, old.marbleOrigin, old.fileName, old.stainResistance, old.costRange, old.stoneColor, old.description, old.thermalExpansion);
+  INSERT INTO images_fts(id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion)
+  VALUES (new.id, new.marbleName, new.marbleOrigin, new.fileName, new.stainResistance, new.costRange, new.stoneColor, new.description, new.thermalExpansion);
+END;
+"""
+
+ORIGINS = ['Italy', 'Spain', 'Portugal', 'Greece', 'Turkey', 'India', 'Brazil', 'China', 'Iran', 'Egypt', 'Vietnam', 'USA']
+COLORS = ['White', 'Grey', 'Black', 'Beige', 'Cream', 'Green', 'Red', 'Brown', 'Blue', 'Pink', 'Gold']
+STAIN_RESISTANCE = ['Low', 'Medium', 'High']
+VEIN_WORDS = ['veining', 'swirls', 'flecks', 'clouding', 'streaks', 'crystals', 'fossils']
+CITIES = ['Boston', 'New York', 'Chicago', 'Miami', 'Dallas', 'Denver', 'Seattle', 'Atlanta']
+
+
+def catalog_paths(output_dir, size):
+    return (os.path.join(output_dir, f'marble_images-{size}.db'),
+            os.path.join(output_dir, f'marble_image_index-{size}.faiss'))
+
+
+def load_marble_names():
+    with open(NAMES_PATH) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def marble_image(rng):
+    # A coloured slab with a few dark veins, saved as PNG like the real catalog
+    base = tuple(rng.randint(120, 255) for _ in range(3))
+    img = Image.new('RGB', (IMAGE_SIZE, IMAGE_SIZE), base)
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(3, 8)):
+        points = [(rng.randint(0, IMAGE_SIZE), rng.randint(0, IMAGE_SIZE)) for _ in range(4)]
+        shade = tuple(max(c - rng.randint(40, 120), 0) for c in base)
+        draw.line(points, fill=shade, width=rng.randint(1, 4))
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def marble_rows(count, rng, names):
+    images = [marble_image(rng) for _ in range(IMAGE_POOL_SIZE)]
+    for marble_id in range(1, count + 1):
+        # Real names repeat with a suffix once the list runs out, which keeps FTS terms realistic
+        name = names[(marble_id - 1) % len(names)]
+        if marble_id > len(names):
+            name = f"{name} {marble_id // len(names)}"
+        color = rng.choice(COLORS)
+        origin = rng.choice(ORIGINS)
+        description = (f"{color} marble from {origin} with {rng.choice(VEIN_WORDS)} "
+                       f"and {rng.choice(VEIN_WORDS)}, quarried near {rng.choice(CITIES)}.")
+        yield (
+            marble_id,
+            images[marble_id % IMAGE_POOL_SIZE],
+            name,
+            origin,
+            f"{name.replace(' ', '_')}.png",
+            rng.choice(STAIN_RESISTANCE),
+            f"${rng.randint(40, 400)}-${rng.randint(400, 900)}",
+            color,
+            1 if marble_id <= 3 else 0,
+            description,
+            round(rng.uniform(4.0, 12.0), 2),
+            'Clean with pH-neutral stone soap.',
+            rng.randint(1, 10),
+            None,
+        )
+
+
+def build_database(db_path, size, seed=0):
+    rng = random.Random(seed)
+    names = load_marble_names()
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+
+    rows = marble_rows(size, rng, names)
+    while True:
+        batch = [row for _, row in zip(range(BATCH_SIZE), rows)]
+        if not batch:
+            break
+        conn.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+    vendor_count = max(size // 50, 5)
+    logo = marble_image(rng)
+    conn.executemany(
+        "INSERT INTO vendors (id, location, contact, vendorLogo, name, url) VALUES (?, ?, ?, ?, ?, ?)",
+        [(vendor_id, rng.choice(CITIES), f"sales{vendor_id}@example.com", logo if vendor_id % 4 == 0 else None,
+          f"Stone Supplier {vendor_id}", f"https://vendor{vendor_id}.example.com")
+         for vendor_id in range(1, vendor_count + 1)])
+    conn.executemany(
+        "INSERT OR IGNORE INTO marble_vendor_association (marble_id, vendor_id) VALUES (?, ?)",
+        [(marble_id, rng.randint(1, vendor_count))
+         for marble_id in range(1, size + 1) for _ in range(rng.randint(1, 3))])
+    conn.commit()
+    # Written in the original layout, then brought up to date the same way as the production catalog
+    migrate.migrate(conn)
+    conn.close()
+
+
+def build_index(index_path, size, seed=0):
+    # Unit vectors in an IndexFlatL2, the same layout rebuild_combined_index writes
+    rng = np.random.default_rng(seed)
+    index = faiss.IndexFlatL2(DIMENSION)
+    for start in range(0, size, BATCH_SIZE):
+        vectors = rng.random((min(BATCH_SIZE, size - start), DIMENSION), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index.add(vectors)
+    faiss.write_index(index, index_path)
+
+
+def build_catalog(size, output_dir=DEFAULT_OUTPUT_DIR, seed=0):
+    os.makedirs(output_dir, exist_ok=True)
+    db_path, index_path = catalog_paths(output_dir, size)
+    start = time.perf_counter()
+    build_database(db_path, size, seed)
+    build_index(index_path, size, seed)
+    print(f"Built {size} marbles in {time.perf_counter() - start:.1f}s")
+    print(f"  MARBLE_DB_PATH={db_path}")
+    print(f"  MARBLE_INDEX_PATH={index_path}")
+    return db_path, index_path
+
+
+def parse_size(value):
+    if value in SIZES:
+        return SIZES[value]
+    return int(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a synthetic marble catalog and FAISS index for benchmarking')
+    parser.add_argument('--size', type=parse_size, default='1k', help='Number of marbles: 1k, 10k, 100k or a count')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    build_catalog(args.size, args.output_dir, args.seed)
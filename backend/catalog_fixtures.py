@@ -0,0 +1,23 @@
+import sqlite3
+
+import migrate
+from benchmarks.synthetic_catalog import SCHEMA
+
+
+def insert_rows(conn, table, rows):
+    for row in rows:
+        conn.execute(f"INSERT INTO {table} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})", tuple(row.values()))
+
+
+def make_catalog(conn, images=(), vendors=(), migrated=True):
+    # The README schema with the given rows (dicts of column values), brought up to date the same way as the
+    # production catalog unless migrated=False. conn may be a path or a connection; the connection is returned.
+    if isinstance(conn, str):
+        conn = sqlite3.connect(conn)
+    conn.executescript(SCHEMA)
+    insert_rows(conn, 'images', images)
+    insert_rows(conn, 'vendors', vendors)
+    conn.commit()
+    if migrated:
+        migrate.migrate(conn, vacuum=False)
+    return conn
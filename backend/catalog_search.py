@@ -0,0 +1,78 @@
+import re
+import sqlite3
+from array import array
+from functools import lru_cache
+
+# Words only: quotes, operators, column filters and other FTS5 syntax in user input never reach MATCH
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TOKENS = 8
+# The trigram tokenizer can't match anything shorter than three characters
+TRIGRAM_MIN_LENGTH = 3
+# bm25 weight per images_fts column: id, marbleName, marbleOrigin, fileName, stainResistance, costRange,
+# stoneColor, description, thermalExpansion. A hit in the name outranks the origin, which outranks the description.
+COLUMN_WEIGHTS = (0.0, 10.0, 5.0, 1.0, 1.0, 1.0, 2.0, 3.0, 1.0)
+TRIGRAM_WEIGHTS = (2.0, 1.0)
+# Hit lists for this many recent queries are kept per worker, so paging doesn't rerun the search
+CACHE_SIZE = 128
+
+FTS_COLUMNS = ('id', 'marbleName', 'marbleOrigin', 'fileName', 'stainResistance', 'costRange', 'stoneColor',
+               'description', 'thermalExpansion')
+TRIGRAM_COLUMNS = ('marbleName', 'marbleOrigin')
+
+
+def search_tokens(search_term):
+    return [token.lower() for token in TOKEN_RE.findall(search_term)][:MAX_TOKENS]
+
+
+def compile_match(tokens):
+    # Every word must appear, each as a prefix ("calac" finds Calacatta); prefix='2 3' keeps short prefixes cheap
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def compile_trigram_match(tokens):
+    # Substrings anywhere in the name or origin ("arrar" finds Carrara)
+    tokens = [token for token in tokens if len(token) >= TRIGRAM_MIN_LENGTH]
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"' for token in tokens)
+
+
+def search_version(conn):
+    # Bumped by the images triggers on every change that affects search, so cached hits can't go stale
+    return conn.execute("SELECT value FROM catalog_meta WHERE key = 'search_version'").fetchone()[0]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_hits(db_path, version, tokens):
+    # Every matching id in rank order; array('q') keeps a 100k-hit list under a megabyte
+    conn = sqlite3.connect(db_path)
+    try:
+        hits = array('q', (row[0] for row in conn.execute(
+            f"SELECT rowid FROM images_fts WHERE images_fts MATCH ? ORDER BY bm25(images_fts, {', '.join(map(str, COLUMN_WEIGHTS))})",
+            (compile_match(tokens),))))
+        trigram_match = compile_trigram_match(tokens)
+        if not hits and trigram_match:
+            hits = array('q', (row[0] for row in conn.execute(
+                f"SELECT rowid FROM images_trigram WHERE images_trigram MATCH ? ORDER BY bm25(images_trigram, {', '.join(map(str, TRIGRAM_WEIGHTS))})",
+                (trigram_match,))))
+        return hits
+    finally:
+        conn.close()
+
+
+def search_page(db_path, search_term, limit, offset):
+    # Returns (ids on this page, total hits)
+    tokens = tuple(search_tokens(search_term))
+    if not tokens:
+        return [], 0
+    conn = sqlite3.connect(db_path)
+    try:
+        version = search_version(conn)
+    finally:
+        conn.close()
+    hits = cached_hits(db_path, version, tokens)
+    # Like SQL OFFSET, a negative offset (page=0) starts at the first hit
+    offset = max(offset, 0)
+    return hits[offset:offset + limit].tolist(), len(hits)
@@ -0,0 +1,165 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+EVENTS_DB_PATH = os.environ.get('MARBLE_EVENTS_DB_PATH', os.path.join(current_dir, 'marble_events.db'))
+
+# Columns stored for every tracking event; anything else the client sends ends up in `extra`
+EVENT_COLUMNS = (
+    'ts', 'event', 'page', 'marble_id', 'marble_name', 'ip', 'user_agent', 'referrer',
+    'screen', 'color_depth', 'plugins', 'time_on_page', 'scroll_depth', 'extra',
+)
+
+# Events dropped while the writer's queue is full are logged on the first drop and every this many after
+DROP_LOG_EVERY = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def connect_events_db(db_path=EVENTS_DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=30)
+    # WAL lets the dashboard read while every gunicorn worker appends
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            event TEXT,
+            page TEXT,
+            marble_id TEXT,
+            marble_name TEXT,
+            ip TEXT,
+            user_agent TEXT,
+            referrer TEXT,
+            screen TEXT,
+            color_depth TEXT,
+            plugins TEXT,
+            time_on_page TEXT,
+            scroll_depth TEXT,
+            extra TEXT
+        )
+    """)
+    return conn
+
+
+class EventSink:
+    def __init__(self, db_path=EVENTS_DB_PATH, max_queue=50000, batch_size=500, flush_interval=1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        # Called from the request thread: no formatting, no I/O, never blocks
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            # The first drop, then one line per thousand, so a flood of events doesn't become a flood of logs
+            if self.dropped % DROP_LOG_EVERY == 1:
+                logger.warning(f"Event queue full, {self.dropped} events dropped by this worker so far")
+
+    def _ensure_started(self):
+        # gunicorn forks workers after import, so each process needs its own writer thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._thread = threading.Thread(target=self._run, name='event-sink-writer', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        conn = connect_events_db(self.db_path)
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(conn, batch)
+            if stop:
+                conn.close()
+                return
+
+    def _write(self, conn, batch):
+        rows = []
+        for event in batch:
+            event = dict(event)
+            extra = event.pop('extra', None) or {}
+            row = [event.pop(column, None) for column in EVENT_COLUMNS[:-1]]
+            extra.update(event)
+            row.append(json.dumps(extra, default=str) if extra else None)
+            rows.append(row)
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(EVENT_COLUMNS))})",
+                    rows)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(rows)} events: {e}")
+
+    def close(self, timeout=5):
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+event_sink = EventSink()
+
+
+def record_event(event_type, **fields):
+    fields['ts'] = time.time()
+    fields['event'] = event_type
+    event_sink.record(fields)
+
+
+def record_client_event(event_data, ip, user_agent, referrer):
+    # The body the frontend and the admin dashboard POST to /log_event: {"event_type": ..., "data": {...}}.
+    # Shared by the Flask, ASGI and admin handlers; raises ValueError for a body that isn't a JSON object.
+    if event_data is None:
+        event_data = {}
+    if not isinstance(event_data, dict):
+        raise ValueError("Event body must be a JSON object")
+    data = event_data.get('data')
+    data = dict(data) if isinstance(data, dict) else {'data': data}
+    record_event(
+        event_data.get('event_type'),
+        page=data.pop('route', None) or data.pop('page', None),
+        marble_id=data.pop('marble_id', None),
+        marble_name=data.pop('marble_name', None),
+        ip=ip,
+        user_agent=user_agent,
+        referrer=referrer,
+        extra=data,
+    )
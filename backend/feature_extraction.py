@@ -0,0 +1,173 @@
+import io
+import os
+import time
+import numpy as np
+import torch
+from PIL import Image, ImageEnhance, ImageFilter, UnidentifiedImageError
+from torchvision import transforms, models
+from torchvision.models import ResNet50_Weights
+
+# Upload limits: reject oversized files before decoding and oversized images before allocating pixels
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+MAX_UPLOAD_PIXELS = int(os.environ.get('MAX_UPLOAD_PIXELS', 50_000_000))
+# Size the upload pipeline works at; the feature extractor only ever needs 256x256
+FEATURE_IMAGE_SIZE = 256
+RESNET_IMAGE_SIZE = 224
+HISTOGRAM_BINS = 32
+FEATURE_DIMENSION = 2048
+# Combine features with emphasis on color
+COLOR_WEIGHT = 0.8
+
+# Define image transformation
+transform = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+])
+
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSE_METHODS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def load_resnet_model(device):
+    # ResNet50 without its classifier, so the output is the 2048-d pooled feature
+    model = models.resnet50(weights=ResNet50_Weights.IMAGENET1K_V1)
+    model = torch.nn.Sequential(*list(model.children())[:-1])
+    model.eval()
+    model.to(device)
+    return model
+
+def decode_upload(image_data, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_UPLOAD_PIXELS, target_size=FEATURE_IMAGE_SIZE):
+    if max_bytes is not None and len(image_data) > max_bytes:
+        raise UploadRejected(f"Image is larger than {max_bytes // (1024 * 1024)} MB", 413)
+
+    try:
+        img = Image.open(io.BytesIO(image_data))
+    except UnidentifiedImageError:
+        raise UploadRejected("Unsupported image format")
+
+    # Only the header has been read so far, so this check happens before any pixel allocation
+    width, height = img.size
+    if max_pixels is not None and width * height > max_pixels:
+        raise UploadRejected(f"Image has {width * height} pixels, the limit is {max_pixels}", 413)
+
+    # Read the orientation now, the reduced copy below no longer carries the EXIF block
+    orientation = img.getexif().get(EXIF_ORIENTATION_TAG)
+
+    # JPEG can decode straight to a 1/2, 1/4 or 1/8 scale, which skips most of the IDCT work
+    if img.format == 'JPEG':
+        img.draft('RGB', (target_size, target_size))
+    img = img.convert('RGB')
+
+    # Shrink by an integer factor while both sides stay at or above the target size
+    factor = min(img.size) // target_size
+    if factor >= 2:
+        img = img.reduce(factor)
+
+    # Phone photos are often stored sideways with an EXIF orientation tag
+    if orientation in EXIF_TRANSPOSE_METHODS:
+        img = img.transpose(EXIF_TRANSPOSE_METHODS[orientation])
+    return img
+
+def preprocess_image(image):
+    # Convert to RGB if not already
+    image = image.convert('RGB')
+
+    # Enhance contrast
+    enhancer = ImageEnhance.Contrast(image)
+    image = enhancer.enhance(1.0)  # Adjust this value as needed
+
+    # Sharpen the image
+    image = image.filter(ImageFilter.SHARPEN)
+
+    # Apply a slight Gaussian blur to reduce noise
+    image = image.filter(ImageFilter.GaussianBlur(radius=0.5))
+
+    # Convert to numpy array
+    img_array = np.array(image)
+
+    # Normalize pixel values
+    img_array = img_array / 255.0
+
+    # Clip values to ensure they're in [0, 1] range
+    img_array = np.clip(img_array, 0, 1)
+
+    # Convert back to PIL Image
+    processed = Image.fromarray((img_array * 255).astype(np.uint8))
+
+    return processed
+
+def color_histogram(image):
+    # Calculate color histogram
+    img_array = np.array(image)
+    hist_r = np.histogram(img_array[:,:,0], bins=HISTOGRAM_BINS, range=(0, 256))[0]
+    hist_g = np.histogram(img_array[:,:,1], bins=HISTOGRAM_BINS, range=(0, 256))[0]
+    hist_b = np.histogram(img_array[:,:,2], bins=HISTOGRAM_BINS, range=(0, 256))[0]
+
+    # Concatenate histograms
+    color_features = np.concatenate([hist_r, hist_g, hist_b])
+
+    # Normalize the color features
+    return color_features / np.sum(color_features)
+
+def resnet_features(model, images, device):
+    # One forward pass for the whole list; returns one 2048-d row per image
+    batch = torch.stack([transform(img.resize((RESNET_IMAGE_SIZE, RESNET_IMAGE_SIZE))) for img in images]).to(device)
+    with torch.no_grad():
+        features = model(batch)
+    return features.reshape(len(images), -1).cpu().numpy()
+
+def combine_features(color_features, resnet_features):
+    resnet_weight = 1 - COLOR_WEIGHT
+
+    # Resize color_features to match resnet_features size
+    color_features_resized = np.zeros(FEATURE_DIMENSION)
+    color_features_resized[:len(color_features)] = color_features
+
+    combined_features = (COLOR_WEIGHT * color_features_resized) + (resnet_weight * resnet_features)
+
+    # Normalize the combined features
+    return combined_features / np.linalg.norm(combined_features)
+
+def extract_features(image_data, model, device, timings=None, enforce_limits=True):
+    if timings is None:
+        timings = {}
+
+    start = time.perf_counter()
+    if enforce_limits:
+        img = decode_upload(image_data)
+    else:
+        img = decode_upload(image_data, max_bytes=None, max_pixels=None)
+    # Downscale before filtering so sharpen/blur run on 256x256 pixels instead of the full photo
+    img = img.resize((FEATURE_IMAGE_SIZE, FEATURE_IMAGE_SIZE))
+    timings['decode'] = time.perf_counter() - start
+
+    # Preprocess the image
+    start = time.perf_counter()
+    preprocessed_img = preprocess_image(img)
+    timings['preprocess'] = time.perf_counter() - start
+
+    # Extract color histogram features
+    start = time.perf_counter()
+    color_features = color_histogram(preprocessed_img)
+    timings['histogram'] = time.perf_counter() - start
+
+    # Extract ResNet features
+    start = time.perf_counter()
+    resnet = resnet_features(model, [preprocessed_img], device)[0]
+    timings['resnet'] = time.perf_counter() - start
+
+    return combine_features(color_features, resnet)
@@ -0,0 +1,110 @@
+import argparse
+import sqlite3
+from functools import lru_cache
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+from catalog_search import search_version
+from migrate import DEFAULT_DB_PATH
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# WRatio out of 100; "carara" scores 75 against Bianco Carrara and "nero marqina" 96 against Nero Marquina
+DEFAULT_SCORE_CUTOFF = 70
+MAX_QUERY_LENGTH = 64
+KINDS = ('marble', 'vendor')
+
+
+class FuzzyMatcher:
+    # Choices are lowercased and stripped of punctuation once when the matcher is built, so each lookup only
+    # processes the query and hands rapidfuzz plain strings
+
+    def __init__(self, choices):
+        # choices: (text, kind, id)
+        self.choices = choices
+        self.processed = [default_process(text) for text, _, _ in choices]
+
+    def match(self, query, limit=DEFAULT_LIMIT, score_cutoff=DEFAULT_SCORE_CUTOFF, scorer=fuzz.WRatio):
+        # [(choice, score)] best first; limit=None returns everything above the cutoff
+        query = default_process(query[:MAX_QUERY_LENGTH])
+        if not query:
+            return []
+        return [(self.choices[position], score) for _, score, position in process.extract(
+            query, self.processed, scorer=scorer, processor=None, limit=limit, score_cutoff=score_cutoff)]
+
+    def match_many(self, queries, limit=DEFAULT_LIMIT, score_cutoff=DEFAULT_SCORE_CUTOFF, scorer=fuzz.WRatio, workers=-1):
+        # One score matrix for all queries, computed on every core; scores under the cutoff come back as 0
+        if not queries or not self.choices:
+            return [[] for _ in queries]
+        scores = process.cdist([default_process(query[:MAX_QUERY_LENGTH]) for query in queries], self.processed,
+                               scorer=scorer, processor=None, score_cutoff=score_cutoff, workers=workers,
+                               dtype=np.float64)
+        results = []
+        for row in scores:
+            best = top_positions(row, len(row) if limit is None else limit)
+            results.append([(self.choices[position], float(row[position])) for position in best
+                            if row[position] > 0])
+        return results
+
+
+def top_positions(row, limit):
+    # argpartition finds the `limit`th best score without sorting the whole row. Everything scoring at least that
+    # much is sorted, ties in choice order like process.extract.
+    if limit < len(row):
+        top = np.flatnonzero(row >= row[np.argpartition(-row, limit - 1)[limit - 1]])
+    else:
+        top = np.arange(len(row))
+    return top[np.lexsort((top, -row[top]))][:limit]
+
+
+def load_choices(conn, kinds=KINDS):
+    choices = []
+    if 'marble' in kinds:
+        # Marbles that share a name are one choice, pointing at the first of them
+        choices.extend((name, 'marble', marble_id) for marble_id, name in conn.execute(
+            "SELECT MIN(id), marbleName FROM images WHERE marbleName IS NOT NULL GROUP BY marbleName"))
+    if 'vendor' in kinds:
+        choices.extend((name, 'vendor', vendor_id) for vendor_id, name in conn.execute(
+            "SELECT id, name FROM vendors WHERE name IS NOT NULL"))
+    return choices
+
+
+@lru_cache(maxsize=1)
+def cached_matcher(db_path, version):
+    # Rebuilt when search_version moves, which the images and vendors triggers bump on every name change
+    conn = sqlite3.connect(db_path)
+    try:
+        return FuzzyMatcher(load_choices(conn))
+    finally:
+        conn.close()
+
+
+def catalog_matcher(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        version = search_version(conn)
+    finally:
+        conn.close()
+    return cached_matcher(db_path, version)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fuzzy-match names against the marbles and vendors in the catalog')
+    parser.add_argument('queries', nargs='+')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--kind', choices=KINDS, help='Only match marble or vendor names')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    parser.add_argument('--cutoff', type=float, default=DEFAULT_SCORE_CUTOFF, help='Lowest score (0-100) to print')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    matcher = FuzzyMatcher(load_choices(conn, (args.kind,) if args.kind else KINDS))
+    conn.close()
+    for query, matches in zip(args.queries, matcher.match_many(args.queries, args.limit, args.cutoff)):
+        print(query)
+        for (text, kind, choice_id), score in matches:
+            print(f"    {score:5.1f}  {kind:<6}  {choice_id:>6}  {text}")
+        if not matches:
+            print("    no matches")
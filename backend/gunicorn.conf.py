@@ -0,0 +1,12 @@
+# Picked up by gunicorn from the working directory: `gunicorn --workers=4 --bind=0.0.0.0:8000 wsgi:app`
+import metrics
+
+
+def on_starting(server):
+    # Histogram files left behind by the previous run's workers
+    metrics.clear_worker_files()
+
+
+def child_exit(server, worker):
+    # A replaced worker's counts leave /metrics with it instead of being summed forever
+    metrics.remove_worker_file(worker.pid)
@@ -0,0 +1,154 @@
+import hashlib
+import sqlite3
+from werkzeug.http import parse_range_header
+
+# URLs carry the first 16 hex digits of the sha256; the full digest is the ETag
+URL_HASH_LENGTH = 16
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+# Unversioned URLs may change content, so caches revalidate with the ETag every time
+REVALIDATE_CACHE = 'public, no-cache'
+BACKFILL_BATCH_SIZE = 200
+# Bytes read from SQLite per chunk when streaming an image, so a request holds this much whatever the slab size
+STREAM_CHUNK_SIZE = 64 * 1024
+# Page cache for streaming connections; blob pages are read once, so a big cache would only hold copies of them
+STREAM_CACHE_KIB = 256
+
+
+def image_url(image_id, image_hash):
+    # Hash-versioned URLs are cached forever; rows that haven't been hashed yet fall back to the plain URL
+    if image_hash:
+        return f'/api/image/{image_id}/{image_hash[:URL_HASH_LENGTH]}'
+    return f'/api/image/{image_id}'
+
+
+def matches_version(image_hash, version):
+    return len(version) >= URL_HASH_LENGTH and image_hash.startswith(version)
+
+
+def query_image_version(conn, image_id):
+    # length() of a BLOB comes from the record header, so neither the hash nor the size reads the image itself
+    row = conn.execute("""
+        SELECT images.imageHash, length(image_blobs.image)
+        FROM images LEFT JOIN image_blobs ON image_blobs.id = images.id
+        WHERE images.id = ?
+    """, (image_id,)).fetchone()
+    if row is None or row[1] is None:
+        return None
+    image_hash, size = row
+    if image_hash is None:
+        # Not stored yet: hash it for this response only. GETs never write; `python migrate.py` stores it.
+        image_hash = blob_hash(conn, image_id)
+    return image_hash, size
+
+
+def blob_hash(conn, image_id, chunk_size=STREAM_CHUNK_SIZE):
+    # Hashes the stored image chunk by chunk, so large slabs are never loaded whole
+    digest = hashlib.sha256()
+    with conn.blobopen('image_blobs', 'image', image_id, readonly=True) as blob:
+        for chunk in iter(lambda: blob.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backfill(conn, batch_size=BACKFILL_BATCH_SIZE):
+    # Hashes every image that has no hash yet; the caller commits
+    ids = [row[0] for row in conn.execute("""
+        SELECT images.id FROM images JOIN image_blobs ON image_blobs.id = images.id
+        WHERE images.imageHash IS NULL
+    """)]
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        conn.executemany("UPDATE images SET imageHash = ? WHERE id = ?",
+                         [(blob_hash(conn, image_id), image_id) for image_id in batch])
+    return len(ids)
+
+
+def write_image(conn, image_id, data):
+    # Stores an image and its hash in one transaction, so the versioned URL moves with the bytes. The image_blobs
+    # triggers clear the hash first; writes that bypass this helper keep relying on that and `python migrate.py`.
+    with conn:
+        conn.execute("INSERT INTO image_blobs (id, image) VALUES (?, ?) "
+                     "ON CONFLICT(id) DO UPDATE SET image = excluded.image", (image_id, data))
+        conn.execute("UPDATE images SET imageHash = ? WHERE id = ?", (hashlib.sha256(data).hexdigest(), image_id))
+
+
+class BlobStream:
+    # WSGI iterable over one image, read with SQLite incremental blob I/O instead of loading the whole BLOB.
+    # The blob handle keeps a read transaction open until the download finishes, which is why migrate.py puts
+    # the catalog in WAL mode: writers carry on while images stream.
+
+    def __init__(self, conn, blob, chunk_size=STREAM_CHUNK_SIZE):
+        self.conn = conn
+        self.blob = blob
+        self.size = len(blob)
+        self.start = 0
+        self.stop = self.size
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def open(cls, db_path, image_id, chunk_size=STREAM_CHUNK_SIZE):
+        # The ASGI server pulls chunks from whichever pool thread is free, one at a time
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute(f"PRAGMA cache_size = -{STREAM_CACHE_KIB}")
+        try:
+            blob = conn.blobopen('image_blobs', 'image', image_id, readonly=True)
+        except sqlite3.OperationalError:
+            # No such row
+            conn.close()
+            return None
+        return cls(conn, blob, chunk_size)
+
+    def select(self, start, stop):
+        self.start, self.stop = start, stop
+
+    @property
+    def length(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        try:
+            self.blob.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = self.blob.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        # Called by the WSGI server when the response ends, including when the client disconnects early
+        if self.conn is not None:
+            self.blob.close()
+            self.conn.close()
+            self.conn = None
+
+
+def byte_range(range_header, if_range, image_hash, size):
+    # Returns None for a full response, (start, stop) for a 206 and False when the range can't be satisfied.
+    # A stale If-Range means the client's partial copy is from other bytes, so it gets the whole image again.
+    if not range_header or (if_range and if_range.strip('"') != image_hash):
+        return None
+    parsed = parse_range_header(range_header)
+    # Multipart responses aren't worth it for PNGs; ignoring the header and sending everything is allowed
+    if parsed is None or len(parsed.ranges) != 1:
+        return None
+    return parsed.range_for_length(size) or False
+
+
+def image_headers(image_hash, cache_control, size, requested):
+    # Status and headers for an image response, shared by the Flask and ASGI routes; requested is from byte_range
+    headers = {'Cache-Control': cache_control, 'ETag': f'"{image_hash}"', 'Accept-Ranges': 'bytes'}
+    if requested is False:
+        headers['Content-Range'] = f'bytes */{size}'
+        return 416, headers
+    if requested is None:
+        headers['Content-Length'] = str(size)
+        return 200, headers
+    start, stop = requested
+    headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    headers['Content-Length'] = str(stop - start)
+    return 206, headers
+
@@ -0,0 +1,73 @@
+import json
+import time
+
+from event_sink import EVENTS_DB_PATH, connect_events_db
+from log_parser import EVENT_FIELD_NAMES
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Same field order as the old tracking log lines
+LOG_FIELDS = ('ip', 'user_agent', 'referrer', 'event', 'page', 'marble_id', 'marble_name',
+              'screen', 'color_depth', 'plugins', 'time_on_page', 'scroll_depth')
+
+
+def decode_cursor(cursor):
+    # A cursor is the id of an events row; pages run strictly before or after it
+    try:
+        return int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def format_event(row):
+    event_id, ts, extra = row[0], row[1], row[-1]
+    fields = [f"{EVENT_FIELD_NAMES[name]}: {value}" for name, value in zip(LOG_FIELDS, row[2:-1]) if value is not None]
+    if extra:
+        try:
+            fields.extend(f"{key}: {value}" for key, value in json.loads(extra).items())
+        except (ValueError, AttributeError):
+            fields.append(f"Extra: {extra}")
+    return {'id': event_id, 'timestamp': time.strftime(TIMESTAMP_FORMAT, time.localtime(ts)), 'data': ', '.join(fields)}
+
+
+def read_logs_before(cursor=None, limit=100, event=None, marble_id=None, after=None, db_path=EVENTS_DB_PATH):
+    # Newest events first from the events table, `limit` at a time. `before` pages back through history;
+    # `after` fetches what arrived since the newest row a client already shows, so a refresh keeps its place.
+    # Text logs from before the events table are imported with `python analytics_store.py backfill-logs`.
+    where, params = [], []
+    if event:
+        where.append("event = ?")
+        params.append(event)
+    if marble_id:
+        where.append("marble_id = ?")
+        params.append(str(marble_id))
+    if cursor:
+        where.append("id < ?")
+        params.append(decode_cursor(cursor))
+    if after:
+        where.append("id > ?")
+        params.append(decode_cursor(after))
+
+    sql = f"SELECT id, ts, {', '.join(LOG_FIELDS)}, extra FROM events"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # After a cursor the oldest rows come first, so a backlog larger than `limit` is picked up over several polls
+    sql += f" ORDER BY id {'ASC' if after else 'DESC'} LIMIT ?"
+
+    conn = connect_events_db(db_path)
+    try:
+        rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+    finally:
+        conn.close()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if after:
+        rows.reverse()
+    logs = [format_event(row) for row in rows]
+    return {
+        'logs': logs,
+        # Older pages; a page read after a cursor leaves the client's existing older cursor alone
+        'next_cursor': str(logs[-1]['id']) if logs and more and not after else None,
+        'latest_cursor': str(logs[0]['id']) if logs else after,
+        'more_after': bool(after) and more,
+    }
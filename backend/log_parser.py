@@ -1,98 +1,181 @@
 import glob
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-from datetime import datetime
+from pandas.api.types import union_categoricals
 
-def parse_logs():
-    log_files = glob.glob('marble_gallery.log*')
-    data = []
+# Maps events table columns to the field names used in the legacy log lines
+EVENT_FIELD_NAMES = {
+    'event': 'Event',
+    'page': 'Page',
+    'marble_id': 'Marble ID',
+    'marble_name': 'Marble Name',
+    'ip': 'IP',
+    'user_agent': 'User-Agent',
+    'referrer': 'Referrer',
+    'screen': 'Screen',
+    'color_depth': 'Color Depth',
+    'plugins': 'Plugins',
+    'time_on_page': 'Time on Page',
+    'scroll_depth': 'Scroll Depth',
+}
 
-    print(f"Current working directory: {os.getcwd()}")
-    print(f"Found {len(log_files)} log files")
+# One tracking line as written by the old tracking_pixel(); the detailed variant carries the trailing fields
+TRACKING_LINE_RE = re.compile(
+    r'^(?P<timestamp>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)[^\n]*? - '
+    r'IP: (?P<ip>[^\n]*?), User-Agent: (?P<user_agent>[^\n]*?), Referrer: (?P<referrer>[^\n]*?), '
+    r'Event: (?P<event>[^\n]*?), Page: (?P<page>[^\n]*?), Marble ID: (?P<marble_id>[^\n]*?), '
+    r'Marble Name: (?P<marble_name>[^\n]*?)'
+    r'(?:, Screen: (?P<screen>[^\n]*?), Color Depth: (?P<color_depth>[^\n]*?), Plugins: (?P<plugins>[^\n]*?), '
+    r'Time on Page: (?P<time_on_page>[^\n]*?), Scroll Depth: (?P<scroll_depth>[^\n]*?))?'
+    r'(?: \[in [^\n\]]*\])?\r?$',
+    re.MULTILINE,
+)
+CATEGORY_COLUMNS = ['Event', 'Page', 'User-Agent']
+CHUNK_BYTES = 8 * 1024 * 1024
+LOG_CACHE_DIR = os.environ.get('LOG_PARSE_CACHE_DIR', '.log_parse_cache')
+
+def read_line_chunks(log_file, chunk_bytes=CHUNK_BYTES):
+    # Yields blocks of whole lines so memory stays bounded by the chunk size, not the file size
+    with open(log_file, 'r', errors='replace') as f:
+        remainder = ''
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = remainder + block
+            cut = block.rfind('\n') + 1
+            remainder = block[cut:]
+            if cut:
+                yield block[:cut]
+        if remainder:
+            yield remainder
+
+def parse_log_file(log_file):
+    groups = list(TRACKING_LINE_RE.groupindex)
+    columns = {group: [] for group in groups}
+    for chunk in read_line_chunks(log_file):
+        matches = [match.groups() for match in TRACKING_LINE_RE.finditer(chunk)]
+        if not matches:
+            continue
+        for group, values in zip(groups, zip(*matches)):
+            columns[group].extend(values)
+
+    df = pd.DataFrame(columns)
+    # tracking_pixel() wrote a short and a detailed line per hit; keep only the detailed one
+    key_columns = ['timestamp', 'ip', 'event', 'page', 'marble_id', 'marble_name']
+    following = df.shift(-1)
+    duplicate = (df['screen'].isna() & following['screen'].notna()
+                 & (df[key_columns] == following[key_columns]).all(axis=1))
+    df = df[~duplicate].reset_index(drop=True)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    df = df.rename(columns=EVENT_FIELD_NAMES)
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    return df
+
+def cache_path_for(log_file):
+    stat = os.stat(log_file)
+    key = f"{os.path.basename(log_file)}-{stat.st_mtime_ns}-{stat.st_size}.pkl"
+    return os.path.join(LOG_CACHE_DIR, key)
+
+def parse_log_file_cached(log_file):
+    cache_path = cache_path_for(log_file)
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            # A truncated or corrupt entry (or one from another pandas version) is just a cache miss
+            print(f"Ignoring unreadable parse cache {cache_path}: {e}")
+
+    df = parse_log_file(log_file)
+    try:
+        os.makedirs(LOG_CACHE_DIR, exist_ok=True)
+        # Drop stale entries for this file; rotated files keep their name but change mtime/size
+        for stale in glob.glob(os.path.join(LOG_CACHE_DIR, glob.escape(os.path.basename(log_file)) + '-*.pkl')):
+            os.remove(stale)
+        df.to_pickle(cache_path)
+    except OSError as e:
+        print(f"Could not cache parsed {log_file}: {e}")
+    return df
+
+def parse_logs(log_pattern='marble_gallery.log*', max_workers=None):
+    log_files = [f for f in glob.glob(log_pattern) if os.path.isfile(f)]
+    print(f"Found {len(log_files)} log files in {os.getcwd()}")
     if not log_files:
         print("No log files found. Check the file path and naming convention.")
         return pd.DataFrame()
 
-    for log_file in log_files:
-        print(f"Parsing file: {log_file}")
-        try:
-            with open(log_file, 'r') as f:
-                print(f"Successfully opened {log_file}")
-                for line_num, line in enumerate(f, 1):
-                    print(f"Line {line_num}: {line.strip()}")
-                    parts = line.split(',', 1)
-                    if len(parts) == 2:
-                        timestamp_str, log_data = parts
-                        try:
-                            timestamp = datetime.strptime(timestamp_str.strip(), '%Y-%m-%d %H:%M:%S')
-                        except ValueError:
-                            print(f"Error parsing timestamp in file {log_file}, line {line_num}: {timestamp_str}")
-                            continue
-                        
-                        # Parse log data
-                        log_dict = {'timestamp': timestamp}
-                        log_parts = log_data.split('[in')
-                        if len(log_parts) > 1:
-                            log_data = log_parts[0].strip()
-                        for item in log_data.split(', '):
-                            if ': ' in item:
-                                key, value = item.split(': ', 1)
-                                log_dict[key.strip()] = value.strip()
-                            else:
-                                print(f"Unexpected format in file {log_file}, line {line_num}: {item}")
-                        
-                        data.append(log_dict)
-                    else:
-                        print(f"Unexpected line format in file {log_file}, line {line_num}: {line}")
-        except IOError as e:
-            print(f"Error opening file {log_file}: {e}")
-
-    df = pd.DataFrame(data)
-    print(f"Parsed {len(df)} log entries")
-    print(f"Columns in DataFrame: {df.columns.tolist()}")
-    if not df.empty:
-        print("First row of DataFrame:")
-        print(df.iloc[0])
+    frames = []
+    if len(log_files) == 1 or max_workers == 1:
+        for log_file in log_files:
+            try:
+                frames.append(parse_log_file_cached(log_file))
+            except (OSError, ValueError) as e:
+                print(f"Error parsing file {log_file}: {e}")
     else:
+        # Rotated files are independent, so each one is parsed (or loaded from cache) in its own process
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(log_files), os.cpu_count() or 1)) as executor:
+            futures = {executor.submit(parse_log_file_cached, log_file): log_file for log_file in log_files}
+            for future in as_completed(futures):
+                try:
+                    frames.append(future.result())
+                except (OSError, ValueError) as e:
+                    print(f"Error parsing file {futures[future]}: {e}")
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
         print("No data was parsed from the log files.")
+        return pd.DataFrame()
+    # union_categoricals keeps the category dtype instead of falling back to object on concat
+    for column in CATEGORY_COLUMNS:
+        categories = union_categoricals([frame[column] for frame in frames]).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    df = pd.concat(frames, ignore_index=True).sort_values('timestamp', kind='stable', ignore_index=True)
+    print(f"Parsed {len(df)} log entries from {len(frames)} files")
     return df
 
+def value_counts(series):
+    # Categorical value_counts also lists categories that never occur in this slice
+    counts = series.value_counts()
+    return counts[counts > 0]
+
 def get_event_counts(df):
-    return df['Event'].value_counts().to_dict()
+    return value_counts(df['Event']).to_dict()
 
 def get_marble_clicks(df):
-    marble_clicks = df[df['Event'] == 'marble_click']['Marble Name'].value_counts().to_dict()
+    marble_clicks = value_counts(df[df['Event'] == 'marble_click']['Marble Name']).to_dict()
     return {'x': list(marble_clicks.keys()), 'y': list(marble_clicks.values()), 'type': 'bar'}
 
 def get_route_travels(df):
-    route_travels = df[df['Event'] == 'route_travel']['Page'].value_counts().to_dict()
+    route_travels = value_counts(df[df['Event'] == 'route_travel']['Page']).to_dict()
     return {'x': list(route_travels.keys()), 'y': list(route_travels.values()), 'type': 'bar'}
 
 def get_page_views(df):
     if 'Page' not in df.columns or 'Event' not in df.columns:
         print("Warning: 'Page' or 'Event' column not found in DataFrame")
         return {}
-    return df[df['Event'] == 'pageview']['Page'].value_counts().to_dict()
+    return value_counts(df[df['Event'] == 'pageview']['Page']).to_dict()
 
 def get_time_series_data(df):
     if 'timestamp' not in df.columns or 'Event' not in df.columns:
         print("Warning: 'timestamp' or 'Event' column not found in DataFrame")
         return []
-    df_grouped = df.groupby([df['timestamp'].dt.date, 'Event']).size().unstack(fill_value=0)
+    df_grouped = df.groupby([df['timestamp'].dt.date, 'Event'], observed=True).size().unstack(fill_value=0)
     return df_grouped.reset_index().to_dict('records')
 
 def get_user_agents(df):
     if 'User-Agent' not in df.columns:
         print("Warning: 'User-Agent' column not found in DataFrame")
         return {}
-    return df['User-Agent'].value_counts().head(5).to_dict()
+    return value_counts(df['User-Agent']).head(5).to_dict()
 
 def get_scroll_depth_distribution(df):
     if 'Scroll Depth' not in df.columns:
         print("Warning: 'Scroll Depth' column not found in DataFrame")
         return {}
-    scroll_depth = df['Scroll Depth'].copy()
-    scroll_depth = scroll_depth[scroll_depth != 'NaN']
-    scroll_depth = pd.to_numeric(scroll_depth, errors='coerce')
+    scroll_depth = pd.to_numeric(df['Scroll Depth'], errors='coerce')
     scroll_depth = scroll_depth.dropna()
     return scroll_depth.describe().to_dict()
\ No newline at end of file
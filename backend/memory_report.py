@@ -0,0 +1,150 @@
+import ctypes
+import gc
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+import _sqlite3
+
+TRACEMALLOC_FRAMES = 10
+
+# Baseline for snapshot-diff mode; each gunicorn worker keeps its own
+baseline_snapshot = None
+baseline_lock = threading.Lock()
+
+
+def process_memory():
+    usage = {'pid': os.getpid()}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM', 'RssAnon', 'RssFile'):
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        # Not Linux: ru_maxrss is the peak, in bytes on macOS and KiB elsewhere
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['VmHWM'] = maxrss if sys.platform == 'darwin' else maxrss * 1024
+    return usage
+
+
+def model_memory(model):
+    if model is None:
+        return None
+    parameters = sum(p.numel() * p.element_size() for p in model.parameters())
+    buffers = sum(b.numel() * b.element_size() for b in model.buffers())
+    return {'parameter_bytes': parameters, 'buffer_bytes': buffers, 'total_bytes': parameters + buffers}
+
+
+def faiss_index_memory(index):
+    if index is None:
+        return None
+    try:
+        code_bytes = index.ntotal * index.sa_code_size()
+    except RuntimeError:
+        # Not every index type implements sa_code_size; serializing gives the stored size instead
+        import faiss
+        code_bytes = len(faiss.serialize_index(index))
+    return {'type': type(index).__name__, 'ntotal': index.ntotal, 'dimension': index.d, 'bytes': code_bytes}
+
+
+def numpy_arrays(module):
+    import numpy as np
+    arrays = {}
+    for name, value in vars(module).items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = {'shape': list(value.shape), 'dtype': str(value.dtype), 'bytes': value.nbytes}
+    return arrays
+
+
+def sqlite_memory():
+    # The sqlite3 module doesn't expose sqlite3_memory_used(), but the library it links against does
+    try:
+        lib = ctypes.CDLL(_sqlite3.__file__)
+        lib.sqlite3_memory_used.restype = ctypes.c_int64
+        lib.sqlite3_memory_highwater.restype = ctypes.c_int64
+        lib.sqlite3_memory_highwater.argtypes = [ctypes.c_int]
+        return {'used_bytes': lib.sqlite3_memory_used(), 'highwater_bytes': lib.sqlite3_memory_highwater(0)}
+    except (OSError, AttributeError):
+        return None
+
+
+def torch_memory():
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return None
+    report = {'num_threads': torch.get_num_threads()}
+    if torch.cuda.is_available():
+        report['cuda_allocated_bytes'] = torch.cuda.memory_allocated()
+        report['cuda_reserved_bytes'] = torch.cuda.memory_reserved()
+    return report
+
+
+def top_allocators(snapshot, limit):
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    return [{
+        'location': str(stat.traceback[0]),
+        'size_bytes': stat.size,
+        'count': stat.count,
+    } for stat in snapshot.statistics('lineno')[:limit]]
+
+
+def python_heap(limit=25):
+    report = {'gc_objects': len(gc.get_objects()), 'tracemalloc': tracemalloc.is_tracing()}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report.update(traced_bytes=current, traced_peak_bytes=peak,
+                      top_allocators=top_allocators(tracemalloc.take_snapshot(), limit))
+    return report
+
+
+def start_tracing():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def stop_tracing():
+    global baseline_snapshot
+    with baseline_lock:
+        baseline_snapshot = None
+    tracemalloc.stop()
+
+
+def take_baseline():
+    global baseline_snapshot
+    start_tracing()
+    with baseline_lock:
+        baseline_snapshot = tracemalloc.take_snapshot()
+
+
+def diff_from_baseline(limit=25):
+    with baseline_lock:
+        baseline = baseline_snapshot
+    if baseline is None or not tracemalloc.is_tracing():
+        return None
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    current = tracemalloc.take_snapshot().filter_traces(ignore)
+    stats = current.compare_to(baseline.filter_traces(ignore), 'lineno')
+    return [{
+        'location': str(stat.traceback[0]),
+        'size_diff_bytes': stat.size_diff,
+        'count_diff': stat.count_diff,
+        'size_bytes': stat.size,
+    } for stat in stats[:limit]]
+
+
+def memory_report(limit=25):
+    # The catalog app is only loaded when the admin panel runs inside wsgi.py next to it
+    server = sys.modules.get('server_production')
+    report = {
+        'process': process_memory(),
+        'sqlite': sqlite_memory(),
+        'torch': torch_memory(),
+        'python_heap': python_heap(limit),
+    }
+    if server is not None:
+        report['model'] = model_memory(getattr(server, 'model', None))
+        report['faiss_index'] = faiss_index_memory(getattr(server, 'index', None))
+        report['numpy_arrays'] = numpy_arrays(server)
+    return report
@@ -0,0 +1,212 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, abort, g, has_request_context, request
+
+# Each worker dumps its histograms here; /metrics sums every file so gunicorn workers share one view
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'marble_metrics'))
+# /metrics answers 403 unless this is set and sent as a bearer token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+FLUSH_INTERVAL = 5
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+REQUEST_METRIC = 'marble_http_request_duration_seconds'
+SPAN_METRIC = 'marble_span_duration_seconds'
+METRIC_HELP = {
+    REQUEST_METRIC: 'Time spent handling a request, by route.',
+    SPAN_METRIC: 'Time spent in an instrumented step of a request, by route and span.',
+}
+
+
+class HistogramCollector:
+    def __init__(self, metrics_dir=METRICS_DIR):
+        self.metrics_dir = metrics_dir
+        self._series = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def observe(self, metric, labels, seconds):
+        self._ensure_flusher()
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One cumulative count per bucket, then sum and count
+                series = self._series[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def _ensure_flusher(self):
+        # Workers fork after import, so the flush thread is started lazily in each one
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._series = {}
+            self._pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            snapshot = [[metric, list(labels), series] for (metric, labels), series in self._series.items()]
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = worker_path(os.getpid(), self.metrics_dir)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        self.flush()
+        merged = {}
+        for path in glob.glob(os.path.join(self.metrics_dir, 'worker-*.json')):
+            # gunicorn's child_exit hook removes a worker's file; this catches workers that died without it
+            if not pid_alive(worker_pid(path)):
+                remove_file(path)
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric, labels, series in snapshot:
+                key = (metric, tuple(tuple(label) for label in labels))
+                if key in merged:
+                    merged[key] = [a + b for a, b in zip(merged[key], series)]
+                else:
+                    merged[key] = series
+        return merged
+
+    def render(self):
+        lines = []
+        merged = self.collect()
+        for metric in sorted({metric for metric, _ in merged}):
+            lines.append(f"# HELP {metric} {METRIC_HELP.get(metric, '')}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, labels), series in sorted(merged.items()):
+                if name != metric:
+                    continue
+                label_text = ','.join(f'{key}="{escape_label(value)}"' for key, value in labels)
+                prefix = label_text + ',' if label_text else ''
+                for bound, count in zip(BUCKETS, series):
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{metric}_bucket{{{prefix}le="{le}"}} {count}')
+                lines.append(f'{metric}_sum{{{label_text}}} {series[-2]}')
+                lines.append(f'{metric}_count{{{label_text}}} {series[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def worker_path(pid, metrics_dir=METRICS_DIR):
+    return os.path.join(metrics_dir, f'worker-{pid}.json')
+
+
+def worker_pid(path):
+    try:
+        return int(os.path.basename(path)[len('worker-'):-len('.json')])
+    except ValueError:
+        return None
+
+
+def pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_worker_file(pid, metrics_dir=METRICS_DIR):
+    remove_file(worker_path(pid, metrics_dir))
+
+
+def clear_worker_files(metrics_dir=METRICS_DIR):
+    # Files from a previous run's workers; called by gunicorn's master before it forks new ones
+    for path in glob.glob(os.path.join(metrics_dir, 'worker-*.json*')):
+        remove_file(path)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+collector = HistogramCollector()
+
+
+def current_route():
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+
+def record_span(name, seconds):
+    if not has_request_context():
+        return
+    g.setdefault('spans', []).append((name, seconds))
+    collector.observe(SPAN_METRIC, {'route': current_route(), 'span': name}, seconds)
+
+
+@contextmanager
+def timing(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def init_app(app):
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.spans = []
+
+    @app.after_request
+    def record_request_timing(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        collector.observe(REQUEST_METRIC, {'route': current_route(), 'method': request.method,
+                                           'status': str(response.status_code)}, total)
+        # Repeated spans (e.g. several db lookups) are summed into one Server-Timing entry
+        spans = {}
+        for name, seconds in g.get('spans', []):
+            spans[name] = spans.get(name, 0.0) + seconds
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(entries)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if not METRICS_TOKEN or request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            abort(403)
+        return Response(collector.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,236 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+
+import image_store
+from catalog_search import FTS_COLUMNS, TRIGRAM_COLUMNS
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.environ.get('MARBLE_DB_PATH', os.path.join(current_dir, 'marble_images-2.db'))
+TIMING_REPEATS = 5
+
+
+def add_image_hashes(conn):
+    # The column and trigger the server used to add on startup, so databases that already have them pass through
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+    if 'imageHash' not in columns:
+        conn.execute("ALTER TABLE images ADD COLUMN imageHash TEXT")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS images_hash_au AFTER UPDATE OF image ON images
+        WHEN new.imageHash IS old.imageHash AND new.image IS NOT old.image BEGIN
+          UPDATE images SET imageHash = NULL WHERE id = new.id;
+        END
+    """)
+
+
+def move_image_blobs(conn):
+    # Every metadata scan used to step over the PNG overflow pages; images now only holds metadata
+    conn.execute("CREATE TABLE image_blobs (id INTEGER PRIMARY KEY, image BLOB NOT NULL)")
+    conn.execute("INSERT INTO image_blobs (id, image) SELECT id, image FROM images WHERE image IS NOT NULL")
+    conn.execute("DROP TRIGGER IF EXISTS images_hash_au")
+    conn.execute("ALTER TABLE images DROP COLUMN image")
+    # Writing an image clears its hash so the next read recomputes it, as images_hash_au did
+    conn.execute("""
+        CREATE TRIGGER image_blobs_ai AFTER INSERT ON image_blobs BEGIN
+          UPDATE images SET imageHash = NULL WHERE id = new.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER image_blobs_au AFTER UPDATE OF image ON image_blobs WHEN new.image IS NOT old.image BEGIN
+          UPDATE images SET imageHash = NULL WHERE id = new.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER images_blob_ad AFTER DELETE ON images BEGIN
+          DELETE FROM image_blobs WHERE id = old.id;
+        END
+    """)
+
+
+def add_catalog_indexes(conn):
+    # The filters in query_catalog.QUERIES that had no index; marble_vendor_association is already keyed by marble_id
+    conn.execute("CREATE INDEX IF NOT EXISTS images_featured ON images(featured) WHERE featured = 1")
+    conn.execute("CREATE INDEX IF NOT EXISTS images_marble_name ON images(marbleName)")
+    conn.execute("CREATE INDEX IF NOT EXISTS images_stone_color ON images(stoneColor)")
+    conn.execute("CREATE INDEX IF NOT EXISTS images_missing_description ON images(id) WHERE description IS NULL OR description = ''")
+
+
+def fts_trigger_values(prefix, columns):
+    return ', '.join(f'{prefix}.{column}' for column in columns)
+
+
+def rebuild_search_indexes(conn):
+    # images_fts gets prefix indexes and a trigram table for substrings. The old triggers inserted without a
+    # rowid, so rows added after the index was built could point at the wrong image; these pass the id.
+    for trigger in ('images_ai', 'images_ad', 'images_au'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS images_fts")
+    fts, trigram = ', '.join(FTS_COLUMNS), ', '.join(TRIGRAM_COLUMNS)
+    conn.execute(f"CREATE VIRTUAL TABLE images_fts USING fts5({fts}, content='images', content_rowid='id', prefix='2 3')")
+    conn.execute(f"CREATE VIRTUAL TABLE images_trigram USING fts5({trigram}, content='images', content_rowid='id', "
+                 f"tokenize='trigram')")
+    conn.execute("CREATE TABLE catalog_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute("INSERT INTO catalog_meta (key, value) VALUES ('search_version', 0)")
+
+    insert = f"""
+      INSERT INTO images_fts(rowid, {fts}) VALUES (new.id, {fts_trigger_values('new', FTS_COLUMNS)});
+      INSERT INTO images_trigram(rowid, {trigram}) VALUES (new.id, {fts_trigger_values('new', TRIGRAM_COLUMNS)});"""
+    delete = f"""
+      INSERT INTO images_fts(images_fts, rowid, {fts}) VALUES ('delete', old.id, {fts_trigger_values('old', FTS_COLUMNS)});
+      INSERT INTO images_trigram(images_trigram, rowid, {trigram}) VALUES ('delete', old.id, {fts_trigger_values('old', TRIGRAM_COLUMNS)});"""
+    bump = """
+      UPDATE catalog_meta SET value = value + 1 WHERE key = 'search_version';"""
+    conn.execute(f"CREATE TRIGGER images_ai AFTER INSERT ON images BEGIN{insert}{bump}\nEND")
+    conn.execute(f"CREATE TRIGGER images_ad AFTER DELETE ON images BEGIN{delete}{bump}\nEND")
+    # Only the indexed columns, so imageHash and other writes no longer rewrite the search index
+    conn.execute(f"CREATE TRIGGER images_au AFTER UPDATE OF {', '.join(FTS_COLUMNS)} ON images "
+                 f"BEGIN{delete}{insert}{bump}\nEND")
+    conn.execute("INSERT INTO images_fts(images_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO images_trigram(images_trigram) VALUES ('rebuild')")
+
+
+def add_vendor_triggers(conn):
+    # Vendor names are suggested alongside marble names, so renaming, adding or removing one also moves
+    # search_version and the suggestion index is rebuilt
+    bump = "UPDATE catalog_meta SET value = value + 1 WHERE key = 'search_version';"
+    conn.execute(f"CREATE TRIGGER vendors_ai AFTER INSERT ON vendors BEGIN {bump} END")
+    conn.execute(f"CREATE TRIGGER vendors_ad AFTER DELETE ON vendors BEGIN {bump} END")
+    conn.execute(f"CREATE TRIGGER vendors_au AFTER UPDATE OF name ON vendors BEGIN {bump} END")
+
+
+# PRAGMA user_version records how many of these have been applied. Append new migrations; never edit or reorder
+# one that has shipped.
+MIGRATIONS = [
+    ('image hashes', add_image_hashes),
+    ('image blobs table', move_image_blobs),
+    ('catalog indexes', add_catalog_indexes),
+    ('search indexes', rebuild_search_indexes),
+    ('vendor triggers', add_vendor_triggers),
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, vacuum=True):
+    applied = []
+    for version, (name, migration) in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE takes the write lock first, so two processes can't both apply the same step
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            start = time.perf_counter()
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append((version, name, time.perf_counter() - start))
+
+    if schema_version(conn) >= 2:
+        # Images added or replaced since the last run; imageHash isn't an FTS column, so images_au doesn't fire
+        image_store.backfill(conn)
+        conn.commit()
+    # Streamed images hold a read transaction for the whole download; in WAL mode that doesn't block writers.
+    # journal_mode is stored in the file but can't change inside a transaction, so it isn't a numbered migration.
+    conn.execute("PRAGMA journal_mode=WAL")
+    if applied and vacuum:
+        # Moved blobs leave their old pages on the freelist until the file is rebuilt
+        conn.execute("VACUUM")
+    return applied
+
+
+def database_stats(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    stats = {
+        'page_size': page_size,
+        'page_count': conn.execute("PRAGMA page_count").fetchone()[0],
+        'freelist_count': conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+    try:
+        stats['tables'] = dict(conn.execute("SELECT name, COUNT(*) FROM dbstat GROUP BY name"))
+    except sqlite3.OperationalError:
+        # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB; the totals are still useful
+        stats['tables'] = {}
+    return stats
+
+
+def timing_queries(conn):
+    row = conn.execute("SELECT COUNT(*), MIN(marbleName) FROM images").fetchone()
+    count, marble_name = row[0], row[1] or ''
+    search_term = (marble_name.split() or ['marble'])[0]
+    return {
+        'count': ("SELECT COUNT(*) FROM images", ()),
+        'all_ids': ("SELECT id FROM images ORDER BY id", ()),
+        'page': ("SELECT id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, "
+                 "thermalExpansion FROM images ORDER BY id LIMIT 20 OFFSET ?", (count // 2,)),
+        'featured': ("SELECT id, marbleName, marbleOrigin, fileName, costRange, description FROM images "
+                     "WHERE featured = 1 LIMIT 3", ()),
+        'search': ("SELECT images.id, images.marbleName FROM images_fts JOIN images ON images.id = images_fts.rowid "
+                   "WHERE images_fts MATCH ? ORDER BY images_fts.rank LIMIT 20", (f'"{search_term}"',)),
+        # Shape of the enrichment scripts' writes; rolled back after timing
+        'enrich_update': ("UPDATE images SET stoneColor = stoneColor WHERE marbleName = ?", (marble_name,)),
+    }
+
+
+def time_queries(db_path, repeats=TIMING_REPEATS):
+    timings = {}
+    conn = sqlite3.connect(db_path)
+    for name, (sql, params) in timing_queries(conn).items():
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append(time.perf_counter() - start)
+            conn.rollback()
+        timings[name] = statistics.median(samples) * 1000
+    conn.close()
+    return timings
+
+
+def print_report(before, after, timings_before, timings_after):
+    tables = sorted(set(before['tables']) | set(after['tables']))
+    width = max([24] + [len(table) + 8 for table in tables])
+    print(f"{'':<{width}}{'before':>12}{'after':>12}")
+    for key in ('page_count', 'freelist_count'):
+        print(f"{key:<{width}}{before[key]:>12}{after[key]:>12}")
+    print(f"{'size (MB)':<{width}}{before['page_count'] * before['page_size'] / 1e6:>12.1f}"
+          f"{after['page_count'] * after['page_size'] / 1e6:>12.1f}")
+    for table in tables:
+        print(f"{'pages ' + table:<{width}}{before['tables'].get(table, '-'):>12}{after['tables'].get(table, '-'):>12}")
+    for name in timings_before:
+        print(f"{name + ' ms':<{width}}{timings_before[name]:>12.2f}{timings_after[name]:>12.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations to the marble catalog')
+    parser.add_argument('db', nargs='?', default=DEFAULT_DB_PATH)
+    parser.add_argument('--status', action='store_true', help='Only print the schema version')
+    parser.add_argument('--no-vacuum', action='store_true', help='Skip the VACUUM that returns freed pages to the OS')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    version = schema_version(conn)
+    print(f"{args.db}: schema version {version} of {LATEST_VERSION}")
+    if args.status:
+        conn.close()
+        raise SystemExit(0)
+
+    before = database_stats(conn)
+    timings_before = time_queries(args.db)
+    applied = migrate(conn, vacuum=not args.no_vacuum)
+    for version, name, seconds in applied:
+        print(f"Applied {version}: {name} ({seconds:.1f}s)")
+    if not applied:
+        print("Nothing to migrate")
+    after = database_stats(conn)
+    timings_after = time_queries(args.db)
+    conn.close()
+    print_report(before, after, timings_before, timings_after)
@@ -0,0 +1,126 @@
+import argparse
+import re
+import sqlite3
+import sys
+
+from catalog_search import COLUMN_WEIGHTS, TRIGRAM_WEIGHTS
+from migrate import DEFAULT_DB_PATH
+
+# A plan step that reads a whole table: "SCAN images", as opposed to "SCAN images USING COVERING INDEX ..."
+# or an FTS "SCAN images_fts VIRTUAL TABLE INDEX ..."
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+IMAGE_COLUMNS = 'id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion'
+
+
+class Query:
+    def __init__(self, name, sql, params=(), full_scan=None):
+        self.name = name
+        self.sql = sql
+        # Sample parameters; EXPLAIN only needs the right count and types
+        self.params = params
+        # Why reading the whole table is expected, for queries that need every row anyway
+        self.full_scan = full_scan
+
+
+# Every query the server and the maintenance scripts run against the catalog, copied from where it is used.
+# Add new queries here so test_query_catalog catches a missing index before it ships.
+QUERIES = [
+    # server_production.py
+    Query('images_page', f"SELECT {IMAGE_COLUMNS}, imageHash FROM images ORDER BY id LIMIT ? OFFSET ?", (20, 40),
+          full_scan="Walks id order and stops after OFFSET + LIMIT rows"),
+    Query('images_count', "SELECT COUNT(*) FROM images"),
+    Query('images_by_ids', f"SELECT {IMAGE_COLUMNS}, imageHash FROM images WHERE id IN (?, ?, ?)", (1, 2, 3)),
+    # catalog_search.py
+    Query('search_version', "SELECT value FROM catalog_meta WHERE key = 'search_version'"),
+    Query('search_hits', f"SELECT rowid FROM images_fts WHERE images_fts MATCH ? "
+                         f"ORDER BY bm25(images_fts, {', '.join(map(str, COLUMN_WEIGHTS))})", ('"calac"*',)),
+    Query('search_trigram_hits', f"SELECT rowid FROM images_trigram WHERE images_trigram MATCH ? "
+                                 f"ORDER BY bm25(images_trigram, {', '.join(map(str, TRIGRAM_WEIGHTS))})", ('"arrar"',)),
+    # suggest.py
+    Query('suggest_marbles', "SELECT id, marbleName, marbleOrigin FROM images WHERE marbleName IS NOT NULL",
+          full_scan="Loads every name into the in-memory prefix index when the catalog changes"),
+    Query('suggest_vendors', "SELECT v.id, v.name, COUNT(mva.marble_id) FROM vendors v "
+                             "LEFT JOIN marble_vendor_association mva ON mva.vendor_id = v.id "
+                             "WHERE v.name IS NOT NULL GROUP BY v.id",
+          full_scan="Loads every vendor into the in-memory prefix index when the catalog changes"),
+    # fuzzy_match.py
+    Query('fuzzy_marbles', "SELECT MIN(id), marbleName FROM images WHERE marbleName IS NOT NULL GROUP BY marbleName"),
+    Query('fuzzy_vendors', "SELECT id, name FROM vendors WHERE name IS NOT NULL",
+          full_scan="Loads every vendor name into the matcher when the catalog changes"),
+    Query('image_version', "SELECT images.imageHash, length(image_blobs.image) FROM images "
+                           "LEFT JOIN image_blobs ON image_blobs.id = images.id WHERE images.id = ?", (1,)),
+    Query('featured_marbles', "SELECT id, marbleName, marbleOrigin, fileName, costRange, description, imageHash "
+                              "FROM images WHERE featured = 1 LIMIT 3"),
+    Query('marble', f"SELECT {IMAGE_COLUMNS}, imageHash FROM images WHERE id = ?", (1,)),
+    Query('marble_vendors', "SELECT v.id, v.name, v.contact, v.location, v.vendorLogo, v.url FROM vendors v "
+                            "JOIN marble_vendor_association mva ON v.id = mva.vendor_id WHERE mva.marble_id = ?", (1,)),
+    Query('index_ids', "SELECT id FROM images ORDER BY id",
+          full_scan="Loaded once per worker to map FAISS positions to ids"),
+    Query('similar_marble', "SELECT id, marbleName, marbleOrigin, fileName, imageHash FROM images WHERE id = ?", (1,)),
+    Query('uploaded_match', f"SELECT {IMAGE_COLUMNS}, imageHash FROM images WHERE id = ?", (1,)),
+    Query('rebuild_index_images', "SELECT id, image FROM image_blobs ORDER BY id",
+          full_scan="Featurizes every image when the FAISS index is rebuilt"),
+    # image_store.py / migrate.py
+    Query('unhashed_images', "SELECT images.id FROM images JOIN image_blobs ON image_blobs.id = images.id "
+                             "WHERE images.imageHash IS NULL",
+          full_scan="Runs once per migrate.py invocation"),
+    Query('backfill_hash', "UPDATE images SET imageHash = ? WHERE id = ?", ('0' * 64, 1)),
+    # utilities/
+    Query('set_description', "UPDATE images SET description = ? WHERE marbleName = ?", ('', 'Carrara')),
+    Query('set_stain_resistance', "UPDATE images SET stainResistance = ? WHERE marbleName = ?", ('High', 'Carrara')),
+    Query('set_thermal_expansion', "UPDATE images SET thermalExpansion = ? WHERE marbleName = ?", (6.5, 'Carrara')),
+    Query('set_stone_color', "UPDATE images SET stoneColor = ? WHERE id = ?", ('#FFFFFF', 1)),
+    Query('set_file_name', "UPDATE images SET fileName = ? WHERE id = ?", ('carrara.png', 1)),
+    Query('missing_descriptions', "SELECT marbleName, description, marbleOrigin FROM images "
+                                  "WHERE description IS NULL OR description = ''"),
+    Query('missing_colors', "SELECT images.id, images.marbleName FROM images "
+                            "JOIN image_blobs ON image_blobs.id = images.id WHERE images.stoneColor IS NULL "
+                            "OR images.stoneColor = '' OR images.stoneColor IN ('#FFFFFF', '#000000')"),
+    Query('color_image', "SELECT image FROM image_blobs WHERE id = ?", (1,)),
+    Query('all_stone_colors', "SELECT stoneColor FROM images"),
+    Query('all_stain_resistance', "SELECT marbleName, stainResistance, marbleOrigin FROM images",
+          full_scan="Regenerates the value for every marble"),
+    Query('all_thermal_expansion', "SELECT marbleName, thermalExpansion, marbleOrigin FROM images",
+          full_scan="Regenerates the value for every marble"),
+    Query('all_vendors', "SELECT id, name, location FROM vendors", full_scan="Lists every vendor"),
+    Query('import_marble_ids', "SELECT id, marbleName FROM images WHERE marbleName IS NOT NULL"),
+    Query('import_vendor_ids', "SELECT id, name FROM vendors WHERE name IS NOT NULL ORDER BY id DESC",
+          full_scan="Loads every vendor name once per import"),
+    Query('import_association', "INSERT OR IGNORE INTO marble_vendor_association (marble_id, vendor_id) VALUES (?, ?)",
+          (1, 1)),
+    Query('vendors_with_logo', "SELECT id, name, location, vendorLogo IS NOT NULL FROM vendors",
+          full_scan="Fuzzy-matches the search term against every vendor"),
+]
+
+
+def query_plan(conn, query):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query.sql}", query.params)]
+
+
+def full_scans(plan):
+    return [match.group(1) for match in map(FULL_SCAN_RE.match, plan) if match]
+
+
+def unexpected_scans(conn, queries=QUERIES):
+    # (query, tables) for every query that reads a whole table without saying why it has to
+    return [(query, tables) for query in queries
+            if query.full_scan is None and (tables := full_scans(query_plan(conn, query)))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the plan of every catalog query and flag full table scans')
+    parser.add_argument('db', nargs='?', default=DEFAULT_DB_PATH)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    for query in QUERIES:
+        print(query.name)
+        for step in query_plan(conn, query):
+            print(f"    {step}")
+        if query.full_scan:
+            print(f"    (full scan expected: {query.full_scan})")
+    failures = unexpected_scans(conn)
+    conn.close()
+    for query, tables in failures:
+        print(f"FULL SCAN: {query.name} reads all of {', '.join(tables)}")
+    sys.exit(1 if failures else 0)
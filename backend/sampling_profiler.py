@@ -0,0 +1,249 @@
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(current_dir, 'profiles'))
+PROFILE_ID_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]+$')
+DEFAULT_INTERVAL = 0.01
+MAX_SECONDS = 120
+# Time allowed past a profile's deadline for writing it out before its running marker counts as abandoned
+SAVE_GRACE_SECONDS = 30
+SUMMARY_FIELDS = ('id', 'pid', 'started', 'seconds', 'samples')
+
+
+def frame_label(frame):
+    code = frame.f_code
+    # Two path components are enough to tell torch/nn/module.py from our own module.py
+    filename = '/'.join(code.co_filename.replace('\\', '/').split('/')[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    def __init__(self, seconds, interval=DEFAULT_INTERVAL, profile_dir=PROFILE_DIR):
+        self.seconds = seconds
+        self.interval = interval
+        self.profile_dir = profile_dir
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread = None
+
+    def start(self):
+        # Written before the redirect goes out, so whichever worker serves the profile page can see the run
+        write_running_marker(self.profile_dir, self.profile_id, time.time() + self.seconds)
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self.profile_id
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        try:
+            self._sample()
+        finally:
+            remove_file(running_marker_path(self.profile_dir, self.profile_id))
+
+    def _sample(self):
+        own_ident = threading.get_ident()
+        started = time.time()
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        save_profile(self.profile_dir, {
+            'id': self.profile_id,
+            'pid': os.getpid(),
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)),
+            'seconds': self.seconds,
+            'interval': self.interval,
+            'samples': self.samples,
+            'stacks': dict(self.stacks.most_common()),
+        })
+
+
+# One sampler per worker process; a second request while it runs just gets its id back
+active_sampler = None
+sampler_lock = threading.Lock()
+
+
+def start_profile(seconds, interval=DEFAULT_INTERVAL):
+    global active_sampler
+    seconds = float(seconds)
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"Profile length must be a positive number of seconds, got {seconds!r}")
+    seconds = min(max(seconds, 1.0), MAX_SECONDS)
+    with sampler_lock:
+        if active_sampler is not None and active_sampler.is_running():
+            return active_sampler.profile_id, False
+        active_sampler = StackSampler(seconds, interval)
+        return active_sampler.start(), True
+
+
+def running_marker_path(profile_dir, profile_id):
+    return os.path.join(profile_dir, f"{profile_id}.running")
+
+
+def write_running_marker(profile_dir, profile_id, ends_at):
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(running_marker_path(profile_dir, profile_id), 'w') as f:
+        json.dump({'pid': os.getpid(), 'ends_at': ends_at}, f)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def is_profile_running(profile_id, profile_dir=PROFILE_DIR):
+    # Read from PROFILE_DIR rather than this process: the worker serving the request may not be the one sampling
+    if not PROFILE_ID_RE.match(profile_id or ''):
+        return False
+    try:
+        with open(running_marker_path(profile_dir, profile_id)) as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    # A worker killed mid-profile leaves its marker behind
+    return time.time() < marker.get('ends_at', 0) + SAVE_GRACE_SECONDS
+
+
+def write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def summary_path(profile_dir, profile_id):
+    return os.path.join(profile_dir, f"{profile_id}.summary")
+
+
+def profile_summary(profile):
+    return {key: profile[key] for key in SUMMARY_FIELDS}
+
+
+def save_profile(profile_dir, profile):
+    os.makedirs(profile_dir, exist_ok=True)
+    write_json(os.path.join(profile_dir, f"{profile['id']}.json"), profile)
+    # The profile list reads these few fields instead of every full profile
+    write_json(summary_path(profile_dir, profile['id']), profile_summary(profile))
+
+
+def load_profile(profile_id, profile_dir=PROFILE_DIR):
+    if not PROFILE_ID_RE.match(profile_id or ''):
+        return None
+    path = os.path.join(profile_dir, f"{profile_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_profiles(profile_dir=PROFILE_DIR):
+    profiles = []
+    if not os.path.isdir(profile_dir):
+        return profiles
+    for name in sorted(os.listdir(profile_dir), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        profile_id = name[:-len('.json')]
+        if not PROFILE_ID_RE.match(profile_id):
+            continue
+        try:
+            with open(summary_path(profile_dir, profile_id)) as f:
+                profiles.append(json.load(f))
+            continue
+        except (OSError, ValueError):
+            pass
+        # Saved before summaries were written, or the summary is damaged: rebuild it once
+        profile = load_profile(profile_id, profile_dir)
+        if profile:
+            summary = profile_summary(profile)
+            try:
+                write_json(summary_path(profile_dir, profile_id), summary)
+            except OSError:
+                pass
+            profiles.append(summary)
+    return profiles
+
+
+def collapsed_text(profile):
+    # The format flamegraph.pl and speedscope import directly
+    return '\n'.join(f"{stack} {count}" for stack, count in profile['stacks'].items()) + '\n'
+
+
+def top_functions(profile, limit=40):
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in profile['stacks'].items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        # Recursion would otherwise count a function more than once per sample
+        for label in set(frames):
+            total_counts[label] += count
+    samples = sum(profile['stacks'].values()) or 1
+    return [{
+        'function': label,
+        'self': self_counts[label],
+        'total': total,
+        'self_pct': 100.0 * self_counts[label] / samples,
+        'total_pct': 100.0 * total / samples,
+    } for label, total in sorted(total_counts.items(), key=lambda item: (-self_counts[item[0]], -item[1]))[:limit]]
+
+
+def compare_profiles(before, after, limit=40):
+    before_top = {row['function']: row for row in top_functions(before, limit=None)}
+    after_top = {row['function']: row for row in top_functions(after, limit=None)}
+    rows = []
+    for label in set(before_top) | set(after_top):
+        before_pct = before_top.get(label, {}).get('self_pct', 0.0)
+        after_pct = after_top.get(label, {}).get('self_pct', 0.0)
+        rows.append({'function': label, 'before_pct': before_pct, 'after_pct': after_pct, 'delta_pct': after_pct - before_pct})
+    rows.sort(key=lambda row: -abs(row['delta_pct']))
+    return rows[:limit]
+
+
+def flamegraph_trace(profile, min_fraction=0.005):
+    # Plotly icicle trace: one node per distinct call path, sized by inclusive sample count
+    totals = Counter()
+    for stack, count in profile['stacks'].items():
+        frames = stack.split(';')
+        for depth in range(1, len(frames) + 1):
+            totals[';'.join(frames[:depth])] += count
+    samples = sum(profile['stacks'].values()) or 1
+    ids, labels, parents, values = ['all'], ['all'], [''], [samples]
+    for path, count in totals.items():
+        if count < samples * min_fraction:
+            continue
+        parent = path.rsplit(';', 1)[0] if ';' in path else 'all'
+        ids.append(path)
+        labels.append(path.rsplit(';', 1)[-1])
+        parents.append(parent)
+        values.append(count)
+    return {
+        'type': 'icicle',
+        'ids': ids,
+        'labels': labels,
+        'parents': parents,
+        'values': values,
+        'branchvalues': 'total',
+        'tiling': {'orientation': 'v', 'flip': 'y'},
+        'maxdepth': 40,
+    }
@@ -1,18 +1,31 @@
 from torchvision.models import ResNet50_Weights
-from flask import Flask, jsonify, send_file, send_from_directory, make_response, abort, request
+from flask import Flask, jsonify, send_file, send_from_directory, make_response, abort, request, redirect
 import time, logging, sqlite3, os, math, io, base64, faiss, numpy as np, traceback
-from logging.handlers import RotatingFileHandler
 from sklearn.preprocessing import normalize
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 import torch
 from torchvision import transforms, models
 from collections import Counter
 from flask_cors import CORS
+from event_sink import record_client_event, record_event
+from app_logging import configure_logging
+import metrics
+import api_responses
+import catalog_search
+import fuzzy_match
+import image_store
+import migrate
+import suggest
+from metrics import record_span, timing
+from static_assets import StaticManifest
+from image_store import image_url
+from feature_extraction import MAX_UPLOAD_BYTES, UploadRejected, load_resnet_model, extract_features as compute_features
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(current_dir, 'marble_images-2.db')
-index_path = os.path.join(current_dir, "marble_image_index.faiss")
+# Overridable so the benchmarks can point the app at a synthetic catalog
+DB_PATH = os.environ.get('MARBLE_DB_PATH', os.path.join(current_dir, 'marble_images-2.db'))
+index_path = os.environ.get('MARBLE_INDEX_PATH', os.path.join(current_dir, "marble_image_index.faiss"))
 
 try:
     index = faiss.read_index(index_path)
@@ -27,145 +40,242 @@ except RuntimeError as e:
 
 BUILD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'marble-gallery', 'build'))
 
-def get_marble_id_from_index(index_position):
+def load_index_ids():
+    # FAISS positions follow id order. Reading the ids once replaces an OFFSET scan per search result.
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT id FROM images ORDER BY id LIMIT 1 OFFSET ?", (int(index_position),))
-    result = c.fetchone()
+    c.execute("SELECT id FROM images ORDER BY id")
+    ids = [row[0] for row in c.fetchall()]
     conn.close()
-    return result[0] if result else None
+    return ids, {marble_id: position for position, marble_id in enumerate(ids)}
+
+index_ids, index_positions = load_index_ids()
+
+def get_marble_id_from_index(index_position):
+    index_position = int(index_position)
+    return index_ids[index_position] if 0 <= index_position < len(index_ids) else None
 
 def generate_pixel():
     return base64.b64decode('R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw==')
 
-app = Flask(__name__, static_folder=BUILD_DIR, static_url_path='')
+PIXEL_GIF = generate_pixel()
+
+# Flask's own static route is disabled so every build file goes through the manifest below
+app = Flask(__name__, static_folder=None)
 CORS(app, resources={r"/api/*": {"origins": "https://marble.boston"}})
+metrics.init_app(app)
+api_responses.init_app(app)
 if not app.debug:
-    file_handler = RotatingFileHandler('marble_gallery.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
+    configure_logging(app, 'marble_gallery.log')
     app.logger.info('Marble Gallery startup')
 
+static_manifest = StaticManifest(BUILD_DIR).scan()
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
     app.logger.info(f"Received request for path: {path}")
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
+    if path != "" and static_manifest.get(path) is not None:
         app.logger.info(f"Serving static file: {path}")
         allowed_extensions = {'.html', '.js', '.css', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.svg', '.json'}
         file_ext = os.path.splitext(path)[1].lower()
         if file_ext in allowed_extensions:
             if file_ext == '.js' and not path.startswith('static/js/'):
                 abort(404)
-            return send_from_directory(app.static_folder, path)
+            return static_manifest.send(path)
     if path in ['', 'about', 'contact', 'upload'] or not os.path.splitext(path)[1]:
         app.logger.info(f"Serving index.html for path: {path}")
-        return send_from_directory(app.static_folder, 'index.html')
+        return static_manifest.send('index.html')
     app.logger.warning(f"404 - File not found: {path}")
     abort(404)
 
 @app.errorhandler(404)
 def not_found(e):
     app.logger.warning(f"404 - Not Found: {request.url}")
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_manifest.send('index.html')
+
+# Columns /api/images may return; ?fields= and view= pick from these and nothing else reaches the SQL
+IMAGE_FIELDS = ('id', 'marbleName', 'marbleOrigin', 'fileName', 'stainResistance', 'costRange', 'stoneColor', 'description', 'thermalExpansion')
+IMAGE_VIEWS = {
+    # What a gallery card shows; the thumbnail URL is built from the id
+    'card': ('id', 'marbleName', 'marbleOrigin'),
+    'full': IMAGE_FIELDS,
+}
+MAX_PER_PAGE = 100
 
 @app.route('/api/images', methods=['GET'])
 def get_images():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     search_term = request.args.get('search', '')
+    try:
+        columns = resolve_image_columns(request.args.get('fields'), request.args.get('view', 'full'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with timing('db'):
+        response_data = images_page(page, per_page, search_term, columns)
+    
+    app.logger.info(f"Sending response for page {page}: {len(response_data['marbles'])} marbles")
+    with timing('serialize'):
+        response = jsonify(response_data)
+    return response
+
+# The query functions below don't touch the Flask request, so asgi.py serves the same data
+
+def resolve_image_columns(fields, view):
+    if fields:
+        columns = [field for field in fields.split(',') if field]
+        unknown = [field for field in columns if field not in IMAGE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if 'id' not in columns:
+            columns.insert(0, 'id')
+        return columns
+    if view in IMAGE_VIEWS:
+        return IMAGE_VIEWS[view]
+    raise ValueError(f"Unknown view: {view}")
+
+def images_page(page, per_page, search_term, columns=IMAGE_FIELDS):
+    # Unbounded pages would run past SQLite's variable limit in the search path, and 0 divides by zero below
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    offset = (page - 1) * per_page
+    images, total_images = query_images_page(search_term, per_page, offset, columns)
+    for image in images:
+        image['imageUrl'] = image_url(image['id'], image.pop('imageHash'))
     
+    total_pages = math.ceil(total_images / per_page)
+    
+    return {
+        'marbles': images,
+        'page': page,
+        'perPage': per_page,
+        'totalMarbles': total_images,
+        'totalPages': total_pages
+    }
+
+def query_images_page(search_term, per_page, offset, columns=IMAGE_FIELDS):
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    
-    offset = (page - 1) * per_page
+    # imageHash only versions the image URL and is dropped again in images_page
+    column_list = ', '.join(f'images.{column}' for column in (*columns, 'imageHash'))
     
     if search_term:
-        # Use FTS5 for efficient full-text search
-        c.execute("""
-            SELECT COUNT(*) 
-            FROM images_fts 
-            WHERE images_fts MATCH ? 
-        """, (search_term,))
-        total_images = c.fetchone()[0]
-        
-        c.execute("""
-            SELECT id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion 
-            FROM images_fts 
-            WHERE images_fts MATCH ? 
-            ORDER BY rank
-            LIMIT ? OFFSET ?
-        """, (search_term, per_page, offset))
+        # The ranked hit list is cached per query by catalog_search, so paging only reads this page's rows
+        ids, total_images = catalog_search.search_page(DB_PATH, search_term, per_page, offset)
+        c.execute(f"SELECT {column_list} FROM images WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        rows = {row['id']: dict(row) for row in c.fetchall()}
+        images = [rows[marble_id] for marble_id in ids if marble_id in rows]
     else:
         c.execute("SELECT COUNT(*) FROM images")
         total_images = c.fetchone()[0]
         
-        c.execute("""
-            SELECT id, marbleName, marbleOrigin, fileName, stainResistance, costRange, stoneColor, description, thermalExpansion 
+        c.execute(f"""
+            SELECT {column_list}
             FROM images 
             ORDER BY id
             LIMIT ? OFFSET ?
         """, (per_page, offset))
-    
-    images = [dict(row) for row in c.fetchall()]
-    for image in images:
-        image['imageUrl'] = f'/api/image/{image["id"]}'
+        images = [dict(row) for row in c.fetchall()]
     
     conn.close()
-    
-    total_pages = math.ceil(total_images / per_page)
-    
-    response_data = {
-        'marbles': images,
-        'page': page,
-        'perPage': per_page,
-        'totalMarbles': total_images,
-        'totalPages': total_pages
-    }
-    
-    app.logger.info(f"Sending response for page {page}: {len(images)} marbles")
-    return jsonify(response_data)
+    return images, total_images
 
 @app.route('/api/image/<int:image_id>')
-def serve_image(image_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT image FROM images WHERE id = ?", (image_id,))
-    result = c.fetchone()
-    conn.close()
+@app.route('/api/image/<int:image_id>/<version>')
+def serve_image(image_id, version=None):
+    with timing('db'):
+        image_version = query_image_version(image_id)
+    if image_version is None:
+        return "Image not found", 404
 
-    if result:
-        image_data = result[0]
-        response = make_response(send_file(io.BytesIO(image_data), mimetype='image/png'))
-        response.headers['Cache-Control'] = 'public, max-age=86400'
+    image_hash, _ = image_version
+    if version is not None and not image_store.matches_version(image_hash, version):
+        # The image was replaced since this URL was handed out
+        return redirect(image_url(image_id, image_hash))
+    cache_control = image_store.IMMUTABLE_CACHE if version is not None else image_store.REVALIDATE_CACHE
+
+    # Revalidations are answered from the stored hash without reading the image
+    if request.if_none_match.contains_weak(image_hash):
+        response = app.response_class(status=304)
+        response.set_etag(image_hash)
+        response.headers['Cache-Control'] = cache_control
         return response
-    else:
+
+    # The image is streamed from SQLite in chunks instead of being loaded whole
+    with timing('db'):
+        stream = image_store.BlobStream.open(DB_PATH, image_id)
+    if stream is None:
         return "Image not found", 404
+    requested = image_store.byte_range(request.headers.get('Range'), request.headers.get('If-Range'), image_hash, stream.size)
+    status, headers = image_store.image_headers(image_hash, cache_control, stream.size, requested)
+    if status == 416:
+        stream.close()
+        return app.response_class(status=status, headers=headers)
+    if requested:
+        stream.select(*requested)
+    return app.response_class(stream, status=status, headers=headers, mimetype='image/png', direct_passthrough=True)
+
+def query_image_version(image_id):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return image_store.query_image_version(conn, image_id)
+    finally:
+        conn.close()
 
 @app.route('/api/featured-marbles', methods=['GET'])
 def get_featured_marbles():
+    return jsonify(query_featured_marbles())
+
+def query_featured_marbles():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT id, marbleName, marbleOrigin, fileName, costRange, description FROM images WHERE featured = 1 LIMIT 3")
+    c.execute("SELECT id, marbleName, marbleOrigin, fileName, costRange, description, imageHash FROM images WHERE featured = 1 LIMIT 3")
     marbles = []
     for row in c.fetchall():
-        id, marble_name, marble_origin, file_name, costRange, description = row
+        id, marble_name, marble_origin, file_name, costRange, description, image_hash = row
         marbles.append({
             'id': id,
             'name': marble_name,
             'origin': marble_origin,
             'costRange': costRange if costRange else 'Price on request',
             'description': description if description else f'Beautiful {marble_name} from {marble_origin}',
-            'imageUrl': f'/api/image/{id}'
+            'imageUrl': image_url(id, image_hash)
         })
     conn.close()
-    return jsonify(marbles)
+    return marbles
+
+@app.route('/api/marble/<int:marble_id>', methods=['GET'])
+def get_marble(marble_id):
+    # Full record for the detail modal, which the card view leaves out
+    with timing('db'):
+        marble = query_marble(marble_id)
+
+    if marble is None:
+        return jsonify({"error": "Marble not found"}), 404
+    return jsonify(marble)
+
+def query_marble(marble_id):
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(IMAGE_FIELDS)}, imageHash FROM images WHERE id = ?", (marble_id,))
+    row = c.fetchone()
+    conn.close()
+
+    if row is None:
+        return None
+    marble = dict(row)
+    marble['imageUrl'] = image_url(marble['id'], marble.pop('imageHash'))
+    return marble
 
 @app.route('/api/marble/<int:marble_id>/vendors', methods=['GET'])
 def get_marble_vendors(marble_id):
+    return jsonify(query_marble_vendors(marble_id))
+
+def query_marble_vendors(marble_id):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("""
@@ -189,20 +299,45 @@ def get_marble_vendors(marble_id):
             vendor['vendorLogo'] = None
         vendors.append(vendor)
     conn.close()
-    return jsonify(vendors)
+    return vendors
+
+@app.route('/api/suggest', methods=['GET'])
+def get_suggestions():
+    return jsonify(query_suggestions(request.args.get('q', ''), request.args.get('limit', suggest.MAX_SUGGESTIONS, type=int)))
+
+def query_suggestions(query, limit=suggest.MAX_SUGGESTIONS):
+    # Answered from the in-memory prefix index, cheap enough to call per keystroke once the worker's first call has built it
+    limit = min(max(limit, 1), suggest.MAX_SUGGESTIONS)
+    return {'query': query, 'suggestions': suggestions.suggest(query, limit)}
+
+@app.route('/api/fuzzy', methods=['GET'])
+def get_fuzzy_matches():
+    return jsonify(query_fuzzy_matches(request.args.get('q', ''),
+                                       request.args.get('limit', fuzzy_match.DEFAULT_LIMIT, type=int),
+                                       request.args.get('cutoff', fuzzy_match.DEFAULT_SCORE_CUTOFF, type=float)))
+
+def query_fuzzy_matches(query, limit=fuzzy_match.DEFAULT_LIMIT, score_cutoff=fuzzy_match.DEFAULT_SCORE_CUTOFF):
+    # Typo-tolerant lookup of marble and vendor names ("calcata" finds Calacatta)
+    limit = min(max(limit, 1), fuzzy_match.MAX_LIMIT)
+    score_cutoff = min(max(score_cutoff, 0), 100)
+    matches = fuzzy_match.catalog_matcher(DB_PATH).match(query, limit, score_cutoff)
+    return {'query': query, 'matches': [{'text': text, 'kind': kind, 'id': choice_id, 'score': round(score, 1)}
+                                        for (text, kind, choice_id), score in matches]}
+
+CONTENT_SECURITY_POLICY = (
+    "default-src 'self'; "
+    "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.plot.ly https://cdn.jsdelivr.net; "
+    "style-src 'self' 'unsafe-inline'; "
+    "img-src 'self' data: blob:; "
+    "connect-src 'self' http://127.0.0.1:8000;"
+)
 
 @app.route('/3d')
 def serve_3d_visualization():
     visualization_path = os.path.join(os.path.dirname(__file__), 'marble_embeddings_visualization_3d.html')
     if os.path.exists(visualization_path):
         response = make_response(send_file(visualization_path))
-        response.headers['Content-Security-Policy'] = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.plot.ly https://cdn.jsdelivr.net; "
-            "style-src 'self' 'unsafe-inline'; "
-            "img-src 'self' data: blob:; "
-            "connect-src 'self' http://127.0.0.1:8000;"
-        )
+        response.headers['Content-Security-Policy'] = CONTENT_SECURITY_POLICY
         return response
     else:
         return "3D visualization not found", 404
@@ -210,44 +345,42 @@ def serve_3d_visualization():
 @app.after_request
 def add_security_headers(response):
     if 'Content-Security-Policy' not in response.headers:
-        response.headers['Content-Security-Policy'] = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.plot.ly https://cdn.jsdelivr.net; "
-            "style-src 'self' 'unsafe-inline'; "
-            "img-src 'self' data: blob:; "
-            "connect-src 'self' http://127.0.0.1:8000;"
-        )
+        response.headers['Content-Security-Policy'] = CONTENT_SECURITY_POLICY
     return response
 
 @app.route('/pixel.gif')
 def tracking_pixel():
-    ip_address = request.remote_addr
-    user_agent = request.headers.get('User-Agent')
-    referrer = request.referrer
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-    event = request.args.get('event', 'pageview')
-    page = request.args.get('page', '')
-    marble_id = request.args.get('marble_id', '')
-    marble_name = request.args.get('marble_name', '')
-    screen_resolution = request.args.get('sr', '')
-    color_depth = request.args.get('cd', '')
-    plugins = request.args.get('plugins', '')
-    time_on_page = request.args.get('time', '')
-    scroll_depth = request.args.get('scroll', '')
-
-    log_entry = f"{timestamp} - IP: {ip_address}, User-Agent: {user_agent}, Referrer: {referrer}, Event: {event}, Page: {page}, Marble ID: {marble_id}, Marble Name: {marble_name}"
-    app.logger.info(log_entry)
-
-    detailed_log_entry = f"{timestamp} - IP: {ip_address}, User-Agent: {user_agent}, Referrer: {referrer}, Event: {event}, Page: {page}, Marble ID: {marble_id}, Marble Name: {marble_name}, Screen: {screen_resolution}, Color Depth: {color_depth}, Plugins: {plugins}, Time on Page: {time_on_page}, Scroll Depth: {scroll_depth}"
-    app.logger.info(detailed_log_entry)
-
-    response = make_response(generate_pixel())
+    record_pixel_event(request.args, request.remote_addr, request.headers.get('User-Agent'), request.referrer)
+
+    response = make_response(PIXEL_GIF)
     response.headers.set('Content-Type', 'image/gif')
-    response.headers.set('Cache-Control', 'no-cache, no-store, must-revalidate')
-    response.headers.set('Pragma', 'no-cache')
-    response.headers.set('Expires', '0')
+    for header, value in PIXEL_HEADERS.items():
+        response.headers.set(header, value)
     return response
 
+PIXEL_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+}
+
+def record_pixel_event(args, ip, user_agent, referrer):
+    # Only collect the raw values here; the event sink's writer thread batches them into SQLite
+    record_event(
+        args.get('event', 'pageview'),
+        page=args.get('page', ''),
+        marble_id=args.get('marble_id', ''),
+        marble_name=args.get('marble_name', ''),
+        ip=ip,
+        user_agent=user_agent,
+        referrer=referrer,
+        screen=args.get('sr', ''),
+        color_depth=args.get('cd', ''),
+        plugins=args.get('plugins', ''),
+        time_on_page=args.get('time', ''),
+        scroll_depth=args.get('scroll', ''),
+    )
+
 if index is not None:
     num_vectors = index.ntotal
     dimension = index.d
@@ -291,6 +424,22 @@ def check_faiss_db_alignment():
 
 check_faiss_db_alignment()
 
+def check_schema_version():
+    conn = sqlite3.connect(DB_PATH)
+    version = migrate.schema_version(conn)
+    conn.close()
+
+    # The queries below need imageHash, image_blobs and the search tables, so a stale catalog can't serve anything
+    if version < migrate.LATEST_VERSION:
+        raise RuntimeError(f"{DB_PATH} is at schema version {version} of {migrate.LATEST_VERSION}; "
+                           f"run `python migrate.py {DB_PATH}` before starting the server")
+
+check_schema_version()
+
+# Each worker builds its index and starts the refresh thread on its first /api/suggest request, so importing
+# this module (asgi.py, the benchmarks, memory_report) starts nothing
+suggestions = suggest.SuggestRefresher(DB_PATH, logger=app.logger)
+
 @app.route('/api/similar-marbles', methods=['POST'])
 def get_similar_marbles():
     marble_id = request.json.get('marbleId')
@@ -305,43 +454,46 @@ def get_similar_marbles():
     if index is None:
         return jsonify({"error": "FAISS index is not loaded"}), 500
 
-    # Fetch the vector for the given marble_id
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id FROM images ORDER BY id")
-    all_ids = [row[0] for row in c.fetchall()]
-    conn.close()
-
-    try:
-        vector_index = all_ids.index(marble_id)
-    except ValueError:
+    similar_marbles = find_similar_marbles(marble_id)
+    if similar_marbles is None:
         return jsonify({"error": "Marble not found"}), 404
 
+    with timing('serialize'):
+        response = jsonify(similar_marbles)
+    return response
+
+def find_similar_marbles(marble_id):
+    # Fetch the vector for the given marble_id
+    vector_index = index_positions.get(marble_id)
+    if vector_index is None:
+        return None
+
     vector = all_vectors_normalized[vector_index]
 
     # Search for similar marbles
     k = 5  # Number of similar marbles to return
-    distances, indices = index.search(vector.reshape(1, -1), k + 1)
+    with timing('faiss'):
+        distances, indices = index.search(vector.reshape(1, -1), k + 1)
 
     similar_marbles = []
-    for i in indices[0]:
-        if i != vector_index:  # Exclude the query marble itself
-            marble_id = get_marble_id_from_index(int(i))  # Ensure i is an integer
-            if marble_id:
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
-                c.execute("SELECT id, marbleName, marbleOrigin, fileName FROM images WHERE id = ?", (marble_id,))
-                result = c.fetchone()
-                conn.close()
-                if result:
-                    similar_marbles.append({
-                        "id": result[0],
-                        "marbleName": result[1],
-                        "marbleOrigin": result[2],
-                        "imageUrl": f"/api/image/{result[0]}"
-                    })
-
-    return jsonify(similar_marbles)
+    with timing('db'):
+        for i in indices[0]:
+            if i != vector_index:  # Exclude the query marble itself
+                marble_id = get_marble_id_from_index(int(i))  # Ensure i is an integer
+                if marble_id:
+                    conn = sqlite3.connect(DB_PATH)
+                    c = conn.cursor()
+                    c.execute("SELECT id, marbleName, marbleOrigin, fileName, imageHash FROM images WHERE id = ?", (marble_id,))
+                    result = c.fetchone()
+                    conn.close()
+                    if result:
+                        similar_marbles.append({
+                            "id": result[0],
+                            "marbleName": result[1],
+                            "marbleOrigin": result[2],
+                            "imageUrl": image_url(result[0], result[4])
+                        })
+    return similar_marbles
 
 # Load the pre-trained ResNet model
 
@@ -355,91 +507,14 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 def initialize_model():
     global model
-    model = models.resnet50(weights=ResNet50_Weights.IMAGENET1K_V1)
-    model = torch.nn.Sequential(*list(model.children())[:-1])
-    model.eval()
-    model.to(device)
+    model = load_resnet_model(device)
 
 
 # Call this function when your app starts
 initialize_model()
 
-# Define image transformation
-transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-])
-
-def preprocess_image(image):
-    # Convert to RGB if not already
-    image = image.convert('RGB')
-    
-    # Enhance contrast
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(1.0)  # Adjust this value as needed
-    
-    # Sharpen the image
-    image = image.filter(ImageFilter.SHARPEN)
-    
-    # Apply a slight Gaussian blur to reduce noise
-    image = image.filter(ImageFilter.GaussianBlur(radius=0.5))
-    
-    # Convert to numpy array
-    img_array = np.array(image)
-    
-    # Normalize pixel values
-    img_array = img_array / 255.0
-    
-    # Clip values to ensure they're in [0, 1] range
-    img_array = np.clip(img_array, 0, 1)
-    
-    # Convert back to PIL Image
-    processed = Image.fromarray((img_array * 255).astype(np.uint8))
-    
-    return processed
-
-def extract_features(image_data):
-    # Open the image
-    img = Image.open(io.BytesIO(image_data)).convert('RGB')
-    # Preprocess the image
-    preprocessed_img = preprocess_image(img)
-    
-    # Extract color histogram features
-    img_color = preprocessed_img.resize((256, 256))
-    img_array = np.array(img_color)
-    # Calculate color histogram
-    hist_r = np.histogram(img_array[:,:,0], bins=32, range=(0, 256))[0]
-    hist_g = np.histogram(img_array[:,:,1], bins=32, range=(0, 256))[0]
-    hist_b = np.histogram(img_array[:,:,2], bins=32, range=(0, 256))[0]
-    
-    # Concatenate histograms
-    color_features = np.concatenate([hist_r, hist_g, hist_b])
-    
-    # Normalize the color features
-    color_features = color_features / np.sum(color_features)
-    
-    # Extract ResNet features
-    img_resnet = preprocessed_img.resize((224, 224))
-    img_tensor = transform(img_resnet).unsqueeze(0).to(device)
-    with torch.no_grad():
-        resnet_features = model(img_tensor).squeeze().cpu().numpy()
-    
-    # Combine features with emphasis on color
-    color_weight = 0.8 # Adjust this weight to change the emphasis on color
-    resnet_weight = 1 - color_weight
-    
-    # Resize color_features to match resnet_features size
-    color_features_resized = np.zeros(2048)
-    color_features_resized[:96] = color_features
-    
-    combined_features = (color_weight * color_features_resized) + (resnet_weight * resnet_features)
-    
-    # Normalize the combined features
-    combined_features = combined_features / np.linalg.norm(combined_features)
-    
-    return combined_features
+def extract_features(image_data, timings=None, enforce_limits=True):
+    return compute_features(image_data, model, device, timings, enforce_limits)
 
 @app.route('/api/upload-image', methods=['POST'])
 def upload_image():
@@ -460,11 +535,16 @@ def upload_image():
             return jsonify({"error": "No selected file"}), 400
 
         if file:
-            # Read the image file
-            image_data = file.read()
+            # Read at most one byte past the limit so oversized uploads are never fully buffered
+            with timing('read'):
+                image_data = file.read(MAX_UPLOAD_BYTES + 1)
 
             # Extract combined features
-            combined_features = extract_features(image_data)
+            timings = {}
+            combined_features = extract_features(image_data, timings)
+            for stage, seconds in timings.items():
+                record_span(stage, seconds)
+            app.logger.info("Upload feature timings: " + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items()))
 
             # Ensure the features have the correct dimension
             if len(combined_features) != index.d:
@@ -472,58 +552,69 @@ def upload_image():
                     f"Feature dimension mismatch. Expected {index.d}, got {len(combined_features)}")
                 return jsonify({"error": "Feature dimension mismatch"}), 500
 
-            # Compare the combined features with the FAISS index
-            D, I = index.search(np.array([combined_features]).astype('float32'), 20)
-
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-
-            similar_marbles = []
-            for i, idx in enumerate(I[0]):
-                c.execute(
-                    "SELECT id FROM images ORDER BY id LIMIT 1 OFFSET ?", (int(idx),))
-                result = c.fetchone()
-                if result:
-                    db_id = result[0]
-                    c.execute(
-                        "SELECT id, marbleName, marbleOrigin, fileName, stoneColor, stainResistance, costRange, description, thermalExpansion FROM images WHERE id = ?",
-                        (db_id,))
-                    marble = c.fetchone()
-                    if marble:
-                        # Calculate similarity (using cosine similarity)
-                        marble_vector = all_vectors_normalized[idx]
-                        similarity = np.dot(combined_features, marble_vector) / (np.linalg.norm(combined_features) * np.linalg.norm(marble_vector))
-
-                        similar_marbles.append({
-                            'id': marble[0],
-                            'marbleName': marble[1],
-                            'marbleOrigin': marble[2],
-                            'fileName': marble[3],
-                            'stoneColor': marble[4],
-                            'stainResistance': marble[5],
-                            'costRange': marble[6],
-                            'description': marble[7],
-                            'thermalExpansion': marble[8],
-                            'imageUrl': f'/api/image/{marble[0]}',
-                            'similarity': float(similarity)
-                        })
-
-            conn.close()
-
-            # Sort by similarity and get top 6
-            similar_marbles = sorted(
-                similar_marbles,
-                key=lambda x: x['similarity'],
-                reverse=True)[:6]
+            similar_marbles = match_uploaded_features(combined_features)
 
             app.logger.info(f"Returning {len(similar_marbles)} similar marbles")
-            return jsonify(similar_marbles)
-
+            with timing('serialize'):
+                response = jsonify(similar_marbles)
+            return response
+
+    except UploadRejected as e:
+        app.logger.warning(f"Rejected upload: {str(e)}")
+        return jsonify({"error": str(e)}), e.status
+    except Image.DecompressionBombError as e:
+        app.logger.warning(f"Rejected upload: {str(e)}")
+        return jsonify({"error": "Image dimensions are too large"}), 413
     except Exception as e:
         app.logger.error(f"Error in upload_image: {str(e)}")
         app.logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+def match_uploaded_features(combined_features):
+    # Compare the combined features with the FAISS index
+    with timing('faiss'):
+        D, I = index.search(np.array([combined_features]).astype('float32'), 20)
+
+    db_start = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+
+    similar_marbles = []
+    for i, idx in enumerate(I[0]):
+        db_id = get_marble_id_from_index(idx)
+        if db_id:
+            c.execute(
+                "SELECT id, marbleName, marbleOrigin, fileName, stoneColor, stainResistance, costRange, description, thermalExpansion, imageHash FROM images WHERE id = ?",
+                (db_id,))
+            marble = c.fetchone()
+            if marble:
+                # Calculate similarity (using cosine similarity)
+                marble_vector = all_vectors_normalized[idx]
+                similarity = np.dot(combined_features, marble_vector) / (np.linalg.norm(combined_features) * np.linalg.norm(marble_vector))
+
+                similar_marbles.append({
+                    'id': marble[0],
+                    'marbleName': marble[1],
+                    'marbleOrigin': marble[2],
+                    'fileName': marble[3],
+                    'stoneColor': marble[4],
+                    'stainResistance': marble[5],
+                    'costRange': marble[6],
+                    'description': marble[7],
+                    'thermalExpansion': marble[8],
+                    'imageUrl': image_url(marble[0], marble[9]),
+                    'similarity': similarity
+                })
+
+    conn.close()
+    record_span('db', time.perf_counter() - db_start)
+
+    # Sort by similarity and get top 6
+    return sorted(
+        similar_marbles,
+        key=lambda x: x['similarity'],
+        reverse=True)[:6]
+
 # Add this function at the top of your file or in a utils module
 
 
@@ -542,19 +633,23 @@ def normalize_l2(x):
 def rebuild_combined_index():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT id, image FROM images")
+    c.execute("SELECT id, image FROM image_blobs ORDER BY id")
     
     combined_features = []
+    ids = []
     for id, image_data in c.fetchall():
-        features = extract_features(image_data)
+        features = extract_features(image_data, enforce_limits=False)
         combined_features.append(features)
+        ids.append(id)
     
     combined_features = np.array(combined_features)
     
-    global index, all_vectors_normalized
+    global index, all_vectors_normalized, index_ids, index_positions
     index = faiss.IndexFlatL2(2048)  # Use 2048 dimensions for combined features
     index.add(combined_features.astype('float32'))
     all_vectors_normalized = normalize(combined_features)
+    index_ids = ids
+    index_positions = {marble_id: position for position, marble_id in enumerate(ids)}
     
     faiss.write_index(index, index_path)
     
@@ -564,7 +659,11 @@ def rebuild_combined_index():
 
 @app.route('/log_event', methods=['POST'])
 def log_event():
-    event_data = request.json
-    # Log the event (you can customize this part based on your logging needs)
-    app.logger.info(f"Event logged: {event_data}")
-    return jsonify({"status": "success", "message": "Event logged successfully"})
\ No newline at end of file
+    try:
+        record_client_event(request.get_json(silent=True), request.remote_addr,
+                            request.headers.get('User-Agent'), request.referrer)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(LOG_EVENT_RESPONSE)
+
+LOG_EVENT_RESPONSE = {"status": "success", "message": "Event logged successfully"}
@@ -0,0 +1,113 @@
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from flask import abort, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+# CRA fingerprints everything under static/ as name.<hash>.ext (and name.<hash>.chunk.js)
+FINGERPRINT_RE = re.compile(r'^static/.+\.[0-9a-f]{8,}(\.chunk)?\.[a-z0-9]+$')
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.css', '.json', '.svg', '.map', '.txt', '.ico'}
+# Encodings in the order we prefer them, with the suffix of the precompressed file
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+class StaticAsset:
+    def __init__(self, path, rel_path):
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:16]
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = digest
+        self.mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        self.cache_control = IMMUTABLE_CACHE if FINGERPRINT_RE.match(rel_path) else REVALIDATE_CACHE
+        # Only keep variants that are actually smaller than the original
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            variant = path + suffix
+            if os.path.exists(variant) and os.path.getsize(variant) < self.size:
+                self.variants[encoding] = variant
+
+
+class StaticManifest:
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        self.assets = {}
+
+    def scan(self):
+        # Read once at startup; a new frontend build means a new deploy and a worker restart
+        assets = {}
+        for root, _, files in os.walk(self.build_dir):
+            for name in files:
+                if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                    continue
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, self.build_dir).replace(os.sep, '/')
+                assets[rel_path] = StaticAsset(path, rel_path)
+        self.assets = assets
+        return self
+
+    def get(self, rel_path):
+        return self.assets.get(rel_path)
+
+    def send(self, rel_path):
+        asset = self.assets.get(rel_path)
+        if asset is None:
+            abort(404)
+        encoding = None
+        for candidate in asset.variants:
+            if request.accept_encodings.quality(candidate) > 0:
+                encoding = candidate
+                break
+
+        # Each encoding is a different representation, so it gets its own ETag
+        path = asset.variants[encoding] if encoding else asset.path
+        etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+        response = send_file(path, mimetype=asset.mimetype, etag=etag, last_modified=asset.mtime, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+            # Otherwise the browser sees the .gz/.br file name
+            response.headers.pop('Content-Disposition', None)
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = asset.cache_control
+        return response
+
+
+def compress_build(build_dir, min_size=1024):
+    # Run after `npm run build`; writes .gz always and .br when the brotli package is installed
+    written = 0
+    for root, _, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS or os.path.getsize(path) < min_size:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            written += 1
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+                written += 1
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompress the React build for static_assets')
+    parser.add_argument('build_dir', nargs='?',
+                        default=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'marble-gallery', 'build')))
+    args = parser.parse_args()
+    count = compress_build(args.build_dir)
+    print(f"Wrote {count} compressed files under {args.build_dir}" + ('' if brotli else ' (install brotli for .br files)'))
@@ -0,0 +1,167 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nlargest
+
+from analytics_store import connect_analytics_db, query_counts, rollup_worker
+from catalog_search import search_version
+from event_sink import EVENTS_DB_PATH
+
+# Prefixes up to this length match most of the catalog, so their top suggestions are computed at build time.
+# Longer prefixes cover few keys and are ranked on the fly from the bisect range.
+PRECOMPUTED_PREFIX_LENGTH = 3
+MAX_SUGGESTIONS = 10
+MAX_QUERY_LENGTH = 64
+REFRESH_INTERVAL = int(os.environ.get('SUGGEST_REFRESH_INTERVAL', 30))
+RERANK_INTERVAL = int(os.environ.get('SUGGEST_RERANK_INTERVAL', 300))
+
+logger = logging.getLogger(__name__)
+WORD_START_RE = re.compile(r'\b\w', re.UNICODE)
+# Order suggestions of equal popularity by kind: a marble name is the likeliest thing being typed
+KIND_PRIORITY = {'marble': 2, 'vendor': 1, 'origin': 0}
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+class SuggestIndex:
+    # A sorted array of lowercase keys (each entry's full text and every word start in it, so "carr" finds
+    # "Bianco Carrara") searched with bisect, plus precomputed answers for the short prefixes
+
+    def __init__(self, entries, version=None):
+        # entries: (text, kind, id, popularity)
+        self.version = version
+        self.built_at = time.monotonic()
+        self.entries = entries
+        self.rank = [(popularity, KIND_PRIORITY[kind], -len(text)) for text, kind, _, popularity in entries]
+        pairs = sorted((normalize(text)[match.start():], position)
+                       for position, (text, _, _, _) in enumerate(entries)
+                       for match in WORD_START_RE.finditer(normalize(text)))
+        self.keys = [key for key, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+        candidates = defaultdict(set)
+        for key, position in pairs:
+            for length in range(1, min(len(key), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                candidates[key[:length]].add(position)
+        self.top = {prefix: self._best(positions) for prefix, positions in candidates.items()}
+
+    def _best(self, positions, limit=MAX_SUGGESTIONS):
+        return nlargest(limit, positions, key=self.rank.__getitem__)
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        prefix = normalize(query[:MAX_QUERY_LENGTH])
+        if not prefix:
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            best = self.top.get(prefix, [])[:limit]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '￿', start)
+            best = self._best(set(self.positions[start:end]), limit)
+        return [{'text': self.entries[position][0], 'kind': self.entries[position][1], 'id': self.entries[position][2]}
+                for position in best]
+
+
+def load_entries(db_path, events_db_path=EVENTS_DB_PATH):
+    conn = sqlite3.connect(db_path)
+    marbles = conn.execute("SELECT id, marbleName, marbleOrigin FROM images WHERE marbleName IS NOT NULL").fetchall()
+    vendors = conn.execute("""
+        SELECT v.id, v.name, COUNT(mva.marble_id)
+        FROM vendors v LEFT JOIN marble_vendor_association mva ON mva.vendor_id = v.id
+        WHERE v.name IS NOT NULL GROUP BY v.id
+    """).fetchall()
+    version = search_version(conn)
+    conn.close()
+
+    try:
+        analytics = connect_analytics_db(events_db_path)
+        clicks = query_counts(analytics, 'marble_click')
+        analytics.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Suggestions are unranked, click counts unavailable: {e}")
+        clicks = {}
+
+    entries = []
+    seen_names = set()
+    origin_clicks = defaultdict(int)
+    for marble_id, name, origin in marbles:
+        # Click events carry the marble name, so marbles sharing a name share its count
+        popularity = clicks.get(name, 0)
+        if origin:
+            origin_clicks[origin] += popularity + 1
+        if name not in seen_names:
+            seen_names.add(name)
+            entries.append((name, 'marble', marble_id, popularity))
+    entries.extend((origin, 'origin', None, popularity) for origin, popularity in origin_clicks.items())
+    # Vendors have no click events of their own; the size of their range stands in
+    entries.extend((name, 'vendor', vendor_id, marble_count) for vendor_id, name, marble_count in vendors)
+    return entries, version
+
+
+def build_index(db_path, events_db_path=EVENTS_DB_PATH):
+    entries, version = load_entries(db_path, events_db_path)
+    return SuggestIndex(entries, version)
+
+
+class SuggestRefresher:
+    # One index per worker process. Every REFRESH_INTERVAL seconds the catalog's search_version is checked and a
+    # rebuilt index is swapped in if it moved, or if the click counts are older than RERANK_INTERVAL. Lookups
+    # only read self.index, so they never wait for a rebuild.
+
+    def __init__(self, db_path, interval=REFRESH_INTERVAL, rerank_interval=RERANK_INTERVAL, logger=logger):
+        self.db_path = db_path
+        self.interval = interval
+        self.rerank_interval = rerank_interval
+        self.logger = logger
+        self.index = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        self.ensure_started()
+        index = self.index
+        # No index until a build succeeds; the refresh thread keeps retrying
+        return index.suggest(query, limit) if index is not None else []
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self.index is None:
+                try:
+                    self.index = build_index(self.db_path)
+                except Exception:
+                    # Lookups return nothing until the refresh thread gets a build through
+                    self.logger.exception("Suggestion index build failed")
+            # Click events only reach query_counts once they are folded into the rollups
+            rollup_worker.ensure_started()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='suggest-refresh', daemon=True).start()
+
+    def stale(self):
+        if self.index is None or time.monotonic() - self.index.built_at >= self.rerank_interval:
+            return True
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return search_version(conn) != self.index.version
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.stale():
+                    self.index = build_index(self.db_path)
+            except Exception:
+                # Anything escaping here would end the thread and freeze this worker's index
+                self.logger.exception("Suggestion index refresh failed")
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+import analytics_store
+from analytics_store import backfill_legacy_logs, connect_analytics_db, query_counts, refresh
+
+
+class TestAnalyticsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.conn = connect_analytics_db(os.path.join(self.directory.name, 'events.db'))
+
+    def tearDown(self):
+        self.conn.close()
+        self.directory.cleanup()
+
+    def add_events(self, *scroll_depths):
+        self.conn.executemany("INSERT INTO events (ts, event, scroll_depth) VALUES (?, 'scroll', ?)",
+                              [(time.time(), depth) for depth in scroll_depths])
+        self.conn.commit()
+
+    def offset(self):
+        return self.conn.execute("SELECT value FROM rollup_state WHERE name = 'events_offset'").fetchone()[0]
+
+    def test_out_of_range_scroll_depths_do_not_stop_the_rollup(self):
+        self.add_events('inf', '1e400', 'nan', '-20', '150', '42.4')
+        self.assertEqual(refresh(self.conn), 6)
+        self.assertEqual(self.offset(), 6)
+        self.assertEqual(query_counts(self.conn, 'scroll_depth'), {'0': 1, '100': 1, '42': 1})
+        self.assertEqual(query_counts(self.conn, 'event'), {'scroll': 6})
+
+        self.add_events('-inf', '7')
+        self.assertEqual(refresh(self.conn), 2)
+        self.assertEqual(self.offset(), 8)
+
+    def test_legacy_timestamps_are_local_time(self):
+        previous = os.environ.get('TZ')
+        os.environ['TZ'] = 'America/New_York'
+        time.tzset()
+        self.addCleanup(self.restore_timezone, previous)
+        logs = pd.DataFrame({'timestamp': pd.to_datetime(['2026-10-01 23:30:00']), 'Event': ['pageview'],
+                             'Page': ['/']})
+
+        with patch('log_parser.parse_logs', return_value=logs):
+            self.assertEqual(backfill_legacy_logs(self.conn), 1)
+        refresh(self.conn)
+
+        ts = self.conn.execute("SELECT ts FROM events").fetchone()[0]
+        self.assertEqual(time.strftime('%Y-%m-%d %H:%M', time.localtime(ts)), '2026-10-01 23:30')
+        self.assertEqual(self.conn.execute("SELECT period FROM rollup_counts WHERE grain = 'day'").fetchone()[0],
+                         '2026-10-01')
+
+    def restore_timezone(self, previous):
+        if previous is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = previous
+        time.tzset()
+
+
+if __name__ == '__main__':
+    unittest.main()
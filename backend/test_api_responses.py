@@ -0,0 +1,71 @@
+import gzip
+import unittest
+
+import numpy as np
+import orjson
+from flask import Flask, jsonify
+
+import api_responses
+
+LARGE = {'marbles': [{'id': i, 'name': f'Marble {i}', 'score': np.float32(0.5)} for i in range(200)]}
+
+
+class TestCompressResponse(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        api_responses.init_app(app, min_bytes=1024)
+
+        @app.route('/small')
+        def small():
+            return jsonify({'ok': True})
+
+        @app.route('/large')
+        def large():
+            response = jsonify(LARGE)
+            response.set_etag('catalog-v1')
+            return response
+
+        @app.route('/missing')
+        def missing():
+            return jsonify({'error': 'x' * 4096}), 404
+
+        self.client = app.test_client()
+
+    def test_small_bodies_are_sent_uncompressed(self):
+        response = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+        self.assertEqual(response.get_json(), {'ok': True})
+        # Caches still need to know the representation can vary once the body grows
+        self.assertIn('Accept-Encoding', response.vary)
+
+    def test_large_bodies_are_compressed_when_accepted(self):
+        plain = self.client.get('/large', headers={'Accept-Encoding': 'identity'})
+        self.assertIsNone(plain.headers.get('Content-Encoding'))
+
+        response = self.client.get('/large', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(orjson.loads(gzip.decompress(response.get_data())), orjson.loads(plain.get_data()))
+        self.assertLess(int(response.headers['Content-Length']), int(plain.headers['Content-Length']))
+
+    def test_compressed_etag_becomes_weak(self):
+        plain = self.client.get('/large', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(plain.headers['ETag'], '"catalog-v1"')
+        response = self.client.get('/large', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['ETag'], 'W/"catalog-v1"')
+
+    def test_only_successful_responses_are_compressed(self):
+        response = self.client.get('/missing', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+
+    def test_brotli_is_preferred_only_when_installed(self):
+        app = Flask(__name__)
+        with app.test_request_context(headers={'Accept-Encoding': 'br, gzip'}):
+            self.assertEqual(api_responses.choose_encoding(), 'br' if api_responses.brotli else 'gzip')
+        with app.test_request_context(headers={'Accept-Encoding': 'identity'}):
+            self.assertIsNone(api_responses.choose_encoding())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import catalog_search
+from catalog_fixtures import make_catalog
+
+
+class TestCatalogSearch(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        make_catalog(self.db_path, images=[
+            {'id': 1, 'marbleName': 'Calacatta Gold', 'marbleOrigin': 'Italy', 'description': 'White marble with gold veining'},
+            {'id': 2, 'marbleName': 'Bianco Carrara', 'marbleOrigin': 'Italy', 'description': 'Grey veins, quarried near Calacatta'},
+            {'id': 3, 'marbleName': 'Nero Marquina', 'marbleOrigin': 'Spain', 'description': 'Black marble'},
+        ]).close()
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def test_user_input_compiles_to_quoted_prefixes(self):
+        tokens = catalog_search.search_tokens('Calac" OR marbleName:* (gold')
+        self.assertEqual(catalog_search.compile_match(tokens), '"calac"* "or"* "marblename"* "gold"*')
+        self.assertIsNone(catalog_search.compile_match(catalog_search.search_tokens('"(*)"')))
+        self.assertIsNone(catalog_search.compile_trigram_match(['ca']))
+
+    def test_name_hits_rank_above_description_hits(self):
+        ids, total = catalog_search.search_page(self.db_path, 'calac', 20, 0)
+        self.assertEqual((ids, total), ([1, 2], 2))
+
+    def test_substring_falls_back_to_trigrams(self):
+        self.assertEqual(catalog_search.search_page(self.db_path, 'arrar', 20, 0), ([2], 1))
+
+    def test_catalog_changes_invalidate_cached_hits(self):
+        self.assertEqual(catalog_search.search_page(self.db_path, 'marquina', 20, 0), ([3], 1))
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE images SET marbleName = 'Nero Portoro' WHERE id = 3")
+        conn.commit()
+        conn.close()
+        self.assertEqual(catalog_search.search_page(self.db_path, 'marquina', 20, 0), ([], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from unittest.mock import patch
+
+import event_sink
+
+
+class TestRecordClientEvent(unittest.TestCase):
+
+    def record(self, body):
+        with patch.object(event_sink.event_sink, 'record') as record:
+            event_sink.record_client_event(body, '10.0.0.1', 'test-agent', 'https://example.com/')
+        return record.call_args[0][0]
+
+    def test_known_fields_become_columns(self):
+        event = self.record({'event_type': 'marble_click',
+                             'data': {'route': '/gallery', 'marble_id': 5, 'marble_name': 'Nero', 'x': 1}})
+        self.assertEqual(event['event'], 'marble_click')
+        self.assertEqual((event['page'], event['marble_id'], event['marble_name']), ('/gallery', 5, 'Nero'))
+        self.assertEqual((event['ip'], event['user_agent'], event['referrer']),
+                         ('10.0.0.1', 'test-agent', 'https://example.com/'))
+        self.assertEqual(event['extra'], {'x': 1})
+
+    def test_missing_body_is_recorded_and_other_json_rejected(self):
+        self.assertIsNone(self.record(None)['event'])
+        for body in ([1, 2], 'pageview', 5):
+            with self.assertRaises(ValueError):
+                event_sink.record_client_event(body, None, None, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import io
+import unittest
+
+from PIL import Image
+
+try:
+    from feature_extraction import EXIF_ORIENTATION_TAG, UploadRejected, decode_upload
+except ImportError:  # torch and torchvision are only installed on the serving hosts
+    decode_upload = None
+
+
+def encode(image, format='JPEG', **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+@unittest.skipIf(decode_upload is None, 'feature_extraction needs torch')
+class TestDecodeUpload(unittest.TestCase):
+
+    def test_byte_limit_is_checked_before_decoding(self):
+        with self.assertRaises(UploadRejected) as raised:
+            decode_upload(b'\xff' * 2048, max_bytes=1024)
+        self.assertEqual(raised.exception.status, 413)
+
+    def test_pixel_limit_is_checked_from_the_header(self):
+        # A flat 3000x3000 PNG is a few KB on disk and 27 MB decoded
+        data = encode(Image.new('RGB', (3000, 3000), (120, 120, 120)), 'PNG')
+        with self.assertRaises(UploadRejected) as raised:
+            decode_upload(data, max_pixels=1_000_000)
+        self.assertEqual(raised.exception.status, 413)
+
+    def test_unreadable_data_is_rejected(self):
+        with self.assertRaises(UploadRejected) as raised:
+            decode_upload(b'not an image')
+        self.assertEqual(raised.exception.status, 400)
+
+    def test_large_images_are_reduced_towards_the_target_size(self):
+        img = decode_upload(encode(Image.new('RGB', (2048, 1536), (200, 30, 30))), target_size=256)
+        self.assertEqual(img.mode, 'RGB')
+        self.assertTrue(256 <= min(img.size) < 512, img.size)
+
+    def test_exif_orientation_is_applied(self):
+        # Red on the left, blue on the right, stored with "rotate 90 clockwise to display" (orientation 6)
+        image = Image.new('RGB', (64, 32), (255, 0, 0))
+        image.paste((0, 0, 255), (32, 0, 64, 32))
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION_TAG] = 6
+        img = decode_upload(encode(image, exif=exif, quality=95), target_size=16)
+
+        self.assertEqual(img.size, (16, 32))
+        top, bottom = img.getpixel((8, 2)), img.getpixel((8, 29))
+        self.assertGreater(top[0], top[2])
+        self.assertGreater(bottom[2], bottom[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
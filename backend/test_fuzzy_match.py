@@ -0,0 +1,42 @@
+import sqlite3
+import unittest
+
+from rapidfuzz import fuzz
+
+from catalog_fixtures import make_catalog
+from fuzzy_match import FuzzyMatcher, load_choices
+
+
+class TestFuzzyMatch(unittest.TestCase):
+
+    def setUp(self):
+        conn = make_catalog(sqlite3.connect(':memory:'), images=[
+            {'id': 1, 'marbleName': 'Calacatta Gold'}, {'id': 2, 'marbleName': 'Bianco Carrara'},
+            {'id': 3, 'marbleName': 'Nero Marquina'}, {'id': 4, 'marbleName': 'Nero Marquina'},
+        ], vendors=[{'id': 1, 'location': 'Brooklyn', 'name': 'Carrara Stoneworks'}])
+        self.matcher = FuzzyMatcher(load_choices(conn))
+        conn.close()
+
+    def names(self, matches):
+        return [(text, kind, choice_id) for (text, kind, choice_id), _ in matches]
+
+    def test_typos_match_names(self):
+        self.assertEqual(self.names(self.matcher.match('nero marqina', limit=1)), [('Nero Marquina', 'marble', 3)])
+        self.assertEqual(self.names(self.matcher.match('CALACATA gold!', limit=1)), [('Calacatta Gold', 'marble', 1)])
+        self.assertEqual(self.matcher.match('xyzzy'), [])
+        self.assertEqual(self.matcher.match('  '), [])
+
+    def test_cutoff_and_scorer(self):
+        matches = self.matcher.match('carrara', limit=None, score_cutoff=70, scorer=fuzz.partial_ratio)
+        self.assertEqual(self.names(matches), [('Bianco Carrara', 'marble', 2), ('Carrara Stoneworks', 'vendor', 1)])
+        self.assertTrue(all(score >= 70 for _, score in matches))
+
+    def test_batch_matches_agree_with_single_queries(self):
+        queries = ['carara', 'nero', 'calacatta', 'xyzzy', '']
+        for limit in (1, 2, None):
+            self.assertEqual(self.matcher.match_many(queries, limit),
+                             [self.matcher.match(query, limit) for query in queries])
+
+
+if __name__ == '__main__':
+    unittest.main()
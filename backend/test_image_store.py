@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import image_store
+from catalog_fixtures import make_catalog
+
+ORIGINAL = b'\x89PNG original' * 100
+REPLACEMENT = b'\x89PNG watermarked' * 100
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TestWriteImage(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = make_catalog(sqlite3.connect(':memory:'), images=[
+            {'id': 1, 'marbleName': 'Calacatta', 'image': ORIGINAL},
+            {'id': 2, 'marbleName': 'Nero Marquina'},
+        ])
+        self.addCleanup(self.conn.close)
+
+    def stored(self, image_id):
+        return self.conn.execute("""
+            SELECT images.imageHash, image_blobs.image FROM images JOIN image_blobs ON image_blobs.id = images.id
+            WHERE images.id = ?
+        """, (image_id,)).fetchone()
+
+    def test_replacing_an_image_stores_its_hash(self):
+        self.assertEqual(self.stored(1), (sha256(ORIGINAL), ORIGINAL))
+        image_store.write_image(self.conn, 1, REPLACEMENT)
+        self.assertEqual(self.stored(1), (sha256(REPLACEMENT), REPLACEMENT))
+        self.assertEqual(image_store.query_image_version(self.conn, 1), (sha256(REPLACEMENT), len(REPLACEMENT)))
+
+    def test_adding_an_image_stores_its_hash(self):
+        image_store.write_image(self.conn, 2, ORIGINAL)
+        self.assertEqual(self.stored(2), (sha256(ORIGINAL), ORIGINAL))
+
+    def test_writes_that_bypass_the_helper_clear_the_hash(self):
+        self.conn.execute("UPDATE image_blobs SET image = ? WHERE id = 1", (REPLACEMENT,))
+        self.assertIsNone(self.stored(1)[0])
+        # Still served with the right validator until migrate.py stores it
+        self.assertEqual(image_store.query_image_version(self.conn, 1)[0], sha256(REPLACEMENT))
+
+
+class TestBlobStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'catalog.db')
+        make_catalog(self.path, images=[{'id': 1, 'marbleName': 'Calacatta', 'image': ORIGINAL}]).close()
+
+    def open(self, chunk_size=500):
+        stream = image_store.BlobStream.open(self.path, 1, chunk_size)
+        self.addCleanup(stream.close)
+        return stream
+
+    def test_whole_image_is_read_in_chunks(self):
+        stream = self.open()
+        chunks = list(stream)
+        self.assertEqual([len(chunk) for chunk in chunks], [500, 500, 300])
+        self.assertEqual(b''.join(chunks), ORIGINAL)
+        # Exhausting the stream releases the blob and its connection
+        self.assertIsNone(stream.conn)
+
+    def test_selected_range_is_read_exactly(self):
+        stream = self.open()
+        stream.select(450, 1020)
+        self.assertEqual(stream.length, 570)
+        chunks = list(stream)
+        self.assertEqual([len(chunk) for chunk in chunks], [500, 70])
+        self.assertEqual(b''.join(chunks), ORIGINAL[450:1020])
+
+    def test_abandoned_download_is_closed(self):
+        stream = self.open()
+        chunks = iter(stream)
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(stream.conn)
+        # The WSGI server calls close() too
+        stream.close()
+
+    def test_missing_image(self):
+        self.assertIsNone(image_store.BlobStream.open(self.path, 2))
+
+
+class TestImageHeaders(unittest.TestCase):
+    image_hash = sha256(ORIGINAL)
+
+    def test_etag_is_the_full_hash(self):
+        status, headers = image_store.image_headers(self.image_hash, image_store.IMMUTABLE_CACHE, 1400, None)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['ETag'], f'"{self.image_hash}"')
+        self.assertEqual((headers['Content-Length'], headers['Accept-Ranges']), ('1400', 'bytes'))
+
+    def test_single_ranges_are_partial(self):
+        requested = image_store.byte_range('bytes=100-199', None, self.image_hash, 1400)
+        self.assertEqual(requested, (100, 200))
+        status, headers = image_store.image_headers(self.image_hash, image_store.IMMUTABLE_CACHE, 1400, requested)
+        self.assertEqual((status, headers['Content-Range'], headers['Content-Length']), (206, 'bytes 100-199/1400', '100'))
+
+        self.assertEqual(image_store.byte_range('bytes=-100', None, self.image_hash, 1400), (1300, 1400))
+        # Multipart ranges get the whole image
+        self.assertIsNone(image_store.byte_range('bytes=0-9,20-29', None, self.image_hash, 1400))
+
+    def test_unsatisfiable_ranges(self):
+        requested = image_store.byte_range('bytes=5000-', None, self.image_hash, 1400)
+        self.assertIs(requested, False)
+        status, headers = image_store.image_headers(self.image_hash, image_store.IMMUTABLE_CACHE, 1400, requested)
+        self.assertEqual((status, headers['Content-Range']), (416, 'bytes */1400'))
+
+    def test_if_range_must_match_the_current_hash(self):
+        self.assertEqual(image_store.byte_range('bytes=0-9', f'"{self.image_hash}"', self.image_hash, 1400), (0, 10))
+        self.assertIsNone(image_store.byte_range('bytes=0-9', f'"{sha256(REPLACEMENT)}"', self.image_hash, 1400))
+
+    def test_versions_match_on_the_url_prefix(self):
+        self.assertEqual(image_store.image_url(1, self.image_hash), f'/api/image/1/{self.image_hash[:16]}')
+        self.assertEqual(image_store.image_url(1, None), '/api/image/1')
+        self.assertTrue(image_store.matches_version(self.image_hash, self.image_hash[:16]))
+        self.assertFalse(image_store.matches_version(self.image_hash, self.image_hash[:8]))
+
+
+if __name__ == '__main__':
+    unittest.main()
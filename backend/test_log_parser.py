@@ -0,0 +1,55 @@
+import glob
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import log_parser
+
+# tracking_pixel() wrote a short line and then a detailed line for each hit; older hits only have the short one
+LOG_LINES = """\
+2024-05-01 10:00:00,123 - IP: 1.2.3.4, User-Agent: Firefox, Referrer: None, Event: pageview, Page: /, Marble ID: None, Marble Name: None
+2024-05-01 10:00:00,124 - IP: 1.2.3.4, User-Agent: Firefox, Referrer: None, Event: pageview, Page: /, Marble ID: None, Marble Name: None, Screen: 1920x1080, Color Depth: 24, Plugins: 0, Time on Page: 5, Scroll Depth: 40
+2024-05-01 10:00:05,001 - IP: 1.2.3.4, User-Agent: Firefox, Referrer: /, Event: marble_click, Page: /gallery, Marble ID: 7, Marble Name: Nero Marquina [in /srv/server_production.py:250]
+2024-05-01 10:00:06,001 - Serving image 7
+2024-05-01 10:00:07,001 - IP: 5.6.7.8, User-Agent: Safari, Referrer: None, Event: pageview, Page: /about, Marble ID: None, Marble Name: None
+"""
+
+
+class TestParseLogs(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, 'marble_gallery.log')
+        with open(self.log_path, 'w') as f:
+            f.write(LOG_LINES)
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+        patcher = patch.object(log_parser, 'LOG_CACHE_DIR', self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def parse(self):
+        return log_parser.parse_logs(os.path.join(self.directory.name, 'marble_gallery.log*'))
+
+    def test_short_and_detailed_pair_counts_once(self):
+        df = self.parse()
+        self.assertEqual(len(df), 3)
+        self.assertEqual(log_parser.get_event_counts(df), {'pageview': 2, 'marble_click': 1})
+        first = df.iloc[0]
+        self.assertEqual((first['Screen'], first['Scroll Depth']), ('1920x1080', '40'))
+        self.assertEqual(df.iloc[1]['Marble Name'], 'Nero Marquina')
+        self.assertEqual(str(df.iloc[2]['timestamp']), '2024-05-01 10:00:07')
+
+    def test_corrupt_cache_is_reparsed(self):
+        self.assertEqual(len(self.parse()), 3)
+        (cache_path,) = glob.glob(os.path.join(self.cache_dir, '*.pkl'))
+        with open(cache_path, 'wb') as f:
+            f.write(b'\x80\x04truncated')
+        self.assertEqual(len(self.parse()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
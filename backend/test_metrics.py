@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+import metrics
+from metrics import BUCKETS, REQUEST_METRIC, SPAN_METRIC, HistogramCollector
+
+
+def series(count, total):
+    # Every observation in the 0.1s bucket and above
+    return [0 if bound < 0.1 else count for bound in BUCKETS] + [total, count]
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.collector = HistogramCollector(self.directory.name)
+        for name, value in (('collector', self.collector), ('METRICS_TOKEN', 'secret')):
+            patcher = patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        app = Flask(__name__)
+        metrics.init_app(app)
+
+        @app.route('/marble/<int:marble_id>')
+        def marble(marble_id):
+            with metrics.timing('db'):
+                pass
+            with metrics.timing('db'):
+                pass
+            return 'ok'
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_worker(self, pid, snapshot):
+        with open(metrics.worker_path(pid, self.directory.name), 'w') as f:
+            json.dump(snapshot, f)
+
+    def test_server_timing_sums_repeated_spans(self):
+        response = self.client.get('/marble/5')
+        entries = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(entries, ['db', 'total'])
+
+        merged = self.collector.collect()
+        self.assertEqual(merged[(SPAN_METRIC, (('route', '/marble/<int:marble_id>'), ('span', 'db')))][-1], 2)
+        self.assertEqual(merged[(REQUEST_METRIC, (('method', 'GET'), ('route', '/marble/<int:marble_id>'),
+                                                  ('status', '200')))][-1], 1)
+
+    def test_metrics_needs_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        with patch.object(metrics, 'METRICS_TOKEN', None):
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer None'}).status_code, 403)
+
+    def test_live_workers_are_summed_and_dead_ones_pruned(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        key = [REQUEST_METRIC, [['route', '/api/images']]]
+        self.write_worker(os.getpid(), [key + [series(2, 0.5)]])
+        self.write_worker(os.getppid(), [key + [series(3, 1.0)]])
+        self.write_worker(exited.pid, [key + [series(100, 50.0)]])
+
+        merged = self.collector.collect()
+        self.assertEqual(merged[(REQUEST_METRIC, (('route', '/api/images'),))][-2:], [1.5, 5])
+        self.assertFalse(os.path.exists(metrics.worker_path(exited.pid, self.directory.name)))
+
+        metrics.remove_worker_file(os.getppid(), self.directory.name)
+        metrics.clear_worker_files(self.directory.name)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
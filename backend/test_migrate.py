@@ -0,0 +1,67 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import catalog_search
+import migrate
+from catalog_fixtures import make_catalog
+
+IMAGE = b'\x89PNG calacatta' * 100
+
+
+class TestMigrate(unittest.TestCase):
+
+    def setUp(self):
+        # A file, because journal_mode=WAL is only recorded on disk
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'catalog.db')
+        self.conn = make_catalog(self.path, images=[
+            {'id': 1, 'marbleName': 'Calacatta Gold', 'marbleOrigin': 'Italy', 'image': IMAGE},
+            {'id': 2, 'marbleName': 'Nero Marquina', 'marbleOrigin': 'Spain'},
+        ], vendors=[{'id': 1, 'location': 'Boston', 'name': 'Stone Source'}], migrated=False)
+        self.addCleanup(self.conn.close)
+
+    def objects(self, kind):
+        return {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+    def test_unversioned_catalog_reaches_the_latest_version(self):
+        self.assertEqual(migrate.schema_version(self.conn), 0)
+        applied = migrate.migrate(self.conn, vacuum=False)
+
+        self.assertEqual([version for version, _, _ in applied], list(range(1, migrate.LATEST_VERSION + 1)))
+        self.assertEqual(migrate.schema_version(self.conn), migrate.LATEST_VERSION)
+        self.assertEqual(self.conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+        # Images moved out of the metadata table and hashed
+        self.assertNotIn('image', {row[1] for row in self.conn.execute("PRAGMA table_info(images)")})
+        self.assertEqual(self.conn.execute("SELECT id, image FROM image_blobs").fetchall(), [(1, IMAGE)])
+        self.assertEqual(self.conn.execute("SELECT id, imageHash FROM images ORDER BY id").fetchall(),
+                         [(1, hashlib.sha256(IMAGE).hexdigest()), (2, None)])
+
+        self.assertTrue({'images_featured', 'images_marble_name', 'images_stone_color'} <= self.objects('index'))
+        self.assertTrue({'image_blobs_ai', 'image_blobs_au', 'images_blob_ad', 'images_ai', 'images_ad', 'images_au',
+                         'vendors_ai', 'vendors_ad', 'vendors_au'} <= self.objects('trigger'))
+        self.assertEqual(catalog_search.search_page(self.path, 'marq', 10, 0), ([2], 1))
+
+    def test_search_version_follows_catalog_and_vendor_writes(self):
+        migrate.migrate(self.conn, vacuum=False)
+        version = catalog_search.search_version(self.conn)
+        self.conn.execute("UPDATE images SET marbleName = 'Nero Marquina Extra' WHERE id = 2")
+        self.conn.execute("UPDATE vendors SET name = 'Stone Source Boston' WHERE id = 1")
+        self.assertEqual(catalog_search.search_version(self.conn), version + 2)
+
+        self.conn.execute("DELETE FROM images WHERE id = 1")
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM image_blobs").fetchone()[0], 0)
+
+    def test_second_run_changes_nothing(self):
+        migrate.migrate(self.conn, vacuum=False)
+        schema = self.conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+        self.assertEqual(migrate.migrate(self.conn, vacuum=False), [])
+        self.assertEqual(self.conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall(), schema)
+
+
+if __name__ == '__main__':
+    unittest.main()
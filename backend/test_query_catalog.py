@@ -0,0 +1,37 @@
+import sqlite3
+import unittest
+
+from catalog_fixtures import make_catalog
+from query_catalog import full_scans, unexpected_scans
+
+
+class TestQueryCatalog(unittest.TestCase):
+
+    def setUp(self):
+        # The original layout from the README, brought up to date the same way as the production catalog
+        self.conn = make_catalog(sqlite3.connect(':memory:'))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_registered_queries_do_not_scan_tables(self):
+        failures = [f"{query.name} scans {', '.join(tables)}" for query, tables in unexpected_scans(self.conn)]
+        self.assertEqual(failures, [])
+
+    def test_dropped_index_is_reported(self):
+        self.conn.execute("DROP INDEX images_marble_name")
+        failed = {query.name for query, _ in unexpected_scans(self.conn)}
+        self.assertIn('set_description', failed)
+        self.assertIn('set_stain_resistance', failed)
+
+    def test_full_scan_detection(self):
+        self.assertEqual(full_scans(['SCAN images']), ['images'])
+        self.assertEqual(full_scans([
+            'SCAN images USING COVERING INDEX images_stone_color',
+            'SCAN images_fts VIRTUAL TABLE INDEX 0:M9',
+            'SEARCH images USING INTEGER PRIMARY KEY (rowid=?)',
+        ]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import admin_panel
+import sampling_profiler
+
+
+def make_profile(profile_id, samples=10):
+    return {'id': profile_id, 'pid': 123, 'started': 1700000000.0, 'seconds': 5.0, 'samples': samples,
+            'interval': 0.01, 'stacks': {'main (app.py:1);work (app.py:10)': samples}}
+
+
+class TestListProfiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.dir = self.tmpdir.name
+
+    def test_list_reads_summaries_newest_first(self):
+        for profile_id in ('20240101-120000-1', '20240102-120000-1'):
+            sampling_profiler.save_profile(self.dir, make_profile(profile_id))
+        # The full profiles are not opened to build the list
+        with patch.object(sampling_profiler, 'load_profile', side_effect=AssertionError):
+            profiles = sampling_profiler.list_profiles(self.dir)
+        self.assertEqual([p['id'] for p in profiles], ['20240102-120000-1', '20240101-120000-1'])
+        self.assertEqual(set(profiles[0]), set(sampling_profiler.SUMMARY_FIELDS))
+
+    def test_profiles_without_a_summary_get_one(self):
+        with open(os.path.join(self.dir, '20240101-120000-1.json'), 'w') as f:
+            json.dump(make_profile('20240101-120000-1', samples=7), f)
+        with open(os.path.join(self.dir, 'notes.json'), 'w') as f:
+            f.write('{}')
+
+        self.assertEqual([p['samples'] for p in sampling_profiler.list_profiles(self.dir)], [7])
+        self.assertTrue(os.path.exists(sampling_profiler.summary_path(self.dir, '20240101-120000-1')))
+
+
+class TestProfileLength(unittest.TestCase):
+
+    def setUp(self):
+        self.client = admin_panel.app.test_client()
+        with self.client.session_transaction() as session:
+            session['logged_in'] = True
+
+    def test_invalid_lengths_are_rejected(self):
+        for seconds in ('nan', 'inf', '-5', '0', 'soon'):
+            with patch.object(admin_panel, 'start_profile') as start:
+                response = self.client.get(f'/profile?seconds={seconds}')
+            self.assertEqual(response.status_code, 400, seconds)
+            start.assert_not_called()
+        for seconds in (float('nan'), -5):
+            with self.assertRaises(ValueError):
+                sampling_profiler.start_profile(seconds)
+
+    def test_valid_length_starts_a_profile(self):
+        with patch.object(admin_panel, 'start_profile', return_value=('20240101-120000-1', True)) as start:
+            response = self.client.get('/profile?seconds=5')
+        self.assertEqual(response.status_code, 302)
+        start.assert_called_once_with(5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import image_store
+from catalog_fixtures import make_catalog
+
+IMAGE = bytes(range(256)) * 40
+REPLACEMENT = bytes(reversed(range(256))) * 40
+IMAGE_HASH = hashlib.sha256(IMAGE).hexdigest()
+
+CATALOG_DIR = tempfile.TemporaryDirectory()
+CATALOG_PATH = os.path.join(CATALOG_DIR.name, 'catalog.db')
+make_catalog(CATALOG_PATH, images=[{'id': i, 'marbleName': f'Calacatta {i}', 'marbleOrigin': 'Italy', 'image': IMAGE}
+                                   for i in range(1, 151)]).close()
+# Read when server_production is imported
+os.environ['MARBLE_DB_PATH'] = CATALOG_PATH
+
+try:
+    import server_production as sp
+except ImportError:  # torch and torchvision are only installed on the serving hosts
+    sp = None
+
+
+def tearDownModule():
+    CATALOG_DIR.cleanup()
+
+
+@unittest.skipIf(sp is None, 'server_production needs torch')
+class TestImagesPage(unittest.TestCase):
+
+    def setUp(self):
+        self.client = sp.app.test_client()
+
+    def test_page_size_is_clamped(self):
+        for search in ('', 'Calacatta'):
+            large = self.client.get(f'/api/images?per_page=100000&search={search}').get_json()
+            self.assertEqual((large['perPage'], len(large['marbles']), large['totalPages']), (100, 100, 2))
+
+            empty = self.client.get(f'/api/images?per_page=0&search={search}')
+            self.assertEqual(empty.status_code, 200)
+            self.assertEqual((empty.get_json()['perPage'], empty.get_json()['totalPages']), (1, 150))
+
+    def test_pages_before_the_first_read_the_first(self):
+        data = self.client.get('/api/images?page=-3&per_page=10&view=card').get_json()
+        self.assertEqual(data['page'], 1)
+        self.assertEqual([marble['id'] for marble in data['marbles']], list(range(1, 11)))
+
+
+@unittest.skipIf(sp is None, 'server_production needs torch')
+class TestServeImage(unittest.TestCase):
+    versioned_url = f'/api/image/1/{IMAGE_HASH[:16]}'
+
+    def setUp(self):
+        self.client = sp.app.test_client()
+
+    def test_versioned_url_is_cached_with_the_hash_as_etag(self):
+        response = self.client.get(self.versioned_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), IMAGE)
+        self.assertEqual(response.headers['ETag'], f'"{IMAGE_HASH}"')
+        self.assertEqual(response.headers['Cache-Control'], image_store.IMMUTABLE_CACHE)
+        self.assertEqual(self.client.get('/api/image/1').headers['Cache-Control'], image_store.REVALIDATE_CACHE)
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get('/api/image/1', headers={'If-None-Match': f'"{IMAGE_HASH}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], f'"{IMAGE_HASH}"')
+        self.assertEqual(response.get_data(), b'')
+
+        stale = self.client.get('/api/image/1', headers={'If-None-Match': '"0123456789abcdef"'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_ranges(self):
+        response = self.client.get(self.versioned_url, headers={'Range': 'bytes=256-511'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f'bytes 256-511/{len(IMAGE)}')
+        self.assertEqual(response.get_data(), IMAGE[256:512])
+
+        response = self.client.get(self.versioned_url, headers={'Range': f'bytes={len(IMAGE)}-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_if_range_with_another_hash_sends_the_whole_image(self):
+        resumed = self.client.get('/api/image/1', headers={'Range': 'bytes=0-9', 'If-Range': f'"{IMAGE_HASH}"'})
+        self.assertEqual((resumed.status_code, resumed.get_data()), (206, IMAGE[:10]))
+
+        restarted = self.client.get('/api/image/1', headers={'Range': 'bytes=0-9', 'If-Range': '"0123456789abcdef"'})
+        self.assertEqual((restarted.status_code, restarted.get_data()), (200, IMAGE))
+
+    def test_replaced_image_redirects_to_its_new_version(self):
+        conn = sqlite3.connect(CATALOG_PATH)
+        try:
+            image_store.write_image(conn, 2, REPLACEMENT)
+        finally:
+            conn.close()
+        new_url = image_store.image_url(2, hashlib.sha256(REPLACEMENT).hexdigest())
+
+        response = self.client.get(f'/api/image/2/{IMAGE_HASH[:16]}')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith(new_url))
+        self.assertEqual(self.client.get(new_url).get_data(), REPLACEMENT)
+
+        self.assertEqual(self.client.get('/api/image/999').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
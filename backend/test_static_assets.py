@@ -0,0 +1,82 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from static_assets import IMMUTABLE_CACHE, REVALIDATE_CACHE, StaticManifest, compress_build
+
+BUNDLE = b'console.log("marble gallery");\n' * 200
+
+
+class TestStaticManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        build_dir = self.tmpdir.name
+        os.makedirs(os.path.join(build_dir, 'static', 'js'))
+        self.write(build_dir, 'index.html', b'<!doctype html><div id="root"></div>')
+        self.write(build_dir, 'static/js/main.1a2b3c4d.js', BUNDLE)
+        compress_build(build_dir)
+        # A precompressed file that came out larger than the original is not served
+        self.write(build_dir, 'robots.txt', b'User-agent: *\n')
+        self.write(build_dir, 'robots.txt.gz', gzip.compress(b'User-agent: *\n'))
+
+        manifest = StaticManifest(build_dir).scan()
+        app = Flask(__name__, static_folder=None)
+        app.add_url_rule('/<path:rel_path>', 'asset', manifest.send)
+        self.manifest = manifest
+        self.client = app.test_client()
+
+    def write(self, build_dir, rel_path, data):
+        with open(os.path.join(build_dir, rel_path), 'wb') as f:
+            f.write(data)
+
+    def test_scan_skips_compressed_files_and_keeps_smaller_variants(self):
+        self.assertEqual(set(self.manifest.assets), {'index.html', 'static/js/main.1a2b3c4d.js', 'robots.txt'})
+        self.assertIn('gzip', self.manifest.get('static/js/main.1a2b3c4d.js').variants)
+        self.assertEqual(self.manifest.get('robots.txt').variants, {})
+
+    def test_encoding_follows_accept_encoding(self):
+        plain = self.client.get('/static/js/main.1a2b3c4d.js', headers={'Accept-Encoding': 'identity'})
+        self.assertIsNone(plain.headers.get('Content-Encoding'))
+        self.assertEqual(plain.get_data(), BUNDLE)
+
+        zipped = self.client.get('/static/js/main.1a2b3c4d.js', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(zipped.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.get_data()), BUNDLE)
+        self.assertNotIn('Content-Disposition', zipped.headers)
+
+        for response in (plain, zipped):
+            self.assertIn('Accept-Encoding', response.vary)
+            self.assertEqual(response.headers['Content-Type'], 'text/javascript; charset=utf-8')
+        self.assertNotEqual(plain.headers['ETag'], zipped.headers['ETag'])
+
+    def test_cache_control_depends_on_fingerprint(self):
+        self.assertEqual(self.client.get('/static/js/main.1a2b3c4d.js').headers['Cache-Control'], IMMUTABLE_CACHE)
+        index = self.client.get('/index.html')
+        self.assertEqual(index.headers['Cache-Control'], REVALIDATE_CACHE)
+        self.assertNotIn('Accept-Encoding', index.vary)
+
+    def test_matching_etag_is_not_modified_per_encoding(self):
+        for accept in ('identity', 'gzip'):
+            headers = {'Accept-Encoding': accept}
+            etag = self.client.get('/static/js/main.1a2b3c4d.js', headers=headers).headers['ETag']
+            revalidated = self.client.get('/static/js/main.1a2b3c4d.js', headers={**headers, 'If-None-Match': etag})
+            self.assertEqual(revalidated.status_code, 304, accept)
+            self.assertEqual(revalidated.get_data(), b'')
+
+        # The gzip ETag does not validate the uncompressed representation
+        gzip_etag = self.client.get('/static/js/main.1a2b3c4d.js', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        response = self.client.get('/static/js/main.1a2b3c4d.js',
+                                   headers={'Accept-Encoding': 'identity', 'If-None-Match': gzip_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_paths_are_not_found(self):
+        self.assertEqual(self.client.get('/static/js/missing.js').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
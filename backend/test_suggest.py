@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import suggest
+from analytics_store import connect_analytics_db
+from catalog_fixtures import make_catalog
+
+
+class TestSuggest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, 'catalog.db')
+        self.events_db_path = os.path.join(self.directory.name, 'events.db')
+        make_catalog(self.db_path, images=[
+            {'id': 1, 'marbleName': 'Calacatta Gold', 'marbleOrigin': 'Italy'},
+            {'id': 2, 'marbleName': 'Calacatta Borghini', 'marbleOrigin': 'Italy'},
+            {'id': 3, 'marbleName': 'Bianco Carrara', 'marbleOrigin': 'Italy'},
+            {'id': 4, 'marbleName': 'Nero Marquina', 'marbleOrigin': 'Spain'},
+        ], vendors=[{'id': 1, 'location': 'Brooklyn', 'name': 'Carrara Stoneworks'}]).close()
+
+        analytics = connect_analytics_db(self.events_db_path)
+        analytics.executemany("INSERT INTO rollup_counts (grain, period, dimension, key, count) VALUES (?, ?, ?, ?, ?)", [
+            ('day', '2026-10-01', 'marble_click', 'Calacatta Borghini', 7),
+            ('day', '2026-10-02', 'marble_click', 'Calacatta Gold', 3),
+            ('day', '2026-10-02', 'marble_click', 'Bianco Carrara', 2),
+        ])
+        analytics.commit()
+        analytics.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def suggest(self, query):
+        index = suggest.build_index(self.db_path, self.events_db_path)
+        return [(s['text'], s['kind']) for s in index.suggest(query)]
+
+    def test_prefixes_rank_by_clicks(self):
+        self.assertEqual(self.suggest('cal'), [('Calacatta Borghini', 'marble'), ('Calacatta Gold', 'marble')])
+        self.assertEqual(self.suggest('  CALACATTA  g'), [('Calacatta Gold', 'marble')])
+
+    def test_word_starts_origins_and_vendors_match(self):
+        self.assertEqual(self.suggest('carr'), [('Bianco Carrara', 'marble'), ('Carrara Stoneworks', 'vendor')])
+        self.assertEqual(self.suggest('it'), [('Italy', 'origin')])
+        self.assertEqual(self.suggest('arrara'), [])
+
+    def test_vendor_changes_move_the_catalog_version(self):
+        index = suggest.build_index(self.db_path, self.events_db_path)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE vendors SET name = 'Calacatta Imports' WHERE id = 1")
+        conn.commit()
+        conn.close()
+        self.assertNotEqual(suggest.build_index(self.db_path, self.events_db_path).version, index.version)
+
+    def test_failed_build_answers_empty(self):
+        # A catalog without the search tables (migration 4) must not take the worker down
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DROP TABLE catalog_meta")
+        conn.commit()
+        conn.close()
+        refresher = suggest.SuggestRefresher(self.db_path, interval=3600)
+        with self.assertLogs(suggest.logger, 'ERROR'):
+            self.assertEqual(refresher.suggest('cal'), [])
+        self.assertIsNone(refresher.index)
+
+    def test_refresh_thread_survives_any_error(self):
+        class Stop(BaseException):
+            pass
+
+        refresher = suggest.SuggestRefresher(self.db_path, interval=0)
+        # Two failed refreshes, then the third sleep ends the loop
+        with patch.object(refresher, 'stale', side_effect=[ValueError('bad row'), KeyError('id')]), \
+                patch.object(suggest.time, 'sleep', side_effect=[None, None, Stop]), \
+                self.assertLogs(suggest.logger, 'ERROR') as logs, self.assertRaises(Stop):
+            refresher._run()
+        self.assertEqual(len(logs.records), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
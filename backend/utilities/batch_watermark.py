@@ -6,6 +6,7 @@ import concurrent.futures
 import PIL.Image as Image
 import numpy as np
 from backend.utilities.watermarkTest import encode_lsb, decode_lsb
+from backend.image_store import write_image
 import sqlite3
 import io
 
@@ -16,7 +17,7 @@ def process_image(db_path, row_id, watermark_text, action):
         cursor = conn.cursor()
         
         # Fetch the image data
-        cursor.execute("SELECT image, fileName FROM images WHERE id = ?", (row_id,))
+        cursor.execute("SELECT image_blobs.image, images.fileName FROM image_blobs JOIN images ON images.id = image_blobs.id WHERE image_blobs.id = ?", (row_id,))
         image_blob, file_name = cursor.fetchone()
         
         image = Image.open(io.BytesIO(image_blob))
@@ -31,8 +32,8 @@ def process_image(db_path, row_id, watermark_text, action):
             watermarked_img.save(img_byte_arr, format='PNG')
             img_byte_arr = img_byte_arr.getvalue()
             
-            cursor.execute("UPDATE images SET image = ? WHERE id = ?", (img_byte_arr, row_id))
-            conn.commit()
+            # Keeps imageHash current, so the gallery's versioned URL switches to the watermarked image
+            write_image(conn, row_id, img_byte_arr)
             result = f"Watermarked image saved for ID: #{row_id} (File: {file_name})"
         elif action == 'decode':
             watermark = decode_lsb(img_array)
@@ -46,7 +47,7 @@ def process_image(db_path, row_id, watermark_text, action):
 def batch_process_images(db_path, watermark_text, action, max_workers=None):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    cursor.execute("SELECT id FROM images")
+    cursor.execute("SELECT id FROM image_blobs")
     image_ids = [row[0] for row in cursor.fetchall()]
     conn.close()
     
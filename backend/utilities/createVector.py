@@ -25,7 +25,7 @@ transform = transforms.Compose([
 ])
 
 # Fetch all images and marble names from the database
-cursor.execute("SELECT marbleName, image FROM images")
+cursor.execute("SELECT images.marbleName, image_blobs.image FROM images JOIN image_blobs ON image_blobs.id = images.id")
 rows = cursor.fetchall()
 
 # Lists to store embeddings and corresponding marble names
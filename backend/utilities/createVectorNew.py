@@ -63,7 +63,7 @@ def extract_features(img_data):
     return combined_features
 
 # Fetch all images and marble names from the database
-cursor.execute("SELECT marbleName, image FROM images")
+cursor.execute("SELECT images.marbleName, image_blobs.image FROM images JOIN image_blobs ON image_blobs.id = images.id")
 rows = cursor.fetchall()
 
 # Lists to store embeddings and corresponding marble names
@@ -1,9 +1,9 @@
 import sqlite3
 import logging
 import time
+import numpy as np
 from PIL import Image, UnidentifiedImageError
-from collections import Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+from concurrent.futures import ProcessPoolExecutor
 import io
 import threading
 import functools
@@ -16,6 +16,16 @@ logger = logging.getLogger(__name__)
 # Thread-local storage for database connections
 local_data = threading.local()
 
+# Colors are counted on a copy no larger than this on its longest side. Nearest-neighbour sampling keeps real
+# pixel values, so pure black and white are still recognised and no blended shades are invented.
+COLOR_SAMPLE_SIZE = 256
+# Bits kept per channel when counting: shades that differ only in the low bits share a bin, and the bin's
+# mean color is reported, which for a flat image is the exact color
+QUANTIZE_BITS = 5
+# Rec. 601 luma, scaled to integers
+LUMA_WEIGHTS = np.array([299, 587, 114])
+UPDATE_BATCH_SIZE = 500
+
 def get_db_connection():
     if not hasattr(local_data, "connection"):
         local_data.connection = sqlite3.connect('marble_images-2.db', timeout=30)
@@ -43,31 +53,38 @@ def retry_on_db_lock(max_attempts=5, delay=1):
         return wrapper
     return decorator
 
-def is_color_valid(color):
-    r, g, b = color
-    # Check if the color is not pure white (255, 255, 255) or pure black (0, 0, 0)
-    return not ((r == g == b == 255) or (r == g == b == 0))
+def image_pixels(image_blob):
+    # (n, 3) uint8 array of the downscaled image's pixels, without pure white and pure black
+    image = Image.open(io.BytesIO(image_blob))
+    # JPEGs can be decoded straight at a fraction of their size
+    image.draft('RGB', (COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE))
+    image = image.convert('RGB')
+    image.thumbnail((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE), Image.NEAREST)
+    pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 3)
+    packed = (pixels[:, 0].astype(np.uint32) << 16) | (pixels[:, 1].astype(np.uint32) << 8) | pixels[:, 2]
+    return pixels[(packed != 0) & (packed != 0xFFFFFF)]
+
+def dominant_color(pixels):
+    if not len(pixels):
+        return None
+    quantized = (pixels >> (8 - QUANTIZE_BITS)).astype(np.intp)
+    keys = (quantized[:, 0] << (2 * QUANTIZE_BITS)) | (quantized[:, 1] << QUANTIZE_BITS) | quantized[:, 2]
+    best = np.bincount(keys, minlength=1 << (3 * QUANTIZE_BITS)).argmax()
+    return tuple(int(channel) for channel in np.rint(pixels[keys == best].mean(axis=0)))
+
+def brightest_color(pixels):
+    if not len(pixels):
+        return None
+    return tuple(int(channel) for channel in pixels[(pixels @ LUMA_WEIGHTS).argmax()])
 
 def get_dominant_color(image_blob, marble_name):
     try:
-        image = Image.open(io.BytesIO(image_blob))
-        image = image.convert('RGB')
-        width, height = image.size
-        pixels = image.getcolors(width * height)
-
-        # Sort pixels by count and filter out pure white and pure black
-        sorted_pixels = sorted(
-            [p for p in pixels if is_color_valid(p[1])],
-            key=lambda t: t[0],
-            reverse=True
-        )
-
-        if not sorted_pixels:
+        dominant_color_rgb = dominant_color(image_pixels(image_blob))
+        if dominant_color_rgb is None:
             logger.warning(f"No valid colors found for {marble_name}")
             return None
 
-        dominant_color = sorted_pixels[0][1]
-        hex_color = '#{:02x}{:02x}{:02x}'.format(*dominant_color)
+        hex_color = '#{:02x}{:02x}{:02x}'.format(*dominant_color_rgb)
         return hex_color
     except UnidentifiedImageError:
         logger.error(f"Unable to identify image format for {marble_name}")
@@ -77,28 +94,12 @@ def get_dominant_color(image_blob, marble_name):
 
 def get_brightest_color(image_blob, marble_name):
     try:
-        image = Image.open(io.BytesIO(image_blob))
-        image = image.convert('RGB')
-        width, height = image.size
-        pixels = image.getcolors(width * height)
-
-        # Find the brightest color
-        brightest_color = None
-        max_brightness = -1
-
-        for count, color in pixels:
-            if is_color_valid(color):
-                # Calculate brightness
-                brightness = 0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]
-                if brightness > max_brightness:
-                    max_brightness = brightness
-                    brightest_color = color
-
-        if brightest_color is None:
+        brightest_color_rgb = brightest_color(image_pixels(image_blob))
+        if brightest_color_rgb is None:
             logger.warning(f"No valid colors found for {marble_name}")
             return None
 
-        hex_color = '#{:02x}{:02x}{:02x}'.format(*brightest_color)
+        hex_color = '#{:02x}{:02x}{:02x}'.format(*brightest_color_rgb)
         return hex_color
     except UnidentifiedImageError:
         logger.error(f"Unable to identify image format for {marble_name}")
@@ -107,42 +108,41 @@ def get_brightest_color(image_blob, marble_name):
     return None
 
 @retry_on_db_lock()
-def update_marble_color(marble_name, new_color):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE images SET stoneColor = ? WHERE marbleName = ?", (new_color, marble_name))
+def update_marble_colors(conn, colors):
+    # colors: [(new_color, marble_id)], written in one transaction
+    conn.executemany("UPDATE images SET stoneColor = ? WHERE id = ?", colors)
     conn.commit()
-    logger.info(f"Updated color for {marble_name} in database")
-
-def process_marble(data, color_algorithm):
-    marble_name, image_blob, stone_color = data
-    logger.info(f"Processing marble: {marble_name}")
-    if not stone_color:
-        try:
-            if color_algorithm == 'dominant':
-                new_color = get_dominant_color(image_blob, marble_name)
-            else:
-                new_color = get_brightest_color(image_blob, marble_name)
-
-            if new_color:
-                logger.info(f"Determined color for {marble_name}: {new_color}")
-                update_marble_color(marble_name, new_color)
-                return (marble_name, new_color)
-            else:
-                logger.warning(f"Could not determine color for {marble_name}")
-        except Exception as e:
-            logger.error(f"Failed to process marble {marble_name}: {str(e)}")
-    return None
+    logger.info(f"Updated colors for {len(colors)} marbles in database")
+
+def compute_marble_color(row, color_algorithm):
+    # Runs in a pool process: reads its own copy of the image rather than having it pickled across.
+    # Returns (color, id), the parameters update_marble_colors writes; color is None when none was found.
+    marble_id, marble_name = row
+    try:
+        blob = get_db_connection().execute("SELECT image FROM image_blobs WHERE id = ?", (marble_id,)).fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read image for {marble_name}: {str(e)}")
+        return None, marble_id
+    if blob is None:
+        logger.warning(f"No image stored for {marble_name}")
+        return None, marble_id
+    if color_algorithm == 'dominant':
+        return get_dominant_color(blob[0], marble_name), marble_id
+    return get_brightest_color(blob[0], marble_name), marble_id
 
 def main():
     try:
         conn = sqlite3.connect('marble_images-2.db', timeout=30)
         cursor = conn.cursor()
 
-        cursor.execute("SELECT marbleName, image, stoneColor FROM images WHERE stoneColor IS NULL OR stoneColor = '' OR stoneColor IN ('#FFFFFF', '#000000')")
-        marble_data = cursor.fetchall()
+        cursor.execute("""
+            SELECT images.id, images.marbleName
+            FROM images JOIN image_blobs ON image_blobs.id = images.id
+            WHERE images.stoneColor IS NULL OR images.stoneColor = '' OR images.stoneColor IN ('#FFFFFF', '#000000')
+        """)
+        marble_rows = cursor.fetchall()
 
-        logger.info(f"Found {len(marble_data)} marbles without valid stoneColor")
+        logger.info(f"Found {len(marble_rows)} marbles without valid stoneColor")
 
         # Ask user for color algorithm choice
         color_algorithm = input("Choose color algorithm (dominant/brightest): ").strip().lower()
@@ -150,20 +150,23 @@ def main():
             logger.error("Invalid choice. Defaulting to 'dominant'.")
             color_algorithm = 'dominant'
 
-        results = []
-        with ThreadPoolExecutor(max_workers=128) as executor:
-            future_to_marble = {executor.submit(process_marble, data, color_algorithm): data for data in marble_data}
-            for future in as_completed(future_to_marble):
-                try:
-                    result = future.result(timeout=60)
-                    if result:
-                        results.append(result)
-                except TimeoutError:
-                    marble_name = future_to_marble[future][0]
-                    logger.error(f"Processing timed out for {marble_name}")
-                except Exception as e:
-                    marble_name = future_to_marble[future][0]
-                    logger.error(f"Error processing {marble_name}: {str(e)}")
+        # The counting is CPU-bound, so it runs in one process per core; only this process writes
+        pending = []
+        with ProcessPoolExecutor() as executor:
+            compute = functools.partial(compute_marble_color, color_algorithm=color_algorithm)
+            # Written by id: marbles that share a name each keep the color of their own image
+            results = executor.map(compute, marble_rows, chunksize=16)
+            for (_, marble_name), (new_color, marble_id) in zip(marble_rows, results):
+                if new_color:
+                    logger.info(f"Determined color for {marble_name}: {new_color}")
+                    pending.append((new_color, marble_id))
+                else:
+                    logger.warning(f"Could not determine color for {marble_name}")
+                if len(pending) >= UPDATE_BATCH_SIZE:
+                    update_marble_colors(conn, pending)
+                    pending = []
+        if pending:
+            update_marble_colors(conn, pending)
 
         cursor.execute("SELECT COUNT(*) FROM images WHERE stoneColor IS NOT NULL AND stoneColor != ''")
         updated_count = cursor.fetchone()[0]
@@ -1,7 +1,15 @@
 import sqlite3
 import sys
 import os
-from fuzzywuzzy import fuzz, process
+import csv
+import json
+import time
+from collections import Counter
+from itertools import islice
+from rapidfuzz import fuzz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fuzzy_match import FuzzyMatcher
 
 def connect_to_db():
     return sqlite3.connect('marble_images-2.db')
@@ -66,17 +74,19 @@ def list_vendors():
 def get_vendor(search_term):
     conn = connect_to_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT id, name, location FROM vendors')
-    vendors = cursor.fetchall()
+    cursor.execute('SELECT id, name, location, vendorLogo IS NOT NULL FROM vendors')
+    vendors = {vendor[0]: vendor for vendor in cursor.fetchall()}
+    conn.close()
 
     if search_term.isdigit():
         # If the search term is a number, assume it's an ID
         vendor_id = int(search_term)
-        matching_vendors = [v for v in vendors if v[0] == vendor_id]
+        matching_vendors = [vendors[vendor_id]] if vendor_id in vendors else []
     else:
-        # Use fuzzy matching for name search
-        name_matches = process.extract(search_term, [v[1] for v in vendors], limit=None, scorer=fuzz.partial_ratio)
-        matching_vendors = [v for v in vendors if v[1] in [m[0] for m in name_matches if m[1] >= 70]]
+        # Use fuzzy matching for name search, best match first
+        matcher = FuzzyMatcher([(v[1], 'vendor', v[0]) for v in vendors.values() if v[1]])
+        matches = matcher.match(search_term, limit=None, score_cutoff=70, scorer=fuzz.partial_ratio)
+        matching_vendors = [vendors[vendor_id] for (_, _, vendor_id), _ in matches]
 
     if matching_vendors:
         print(f"Found {len(matching_vendors)} matching vendor(s):")
@@ -85,15 +95,141 @@ def get_vendor(search_term):
             print(f"ID: {vendor[0]}")
             print(f"Name: {vendor[1]}")
             print(f"Location: {vendor[2]}")
-            
-            # Check if logo is present
-            cursor.execute('SELECT vendorLogo FROM vendors WHERE id = ?', (vendor[0],))
-            logo_data = cursor.fetchone()[0]
-            print(f"Logo: {'Present' if logo_data else 'Not present'}")
+            print(f"Logo: {'Present' if vendor[3] else 'Not present'}")
     else:
         print(f"No vendors found matching '{search_term}'")
 
-    conn.close()
+# Rows per executemany call; the whole import is still one transaction
+IMPORT_BATCH_SIZE = 5000
+
+def read_records(path):
+    # Streams dicts from a CSV with a header row or from JSON Lines, one vendor per record
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(file)
+
+VENDOR_TEXT_FIELDS = ('name', 'location', 'contact', 'url', 'logo')
+
+def record_problem(record):
+    # CSV rows are always dicts of strings, but a JSONL line can hold any JSON value
+    if not isinstance(record, dict):
+        return 'rejected: not an object'
+    for field in VENDOR_TEXT_FIELDS:
+        if record.get(field) is not None and not isinstance(record[field], str):
+            return f'rejected: {field} is not text'
+    marbles = record.get('marbles')
+    if marbles is not None and not isinstance(marbles, str) and (
+            not isinstance(marbles, list) or not all(isinstance(name, str) for name in marbles)):
+        return 'rejected: marbles is not a list of names'
+    return None
+
+def marble_names(record):
+    # JSONL gives a list; CSV cells separate names with ';'
+    marbles = record.get('marbles') or []
+    if isinstance(marbles, str):
+        marbles = marbles.split(';')
+    return [name.strip() for name in marbles if name and name.strip()]
+
+def import_vendors(conn, records, base_dir='.', batch_size=IMPORT_BATCH_SIZE):
+    # Upserts vendors by name (case-insensitive), then their logos and marble associations. Every lookup is
+    # answered from dicts loaded up front, and all writes share one transaction so a bad file changes nothing.
+    stats = Counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        marble_ids = {}
+        for marble_id, name in conn.execute("SELECT id, marbleName FROM images WHERE marbleName IS NOT NULL"):
+            marble_ids.setdefault(name.casefold(), []).append(marble_id)
+        # Highest id first, so where names are already duplicated the oldest vendor is the one updated
+        vendor_ids = {name.casefold(): vendor_id for vendor_id, name in conn.execute(
+            "SELECT id, name FROM vendors WHERE name IS NOT NULL ORDER BY id DESC")}
+        # New vendors get their ids here so associations can refer to them without a lastrowid per row;
+        # the write lock taken above keeps them from being handed out twice
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM vendors").fetchone()[0]
+
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            inserts, updates, logos, associations = [], [], [], []
+            for record in batch:
+                stats['rows'] += 1
+                problem = record_problem(record)
+                if problem:
+                    stats[problem] += 1
+                    continue
+                name = (record.get('name') or '').strip()
+                location = (record.get('location') or '').strip()
+                if not name or not location:
+                    stats['rejected: missing name or location'] += 1
+                    continue
+                contact = record.get('contact') or None
+                url = record.get('url') or None
+                vendor_id = vendor_ids.get(name.casefold())
+                if vendor_id is None:
+                    vendor_id = next_id
+                    next_id += 1
+                    vendor_ids[name.casefold()] = vendor_id
+                    inserts.append((vendor_id, name, location, contact, url))
+                else:
+                    # Fields left blank in the file keep their current value
+                    updates.append((location, contact, url, vendor_id))
+                    stats['conflicts: existing vendor updated'] += 1
+
+                if record.get('logo'):
+                    try:
+                        with open(os.path.join(base_dir, record['logo']), 'rb') as file:
+                            logos.append((file.read(), vendor_id))
+                    except OSError:
+                        stats['conflicts: logo file not found'] += 1
+                for marble_name in marble_names(record):
+                    ids = marble_ids.get(marble_name.casefold())
+                    if ids is None:
+                        stats['conflicts: unknown marble name'] += 1
+                    associations.extend((marble_id, vendor_id) for marble_id in ids or ())
+
+            conn.executemany("INSERT INTO vendors (id, name, location, contact, url) VALUES (?, ?, ?, ?, ?)", inserts)
+            conn.executemany("UPDATE vendors SET location = ?, contact = COALESCE(?, contact), url = COALESCE(?, url) "
+                             "WHERE id = ?", updates)
+            conn.executemany("UPDATE vendors SET vendorLogo = ? WHERE id = ?", logos)
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO marble_vendor_association (marble_id, vendor_id) VALUES (?, ?)",
+                             associations)
+            added = conn.total_changes - before
+            stats['vendors added'] += len(inserts)
+            stats['logos stored'] += len(logos)
+            stats['associations added'] += added
+            stats['conflicts: association already present'] += len(associations) - added
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return stats
+
+def import_file(path):
+    conn = connect_to_db()
+    start = time.perf_counter()
+    try:
+        stats = import_vendors(conn, read_records(path), os.path.dirname(os.path.abspath(path)))
+    except (sqlite3.Error, csv.Error, ValueError, OSError) as e:
+        print(f"Import failed, nothing was written: {e}")
+        return
+    finally:
+        conn.close()
+    seconds = time.perf_counter() - start
+
+    print(f"Imported {stats['rows']} rows in {seconds:.2f}s ({stats['rows'] / max(seconds, 1e-9):,.0f} rows/s)")
+    for key in ('vendors added', 'logos stored', 'associations added'):
+        print(f"  {key}: {stats[key]}")
+    conflicts = sorted(key for key in stats if key.startswith(('conflicts', 'rejected')) and stats[key])
+    for key in conflicts:
+        print(f"  {key}: {stats[key]}")
+    if not conflicts:
+        print("  no conflicts")
 
 def main():
     if len(sys.argv) < 2:
@@ -103,6 +239,8 @@ def main():
         print("  Delete vendor: python manage_vendors.py delete <id>")
         print("  List vendors:  python manage_vendors.py list")
         print("  Get vendor:    python manage_vendors.py get <id or name>")
+        print("  Import:        python manage_vendors.py import <file.csv|file.jsonl>")
+        print("                 (columns: name, location, contact, url, logo, marbles separated by ';')")
         return
 
     command = sys.argv[1].lower()
@@ -143,8 +281,14 @@ def main():
         search_term = " ".join(sys.argv[2:])
         get_vendor(search_term)
 
+    elif command == 'import':
+        if len(sys.argv) < 3:
+            print("Usage: python manage_vendors.py import <file.csv|file.jsonl>")
+            return
+        import_file(sys.argv[2])
+
     else:
-        print("Invalid command. Use 'add', 'update', 'delete', 'list', or 'get'.")
+        print("Invalid command. Use 'add', 'update', 'delete', 'list', 'get', or 'import'.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,29 +1,44 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 from PIL import Image
 import io
+import os
 import sqlite3
+import sys
+import tempfile
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-# Import the functions from imageColor.py using direct imports
-from backend.utilities.imageColor import (
+# Import the functions from imageColor.py the same way as the other backend tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utilities.imageColor import (
     get_dominant_color,
     get_brightest_color,
-    process_marble,
-    update_marble_color,
+    compute_marble_color,
+    update_marble_colors,
     get_db_connection,
-    retry_on_db_lock,
-    is_color_valid
+    retry_on_db_lock
 )
+from catalog_fixtures import make_catalog
+
+# Colours as they are stored in images.stoneColor, including a marble that has none yet
+STONE_COLORS = ['#f2efe9', '#1c1c1e', '#b5651d', '#7a8b99', None, '#d4c4a8']
 
 class TestImageColor(unittest.TestCase):
 
     def setUp(self):
         self.marble_name = "test_marble"
-        self.html_file = open("test_colors.html", "w")
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'catalog.db')
+        make_catalog(self.db_path, images=[
+            {'id': marble_id, 'marbleName': f'{self.marble_name} {marble_id}', 'stoneColor': color_hex,
+             'image': self.create_sample_image_blob(self.hex_to_rgb(color_hex))}
+            for marble_id, color_hex in enumerate(STONE_COLORS, 1)
+        ]).close()
+        # A swatch page to eyeball the colours; kept out of the working tree
+        self.html_file = open(os.path.join(self.tmpdir.name, "test_colors.html"), "w")
         self.html_file.write("<html><body><h1>Test Colors</h1><ul>")
         self.colors = self.fetch_colors_from_db()
         logging.debug(f"Fetched colors: {self.colors}")
@@ -31,11 +46,12 @@ class TestImageColor(unittest.TestCase):
     def tearDown(self):
         self.html_file.write("</ul></body></html>")
         self.html_file.close()
+        self.tmpdir.cleanup()
 
     def fetch_colors_from_db(self):
-        conn = sqlite3.connect('/Users/mitchellmoss/Documents/marbleIdeas/backend/marble_images-2.db')
+        conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute("SELECT stoneColor FROM images")
+        cursor.execute("SELECT stoneColor FROM images ORDER BY id")
         colors = cursor.fetchall()
         conn.close()
         return [color[0] for color in colors]
@@ -76,59 +92,49 @@ class TestImageColor(unittest.TestCase):
             self.assertEqual(brightest_color, color_hex, f"The brightest color should be {color_hex}")
             self.log_color(color_hex)
 
-    @patch('imageColor.update_marble_color')
-    def test_process_marble_dominant(self, mock_update_marble_color):
+    @patch('utilities.imageColor.get_db_connection')
+    def test_compute_marble_color_dominant(self, mock_get_db_connection):
+        mock_get_db_connection.side_effect = lambda: sqlite3.connect(self.db_path)
         for color_hex in self.colors:
             if color_hex is None:
-                logging.error("Encountered None value in test_process_marble_dominant")
+                logging.error("Encountered None value in test_compute_marble_color_dominant")
                 continue
-            color = self.hex_to_rgb(color_hex)
-            image_blob = self.create_sample_image_blob(color)
-            data = (self.marble_name, image_blob, None)
-            logging.debug(f"Testing process_marble with color: {color_hex} for dominant color")
-            result = process_marble(data, 'dominant')
-            logging.debug(f"Result from process_marble (dominant): {result}")
-            self.assertIsNotNone(result, "The result should not be None")
-            self.assertEqual(result[1], color_hex, f"The dominant color should be {color_hex}")
-            mock_update_marble_color.assert_called_with(self.marble_name, color_hex)
+            marble_id = STONE_COLORS.index(color_hex) + 1
+            logging.debug(f"Testing compute_marble_color with color: {color_hex} for dominant color")
+            result = compute_marble_color((marble_id, self.marble_name), 'dominant')
+            logging.debug(f"Result from compute_marble_color (dominant): {result}")
+            self.assertEqual(result, (color_hex, marble_id), f"The dominant color should be {color_hex}")
             self.log_color(color_hex)
 
-    @patch('imageColor.update_marble_color')
-    def test_process_marble_brightest(self, mock_update_marble_color):
+    @patch('utilities.imageColor.get_db_connection')
+    def test_compute_marble_color_brightest(self, mock_get_db_connection):
+        mock_get_db_connection.side_effect = lambda: sqlite3.connect(self.db_path)
         for color_hex in self.colors:
             if color_hex is None:
-                logging.error("Encountered None value in test_process_marble_brightest")
+                logging.error("Encountered None value in test_compute_marble_color_brightest")
                 continue
-            color = self.hex_to_rgb(color_hex)
-            image_blob = self.create_sample_image_blob(color)
-            data = (self.marble_name, image_blob, None)
-            logging.debug(f"Testing process_marble with color: {color_hex} for brightest color")
-            result = process_marble(data, 'brightest')
-            logging.debug(f"Result from process_marble (brightest): {result}")
-            self.assertIsNotNone(result, "The result should not be None")
-            self.assertEqual(result[1], color_hex, f"The brightest color should be {color_hex}")
-            mock_update_marble_color.assert_called_with(self.marble_name, color_hex)
+            marble_id = STONE_COLORS.index(color_hex) + 1
+            logging.debug(f"Testing compute_marble_color with color: {color_hex} for brightest color")
+            result = compute_marble_color((marble_id, self.marble_name), 'brightest')
+            logging.debug(f"Result from compute_marble_color (brightest): {result}")
+            self.assertEqual(result, (color_hex, marble_id), f"The brightest color should be {color_hex}")
             self.log_color(color_hex)
 
-    @patch('imageColor.get_db_connection')
-    def test_update_marble_color(self, mock_get_db_connection):
-        for color_hex in self.colors:
-            if color_hex is None:
-                logging.error("Encountered None value in test_update_marble_color")
-                continue
-            color = self.hex_to_rgb(color_hex)
-            mock_conn = MagicMock()
-            mock_cursor = MagicMock()
-            mock_get_db_connection.return_value = mock_conn
-            mock_conn.cursor.return_value = mock_cursor
-
-            logging.debug(f"Testing update_marble_color with color: {color_hex}")
-            update_marble_color(self.marble_name, color_hex)
-
-            mock_cursor.execute.assert_called_with(
-                "UPDATE images SET stoneColor = ? WHERE marbleName = ?", (color_hex, self.marble_name)
-            )
-            mock_conn.commit.assert_called()
+    def test_update_marble_colors(self):
+        # Written back reversed, so every row with a colour changes
+        colors = [(color_hex, marble_id) for marble_id, color_hex in enumerate(reversed(self.colors), 1) if color_hex is not None]
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+
+        logging.debug(f"Testing update_marble_colors with {len(colors)} colors")
+        update_marble_colors(conn, colors)
+
+        # Read back on another connection, so the update must have been committed
+        check = sqlite3.connect(self.db_path)
+        self.addCleanup(check.close)
+        stored = dict(check.execute("SELECT id, stoneColor FROM images").fetchall())
+        self.assertEqual({marble_id: stored[marble_id] for _, marble_id in colors}, {marble_id: color_hex for color_hex, marble_id in colors})
+        for color_hex, _ in colors:
             self.log_color(color_hex)
 
     def hex_to_rgb(self, hex_color):
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import sys
+import unittest
+
+# Same imports as the tests next to the backend modules, whichever directory the suite runs from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from catalog_fixtures import make_catalog
+from utilities.manage_vendors import import_vendors
+
+
+class TestImportVendors(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = make_catalog(sqlite3.connect(':memory:'), images=[
+            {'id': 1, 'marbleName': 'Calacatta Gold'}, {'id': 2, 'marbleName': 'Nero Marquina'},
+            {'id': 3, 'marbleName': 'Nero Marquina'},
+        ], vendors=[{'id': 7, 'name': 'Stone Works', 'location': 'Boston', 'contact': 'a@b.c'}])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_upserts_vendors_and_links_marbles_by_name(self):
+        stats = import_vendors(self.conn, [
+            {'name': 'Marble Co', 'location': 'Austin', 'marbles': ['calacatta gold', 'Unknown']},
+            {'name': 'stone works', 'location': 'Denver', 'marbles': 'Nero Marquina; Calacatta Gold'},
+            {'name': 'Marble Co', 'location': 'Austin', 'marbles': ['Calacatta Gold']},
+            {'name': '', 'location': 'Austin'},
+        ], batch_size=2)
+
+        self.assertEqual(self.conn.execute("SELECT id, name, location, contact FROM vendors ORDER BY id").fetchall(),
+                         [(7, 'Stone Works', 'Denver', 'a@b.c'), (8, 'Marble Co', 'Austin', None)])
+        self.assertEqual(self.conn.execute("SELECT marble_id, vendor_id FROM marble_vendor_association "
+                                           "ORDER BY vendor_id, marble_id").fetchall(),
+                         [(1, 7), (2, 7), (3, 7), (1, 8)])
+        self.assertEqual(stats['vendors added'], 1)
+        self.assertEqual(stats['associations added'], 4)
+        self.assertEqual(stats['conflicts: existing vendor updated'], 2)
+        self.assertEqual(stats['conflicts: association already present'], 1)
+        self.assertEqual(stats['conflicts: unknown marble name'], 1)
+        self.assertEqual(stats['rejected: missing name or location'], 1)
+
+    def test_rejects_records_of_the_wrong_type(self):
+        stats = import_vendors(self.conn, [
+            ['Marble Co', 'Austin'],
+            'Marble Co',
+            {'name': 42, 'location': 'Austin'},
+            {'name': 'Marble Co', 'location': ['Austin']},
+            {'name': 'Marble Co', 'location': 'Austin', 'marbles': ['Calacatta Gold', 7]},
+            {'name': 'Marble Co', 'location': 'Austin', 'marbles': {'name': 'Calacatta Gold'}},
+            {'name': 'Marble Co', 'location': 'Austin', 'marbles': ['Calacatta Gold']},
+        ])
+
+        self.assertEqual(stats['rows'], 7)
+        self.assertEqual(stats['rejected: not an object'], 2)
+        self.assertEqual(stats['rejected: name is not text'], 1)
+        self.assertEqual(stats['rejected: location is not text'], 1)
+        self.assertEqual(stats['rejected: marbles is not a list of names'], 2)
+        self.assertEqual(stats['vendors added'], 1)
+        self.assertEqual(stats['associations added'], 1)
+
+    def test_failed_import_writes_nothing(self):
+        def records():
+            yield {'name': 'Marble Co', 'location': 'Austin', 'marbles': ['Calacatta Gold']}
+            raise ValueError("bad line")
+
+        with self.assertRaises(ValueError):
+            import_vendors(self.conn, records())
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM vendors").fetchone()[0], 1)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM marble_vendor_association").fetchone()[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -116,7 +116,8 @@ EOF
     echo "3. Create a new virtual environment: python3 -m venv backend-env"
     echo "4. Activate the environment: source backend-env/bin/activate"
     echo "5. Install the required packages: pip install -r requirements.txt"
-    echo "6. Deactivate the environment when done: deactivate"
+    echo "6. Apply schema migrations to the catalog: python migrate.py"
+    echo "7. Deactivate the environment when done: deactivate"
     echo
 }
 
@@ -134,6 +135,19 @@ start_wsgi_service() {
         source $DEPLOY_DIR/.env
         set +a
 
+        # Workers share marble_gallery.log and reopen it after rotation, so logrotate does the rolling
+        cat << EOT | sudo tee /etc/logrotate.d/marble-gallery
+$DEPLOY_DIR/backend/marble_gallery.log {
+    daily
+    rotate 10
+    missingok
+    notifempty
+}
+EOT
+
+        # Bring the catalog schema up to date; the server refuses to start on an old one
+        backend-env/bin/python migrate.py --no-vacuum
+
         # Check if systemd is available
         if command -v systemctl &> /dev/null; then
             # Create a systemd service file
@@ -146,6 +160,7 @@ After=network.target
 User=root
 WorkingDirectory=$DEPLOY_DIR/backend
 EnvironmentFile=$DEPLOY_DIR/.env
+ExecStartPre=$DEPLOY_DIR/backend/backend-env/bin/python migrate.py --no-vacuum
 ExecStart=$DEPLOY_DIR/backend/backend-env/bin/gunicorn --workers=4 --bind=0.0.0.0:8000 wsgi:app
 Restart=always
 
@@ -271,6 +286,11 @@ deploy_changes() {
             fi
         done
 
+        # Apply any new schema migrations before the workers are restarted
+        if [ -x backend/backend-env/bin/python ]; then
+            (cd backend && backend-env/bin/python migrate.py --no-vacuum)
+        fi
+
         rm /tmp/$REMOTE_ZIP
 EOF
     processed_files=$((processed_files + total_files))
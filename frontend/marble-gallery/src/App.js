@@ -21,6 +21,8 @@ function App() {
   const [searchTerm, setSearchTerm] = useState('');
   const [isMenuOpen, setIsMenuOpen] = useState(false);
   const [isSearching, setIsSearching] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
+  const [pendingSearch, setPendingSearch] = useState(false);
 
   const fetchMarbles = useCallback(async (resetMarbles = false) => {
     if (loading || (!hasMore && !resetMarbles)) return;
@@ -28,7 +30,7 @@ function App() {
     if (resetMarbles) setIsSearching(true);
     try {
       const response = await axios.get('/api/images', {
-        params: { page: resetMarbles ? 1 : page, per_page: 20, search: searchTerm }
+        params: { page: resetMarbles ? 1 : page, per_page: 20, search: searchTerm, view: 'card' }
       });
       setMarbles(prevMarbles => {
         if (resetMarbles) {
@@ -50,16 +52,48 @@ function App() {
     fetchMarbles();
   }, []);
 
+  // /api/suggest answers from an in-memory index, so a short debounce is enough to keep requests down
+  const fetchSuggestions = useRef(debounce(async (query) => {
+    if (!query.trim()) {
+      setSuggestions([]);
+      return;
+    }
+    try {
+      const response = await axios.get('/api/suggest', { params: { q: query } });
+      setSuggestions(response.data.suggestions);
+    } catch (error) {
+      console.error('Error fetching suggestions:', error);
+    }
+  }, 100)).current;
+
+  useEffect(() => () => fetchSuggestions.cancel(), [fetchSuggestions]);
+
   const handleSearchChange = (event) => {
     setSearchTerm(event.target.value);
+    fetchSuggestions(event.target.value);
   };
   
   const handleSearchClick = () => {
+    fetchSuggestions.cancel();
+    setSuggestions([]);
     setPage(1);
     setHasMore(true);
     fetchMarbles(true);
   };
 
+  const handleSuggestionClick = (suggestion) => {
+    setSearchTerm(suggestion.text);
+    setPendingSearch(true);
+  };
+
+  // Search once the picked suggestion is in searchTerm, which fetchMarbles reads
+  useEffect(() => {
+    if (pendingSearch) {
+      setPendingSearch(false);
+      handleSearchClick();
+    }
+  }, [pendingSearch]);
+
   const loadMore = useCallback(() => {
     fetchMarbles();
   }, [fetchMarbles]);
@@ -124,13 +158,15 @@ function App() {
             
                            {/* Search bar */}
               <div className="fixed top-20 left-0 right-0 z-30 px-4">              
-                <div className="container mx-auto">
+                <div className="container mx-auto relative">
                 <div className="flex bg-white bg-opacity-50 backdrop-filter backdrop-blur-md rounded-lg shadow-md">
                   <input
                     type="text"
                     placeholder="Search marbles..."
                     value={searchTerm}
                     onChange={handleSearchChange}
+                    onKeyDown={(event) => event.key === 'Enter' && handleSearchClick()}
+                    onBlur={() => setSuggestions([])}
                     className="w-full px-4 py-2 rounded-l-lg bg-transparent border-none focus:outline-none focus:ring-2 focus:ring-blue-500"
                   />
                   <button
@@ -145,6 +181,21 @@ function App() {
                     )}
                   </button>
                 </div>
+                {suggestions.length > 0 && (
+                  <ul className="absolute left-0 right-0 mt-1 bg-white bg-opacity-90 backdrop-filter backdrop-blur-md rounded-lg shadow-lg overflow-hidden">
+                    {suggestions.map((suggestion) => (
+                      <li
+                        key={`${suggestion.kind}-${suggestion.text}`}
+                        // mousedown fires before the input's blur clears the list
+                        onMouseDown={(event) => { event.preventDefault(); handleSuggestionClick(suggestion); }}
+                        className="flex justify-between px-4 py-2 cursor-pointer hover:bg-pink-100"
+                      >
+                        <span>{suggestion.text}</span>
+                        <span className="text-xs text-gray-500">{suggestion.kind}</span>
+                      </li>
+                    ))}
+                  </ul>
+                )}
               </div>
             </div>
             
@@ -1,4 +1,5 @@
 import React, { createContext, useContext, useState, useCallback, useEffect } from 'react';
+import axios from 'axios';
 
 const MarbleGalleryContext = createContext();
 
@@ -21,6 +22,14 @@ export const MarbleGalleryProvider = ({ children }) => {
   const openMarbleModal = useCallback((marble) => {
     console.log('Opening modal for marble:', marble);
     setSelectedMarble(marble);
+    // Gallery cards only carry id, name and origin; fetch the rest of the record when the modal opens
+    if (marble.description === undefined) {
+      axios.get(`/api/marble/${marble.id}`)
+        .then(response => {
+          setSelectedMarble(current => (current && current.id === marble.id ? { ...current, ...response.data } : current));
+        })
+        .catch(error => console.error('Error fetching marble details:', error));
+    }
   }, []);
 
   const closeMarbleModal = useCallback(() => {